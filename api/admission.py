@@ -0,0 +1,274 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from metrics import ADMISSION_WAIT_SECONDS, ADMISSION_SHED
+
+logger = logging.getLogger(__name__)
+
+# Model calls (analyses, comparisons, batch jobs) allowed to run at once in this
+# process; keep it at or below gunicorn's --threads so queued requests don't
+# also wait for a thread (the async server in asgi.py has no such limit)
+ADMISSION_MAX_CONCURRENCY = int(os.environ.get("ADMISSION_MAX_CONCURRENCY", 6))
+# Service time assumed for a class until its first call finishes
+ADMISSION_INITIAL_SERVICE_SECONDS = float(os.environ.get("ADMISSION_INITIAL_SERVICE_SECONDS", 20))
+# Weight of the newest sample in the service time moving average
+SERVICE_TIME_SMOOTHING = 0.2
+
+
+class LoadShed(RuntimeError):
+    """Raised instead of queueing work that could not finish before its deadline."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _class_setting(name, setting, default):
+    return type(default)(os.environ.get(f"ADMISSION_{name.upper()}_{setting}", default))
+
+
+class WorkClass:
+    """
+    One kind of model work with its own limits.
+
+    Attributes:
+        priority: Lower runs first when several classes are waiting for a slot
+        max_concurrency: Most calls of this class running at once
+        max_queue: Most calls of this class waiting at once
+        deadline_seconds: Time a call has for queueing plus running; calls
+            expected to overrun it are shed
+    """
+
+    def __init__(self, name, priority, max_concurrency, max_queue, deadline_seconds):
+        self.name = name
+        self.priority = priority
+        self.max_concurrency = _class_setting(name, "MAX_CONCURRENCY", max_concurrency)
+        self.max_queue = _class_setting(name, "MAX_QUEUE", max_queue)
+        self.deadline_seconds = _class_setting(name, "DEADLINE_SECONDS", float(deadline_seconds))
+        self.service_seconds = ADMISSION_INITIAL_SERVICE_SECONDS
+        self.running = 0
+        self.waiting = deque()
+        self.admitted = 0
+        self.shed = 0
+
+
+class _Waiter:
+    """A thread queued for a slot."""
+
+    def __init__(self):
+        self.granted = threading.Event()
+
+    @property
+    def is_granted(self):
+        return self.granted.is_set()
+
+    def grant(self):
+        self.granted.set()
+
+
+class _AsyncWaiter:
+    """A coroutine queued for a slot; granted from whichever thread frees one."""
+
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+        self.granted = self.loop.create_future()
+        self.is_granted = False
+
+    def grant(self):
+        self.is_granted = True
+        self.loop.call_soon_threadsafe(self._wake)
+
+    def _wake(self):
+        if not self.granted.done():
+            self.granted.set_result(None)
+
+
+class AdmissionController:
+    """
+    Bounded, prioritized admission for model work.
+
+    A fixed number of slots is shared by all classes. A call runs immediately
+    when a slot is free, its class is under its own limit and nothing of equal
+    or higher priority is waiting; otherwise it queues. Freed slots go to the
+    highest-priority class with waiters. Before queueing, the wait is estimated
+    from the queue ahead and each class's recent service time; calls that would
+    miss their deadline, or find their queue full, are shed straight away with a
+    Retry-After hint rather than timing out later.
+    """
+
+    def __init__(self, max_concurrency=None, classes=None):
+        self.max_concurrency = max_concurrency or ADMISSION_MAX_CONCURRENCY
+        if classes is None:
+            classes = [
+                WorkClass("analyze", 0, max_concurrency=4, max_queue=16, deadline_seconds=110),
+                WorkClass("compare", 1, max_concurrency=4, max_queue=16, deadline_seconds=110),
+                WorkClass("batch", 2, max_concurrency=2, max_queue=64, deadline_seconds=900),
+            ]
+        self.classes = {work_class.name: work_class for work_class in classes}
+        self._by_priority = sorted(classes, key=lambda work_class: work_class.priority)
+        self._running = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def slot(self, name):
+        """
+        Holds a slot of work class `name` for the duration of the with block.
+
+        Raises:
+            LoadShed: If the call can't be started in time
+        """
+        work_class = self.classes[name]
+        self._acquire(work_class)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(work_class, time.monotonic() - start)
+
+    @asynccontextmanager
+    async def aslot(self, name):
+        """Async version of slot(): waits for the slot without blocking the event loop."""
+        work_class = self.classes[name]
+        await self._aacquire(work_class)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(work_class, time.monotonic() - start)
+
+    def check(self, name):
+        """Sheds now if a call of class `name` arriving at this moment would be shed; takes no slot."""
+        work_class = self.classes[name]
+        with self._lock:
+            if self._can_start(work_class):
+                return
+            self._shed_if_late(work_class)
+
+    def _acquire(self, work_class):
+        enqueued_at = time.monotonic()
+        waiter = _Waiter()
+        if self._enqueue(work_class, waiter) and not waiter.granted.wait(self._start_by(work_class)):
+            self._give_up(work_class, waiter)
+        ADMISSION_WAIT_SECONDS.observe(time.monotonic() - enqueued_at, work_class=work_class.name)
+
+    async def _aacquire(self, work_class):
+        enqueued_at = time.monotonic()
+        waiter = _AsyncWaiter()
+        if self._enqueue(work_class, waiter):
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.granted), self._start_by(work_class))
+            except asyncio.TimeoutError:
+                self._give_up(work_class, waiter)
+            except asyncio.CancelledError:
+                # The client went away while queued; hand on a slot granted in the meantime
+                with self._lock:
+                    if waiter.is_granted:
+                        self._free(work_class)
+                    else:
+                        work_class.waiting.remove(waiter)
+                raise
+        ADMISSION_WAIT_SECONDS.observe(time.monotonic() - enqueued_at, work_class=work_class.name)
+
+    def _enqueue(self, work_class, waiter):
+        """Starts a call of work_class now (returns False) or queues waiter for a slot (returns True)."""
+        with self._lock:
+            if self._can_start(work_class):
+                self._start(work_class)
+                return False
+            self._shed_if_late(work_class)
+            work_class.waiting.append(waiter)
+            return True
+
+    @staticmethod
+    def _start_by(work_class):
+        # Give up once starting any later couldn't finish before the deadline
+        return max(0.0, work_class.deadline_seconds - work_class.service_seconds)
+
+    def _give_up(self, work_class, waiter):
+        """Sheds a queued call whose wait ran out, unless a slot was granted at the last moment."""
+        with self._lock:
+            if not waiter.is_granted:
+                work_class.waiting.remove(waiter)
+                self._shed(work_class, "deadline", work_class.service_seconds)
+
+    def _release(self, work_class, service_seconds):
+        with self._lock:
+            work_class.service_seconds += SERVICE_TIME_SMOOTHING * (service_seconds - work_class.service_seconds)
+            self._free(work_class)
+
+    def _free(self, work_class):
+        work_class.running -= 1
+        self._running -= 1
+        self._dispatch()
+
+    def _can_start(self, work_class):
+        if self._running >= self.max_concurrency or work_class.running >= work_class.max_concurrency:
+            return False
+        return not any(other.waiting for other in self._by_priority if other.priority <= work_class.priority)
+
+    def _start(self, work_class):
+        work_class.running += 1
+        work_class.admitted += 1
+        self._running += 1
+
+    def _dispatch(self):
+        while self._running < self.max_concurrency:
+            for work_class in self._by_priority:
+                if work_class.waiting and work_class.running < work_class.max_concurrency:
+                    self._start(work_class)
+                    work_class.waiting.popleft().grant()
+                    break
+            else:
+                return
+
+    def _estimated_wait(self, work_class):
+        """Seconds until a call of work_class joining the queue now would start."""
+        ahead = sum(len(other.waiting) for other in self._by_priority if other.priority <= work_class.priority)
+        capacity = max(1, min(self.max_concurrency, work_class.max_concurrency))
+        # Each "round" of `capacity` calls ahead takes about one service time
+        return (ahead // capacity + 1) * work_class.service_seconds
+
+    def _shed_if_late(self, work_class):
+        if len(work_class.waiting) >= work_class.max_queue:
+            self._shed(work_class, "queue_full", self._estimated_wait(work_class))
+        wait = self._estimated_wait(work_class)
+        if wait + work_class.service_seconds > work_class.deadline_seconds:
+            self._shed(work_class, "deadline", wait)
+
+    def _shed(self, work_class, reason, retry_after):
+        work_class.shed += 1
+        ADMISSION_SHED.inc(work_class=work_class.name, reason=reason)
+        logger.warning(
+            f"Shedding {work_class.name} call ({reason}): {len(work_class.waiting)} queued, "
+            f"{work_class.running} running, ~{work_class.service_seconds:.1f}s per call"
+        )
+        raise LoadShed(f"Server is busy ({reason.replace('_', ' ')}); try again shortly", max(1.0, retry_after))
+
+    def stats(self):
+        """Per-class queue depth, running calls, estimated wait and counters, for /queue-stats and autoscaling."""
+        with self._lock:
+            return {
+                "max_concurrency": self.max_concurrency,
+                "running": self._running,
+                "classes": {
+                    name: {
+                        "priority": work_class.priority,
+                        "running": work_class.running,
+                        "queued": len(work_class.waiting),
+                        "max_concurrency": work_class.max_concurrency,
+                        "max_queue": work_class.max_queue,
+                        "deadline_seconds": work_class.deadline_seconds,
+                        "service_seconds": round(work_class.service_seconds, 3),
+                        "estimated_wait_seconds": round(
+                            0.0 if self._can_start(work_class) else self._estimated_wait(work_class), 3
+                        ),
+                        "admitted": work_class.admitted,
+                        "shed": work_class.shed,
+                    }
+                    for name, work_class in self.classes.items()
+                },
+            }
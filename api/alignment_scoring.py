@@ -0,0 +1,417 @@
+import os
+import logging
+import warnings
+import threading
+from collections import OrderedDict
+import numpy as np
+from wav_io import decode_wav
+from result_cache import sha256_hex
+from pitch_engine import find_yodel_breaks, hz_to_midi, segment_notes, track_pitch
+
+logger = logging.getLogger(__name__)
+
+# Contours are pooled to this hop before alignment; 50 ms keeps a minute of audio
+# at 1200 frames while still resolving individual syllables
+ALIGN_HOP_SECONDS = float(os.environ.get("ALIGN_HOP_SECONDS", 0.05))
+# Sakoe-Chiba band: how far the user may drift ahead of or behind the reference
+ALIGN_BAND_SECONDS = float(os.environ.get("ALIGN_BAND_SECONDS", 3.0))
+
+# Alignment cost, in semitones, of a voiced frame against an unvoiced one; pitch
+# differences are capped so one wrong note can't pull the whole path aside
+UNVOICED_COST = 2.0
+MAX_PITCH_COST = 6.0
+
+# A reference note counts as sung when the user's aligned pitch is this close
+SYLLABLE_MATCH_SEMITONES = 1.0
+# A reference yodel break counts as matched by a user break this close to its aligned time
+BREAK_MATCH_SECONDS = 0.25
+
+# Reference contours kept in memory, by audio sha256. There are only a few
+# references and every compare against one reuses its contour; user takes
+# almost never repeat, so they aren't kept
+REFERENCE_CONTOUR_CACHE_SIZE = int(os.environ.get("REFERENCE_CONTOUR_CACHE_SIZE", 16))
+
+SCORING_SIGNATURE = (
+    f"dtw:{ALIGN_HOP_SECONDS}:{ALIGN_BAND_SECONDS}:{UNVOICED_COST}:{MAX_PITCH_COST}:"
+    f"{SYLLABLE_MATCH_SEMITONES}:{BREAK_MATCH_SECONDS}"
+)
+
+
+class Contour:
+    """
+    A take's pitch contour at ALIGN_HOP_SECONDS resolution, plus its note
+    segments and yodel breaks found at full resolution.
+    """
+
+    def __init__(self, times, f0):
+        self.segments = segment_notes(times, f0)
+        self.breaks = find_yodel_breaks(self.segments)
+
+        hop = times[1] - times[0] if len(times) > 1 else ALIGN_HOP_SECONDS
+        factor = max(1, int(round(ALIGN_HOP_SECONDS / hop)))
+        midi = hz_to_midi(f0)
+        usable = len(midi) - len(midi) % factor
+        pooled = midi[:usable].reshape(-1, factor) if usable else np.full((1, 1), np.nan)
+        with warnings.catch_warnings():
+            # Frames with no voiced samples are expected and stay NaN
+            warnings.simplefilter("ignore", RuntimeWarning)
+            median = np.nanmedian(pooled, axis=1)
+        # A pooled frame is voiced when most of its frames are
+        self.midi = np.where(np.mean(~np.isnan(pooled), axis=1) >= 0.5, median, np.nan)
+        self.hop = hop * factor
+        self.start = (times[0] if len(times) else 0.0) - hop / 2
+
+    def frame(self, seconds):
+        return int(np.clip((seconds - self.start) / self.hop, 0, len(self.midi) - 1))
+
+    def seconds(self, frame):
+        return self.start + (frame + 0.5) * self.hop
+
+
+def wav_contour(wav_data):
+    """
+    Pitch contour of WAV bytes.
+
+    Raises:
+        WavFormatError: If the audio is not a decodable WAV file
+    """
+    samples, sample_rate = decode_wav(wav_data)
+    times, f0, _ = track_pitch(samples, sample_rate)
+    return Contour(times, f0)
+
+
+_reference_contours = OrderedDict()
+_reference_contours_lock = threading.Lock()
+
+
+def reference_contour(wav_data, sha256=None):
+    """
+    Pitch contour of a reference take, memoized by its sha256 (computed when
+    not given) so a reference used by many compares is only tracked once.
+
+    Raises:
+        WavFormatError: If the audio is not a decodable WAV file
+    """
+    key = sha256 or sha256_hex(wav_data)
+    with _reference_contours_lock:
+        contour = _reference_contours.get(key)
+        if contour is not None:
+            _reference_contours.move_to_end(key)
+            return contour
+
+    contour = wav_contour(wav_data)
+    with _reference_contours_lock:
+        _reference_contours[key] = contour
+        while len(_reference_contours) > REFERENCE_CONTOUR_CACHE_SIZE:
+            _reference_contours.popitem(last=False)
+    return contour
+
+
+def frame_costs(reference, user):
+    """Alignment cost of one reference frame against a run of user frames, both in MIDI (NaN when unvoiced)."""
+    reference_voiced = not np.isnan(reference)
+    user_voiced = ~np.isnan(user)
+    if not reference_voiced:
+        return np.where(user_voiced, UNVOICED_COST, 0.0)
+    return np.where(user_voiced, np.minimum(np.abs(np.nan_to_num(user) - reference), MAX_PITCH_COST), UNVOICED_COST)
+
+
+def banded_dtw(reference, user, radius):
+    """
+    Dynamic time warping of two pitch sequences restricted to a band of
+    +-radius frames around the diagonal, so memory and time are O((N+M) * radius)
+    rather than O(N * M).
+
+    Each row is filled with vectorized operations: the vertical and diagonal
+    steps come from the previous row, and the horizontal step within a row is
+    a running minimum over the row's cumulative cost.
+
+    Returns:
+        (reference_frames, user_frames) index arrays of the optimal path from
+        (0, 0) to (N-1, M-1)
+    """
+    n, m = len(reference), len(user)
+    slope = (m - 1) / max(n - 1, 1)
+    # Rows must overlap for the path to be able to continue
+    radius = max(int(radius), int(np.ceil(slope)) + 1)
+    centers = np.arange(n) * slope
+    lows = np.clip(np.floor(centers - radius).astype(int), 0, m - 1)
+    highs = np.clip(np.ceil(centers + radius).astype(int) + 1, 1, m)
+    lows[0], highs[-1] = 0, m
+
+    width = int((highs - lows).max())
+    cumulative = np.full((n, width), np.inf)
+    for i in range(n):
+        low, high = lows[i], highs[i]
+        costs = frame_costs(reference[i], user[low:high])
+        arrival = np.full(high - low, np.inf)
+        if i == 0:
+            arrival[0] = costs[0]
+        else:
+            previous_low, previous = lows[i - 1], cumulative[i - 1]
+            columns = np.arange(low, high)
+            up = _band_lookup(previous, columns - previous_low, highs[i - 1] - previous_low)
+            diagonal = _band_lookup(previous, columns - 1 - previous_low, highs[i - 1] - previous_low)
+            arrival = costs + np.minimum(up, diagonal)
+        running = np.cumsum(costs)
+        cumulative[i, :high - low] = running + np.minimum.accumulate(arrival - running)
+
+    # Walk back from the end, always to the cheapest predecessor
+    i, j = n - 1, m - 1
+    path = [(i, j)]
+    while i > 0 or j > 0:
+        candidates = []
+        if i > 0 and j > 0:
+            candidates.append((_cell(cumulative, lows, highs, i - 1, j - 1), i - 1, j - 1))
+        if i > 0:
+            candidates.append((_cell(cumulative, lows, highs, i - 1, j), i - 1, j))
+        if j > 0:
+            candidates.append((_cell(cumulative, lows, highs, i, j - 1), i, j - 1))
+        _, i, j = min(candidates)
+        path.append((i, j))
+    path.reverse()
+    frames = np.array(path)
+    return frames[:, 0], frames[:, 1]
+
+
+def _band_lookup(row, offsets, row_width):
+    valid = (offsets >= 0) & (offsets < row_width)
+    return np.where(valid, row[np.clip(offsets, 0, row.shape[0] - 1)], np.inf)
+
+
+def _cell(cumulative, lows, highs, i, j):
+    if lows[i] <= j < highs[i]:
+        return cumulative[i, j - lows[i]]
+    return np.inf
+
+
+def score_comparison(original_wav_data, user_wav_data, original_sha256=None):
+    """
+    Scores a user's take against the reference by aligning their pitch contours.
+
+    Octave displacement is factored out first, so singing the reference an
+    octave up or down isn't counted as wrong notes. Along the aligned path:
+
+    - pitchAccuracy: mean cents error where both takes are voiced
+    - timingAccuracy: how far each reference note onset lands from where the
+      user's overall lag and tempo would put it
+    - yodelBreakQuality: share of the reference's yodel breaks the user also
+      makes near the aligned time
+    - syllableAccuracy: reference notes the user sings within a semitone
+    - rhythmConsistency: variation of the user's tempo between reference onsets
+
+    original_sha256, when known, keys the cached reference contour.
+
+    Returns:
+        A dict of metric objects in the yodel_comparison_schema shape, without descriptions
+
+    Raises:
+        WavFormatError: If either take is not a decodable WAV file
+    """
+    reference = reference_contour(original_wav_data, original_sha256)
+    user = wav_contour(user_wav_data)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        octave_shift = 12.0 * np.round((np.nanmedian(user.midi) - np.nanmedian(reference.midi)) / 12.0)
+    user_midi = user.midi - (0.0 if np.isnan(octave_shift) else octave_shift)
+
+    reference_frames, user_frames = banded_dtw(reference.midi, user_midi, ALIGN_BAND_SECONDS / reference.hop)
+    aligned_reference = reference.midi[reference_frames]
+    aligned_user = user_midi[user_frames]
+
+    def onset_match(frame):
+        """
+        The user frame where a reference onset lands: the first voiced frame
+        aligned with it, so neither a late start (silence aligned first) nor a
+        longer-held previous note moves it.
+        """
+        first = np.searchsorted(reference_frames, frame, side="left")
+        last = np.searchsorted(reference_frames, frame, side="right")
+        voiced = np.flatnonzero(~np.isnan(aligned_user[first:last]))
+        return user_frames[first + (voiced[0] if len(voiced) else 0)]
+
+    both_voiced = ~np.isnan(aligned_reference) & ~np.isnan(aligned_user)
+    cents = float(np.mean(np.abs(aligned_reference - aligned_user)[both_voiced]) * 100) if both_voiced.any() else 1200.0
+
+    onsets = np.array([reference.frame(segment["start"]) for segment in reference.segments], dtype=int)
+    mapped_seconds = np.array([user.seconds(onset_match(frame)) for frame in onsets])
+    # Snap to the user's own note onsets, found at full resolution, where one is within reach
+    user_onsets = np.array([segment["start"] for segment in user.segments])
+    if len(user_onsets) and len(onsets):
+        nearest = user_onsets[np.abs(user_onsets[None, :] - mapped_seconds[:, None]).argmin(axis=1)]
+        mapped_seconds = np.where(np.abs(nearest - mapped_seconds) <= user.hop, nearest, mapped_seconds)
+    onset_seconds = np.array([segment["start"] for segment in reference.segments])
+    if len(onsets) >= 2:
+        # Deviation from the user's own overall lag and tempo, so singing the
+        # whole piece a little slower isn't counted against every note
+        tempo, lag = np.polyfit(onset_seconds, mapped_seconds, 1)
+        timing_ms = float(np.mean(np.abs(mapped_seconds - (tempo * onset_seconds + lag))) * 1000)
+    else:
+        timing_ms = 0.0
+
+    user_break_times = np.array([segment["start"] for segment in user.breaks])
+    matched_breaks = 0
+    for segment in reference.breaks:
+        expected = user.seconds(onset_match(reference.frame(segment["start"])))
+        if len(user_break_times) and np.min(np.abs(user_break_times - expected)) <= BREAK_MATCH_SECONDS:
+            matched_breaks += 1
+    if reference.breaks:
+        break_score = 100.0 * matched_breaks / len(reference.breaks)
+    else:
+        # Nothing to match; breaks the reference doesn't have are mistakes
+        break_score = max(0.0, 100.0 - 20.0 * len(user.breaks))
+
+    matched_syllables = 0
+    for segment in reference.segments:
+        # Path steps covering the note; the path is sorted by reference frame
+        first = np.searchsorted(reference_frames, reference.frame(segment["start"]), side="left")
+        last = np.searchsorted(reference_frames, reference.frame(segment["end"]), side="right")
+        sung = aligned_user[first:last]
+        sung = sung[~np.isnan(sung)]
+        if len(sung) and abs(np.median(sung) - segment["midi"]) <= SYLLABLE_MATCH_SEMITONES:
+            matched_syllables += 1
+    total_syllables = len(reference.segments)
+
+    tempo_variation = 0.0
+    if len(onsets) >= 3:
+        reference_intervals = np.diff(onset_seconds)
+        user_intervals = np.diff(mapped_seconds)
+        usable = reference_intervals > 0
+        if usable.any():
+            ratios = user_intervals[usable] / reference_intervals[usable]
+            # Relative to the user's average tempo, which timingAccuracy already allows for
+            tempo_variation = float(np.std(ratios) / max(np.mean(ratios), 1e-6))
+
+    return {
+        "pitchAccuracy": {
+            "score": _score(100.0 - cents / 2.0),
+            "averageDeviationCents": round(cents, 1),
+        },
+        "timingAccuracy": {
+            "score": _score(100.0 - timing_ms / 5.0),
+            "averageDeviationMs": round(timing_ms, 1),
+        },
+        "yodelBreakQuality": {
+            "score": _score(break_score),
+            "smoothnessRating": smoothness_rating(break_score),
+        },
+        "syllableAccuracy": {
+            "score": _score(100.0 * matched_syllables / total_syllables if total_syllables else 0.0),
+            "matchedSyllables": matched_syllables,
+            "totalSyllables": total_syllables,
+        },
+        "rhythmConsistency": {
+            "score": _score(100.0 - tempo_variation * 200.0),
+            "tempoVariation": round(tempo_variation, 3),
+        },
+    }
+
+
+def smoothness_rating(score):
+    if score >= 85:
+        return "excellent"
+    if score >= 65:
+        return "good"
+    if score >= 40:
+        return "fair"
+    return "poor"
+
+
+def _score(value):
+    return round(float(np.clip(value, 0.0, 100.0)), 1)
+
+
+# Metrics measured well enough from pitch alone to replace the model's own scores
+MEASURED_METRICS = ("pitchAccuracy", "timingAccuracy", "yodelBreakQuality")
+
+METRIC_LABELS = {
+    "pitchAccuracy": "Pitch accuracy",
+    "timingAccuracy": "Timing",
+    "yodelBreakQuality": "Yodel breaks",
+    "syllableAccuracy": "Note coverage",
+    "rhythmConsistency": "Rhythm",
+}
+
+METRIC_SUGGESTIONS = {
+    "pitchAccuracy": "Sing along with the reference slowly, holding each note until it sits in tune before moving on.",
+    "timingAccuracy": "Tap the beat while listening to the reference, then start each phrase exactly on its cue.",
+    "yodelBreakQuality": "Practice the flip between chest and head voice on a single vowel pair (o-i) until it happens on demand.",
+    "syllableAccuracy": "Learn the melody phrase by phrase so no notes of the reference are skipped.",
+    "rhythmConsistency": "Practice with a metronome at a slower tempo and keep the pulse steady through every phrase.",
+}
+
+
+def describe_metrics(metrics):
+    """Adds a one-line description to each metric object; returns metrics."""
+    if "pitchAccuracy" in metrics:
+        metrics["pitchAccuracy"]["description"] = (
+            f"Pitches were {metrics['pitchAccuracy']['averageDeviationCents']:.0f} cents from the reference on average."
+        )
+    if "timingAccuracy" in metrics:
+        metrics["timingAccuracy"]["description"] = (
+            f"Note onsets were {metrics['timingAccuracy']['averageDeviationMs']:.0f} ms early or late on average."
+        )
+    if "yodelBreakQuality" in metrics:
+        metrics["yodelBreakQuality"]["description"] = (
+            f"{metrics['yodelBreakQuality']['score']:.0f}% of the reference's register flips were matched "
+            f"({metrics['yodelBreakQuality']['smoothnessRating']})."
+        )
+    if "syllableAccuracy" in metrics:
+        syllables = metrics["syllableAccuracy"]
+        syllables["description"] = (
+            f"{syllables['matchedSyllables']} of {syllables['totalSyllables']} reference notes were sung within a semitone."
+        )
+    if "rhythmConsistency" in metrics:
+        metrics["rhythmConsistency"]["description"] = (
+            f"Tempo varied by {metrics['rhythmConsistency']['tempoVariation'] * 100:.0f}% against the reference."
+        )
+    return metrics
+
+
+def build_comparison(metrics):
+    """
+    Turns measured metrics into a complete yodelComparison, with feedback
+    written from templates instead of by the model.
+    """
+    describe_metrics(metrics)
+    scores = {name: metric["score"] for name, metric in metrics.items()}
+    overall = round(sum(scores.values()) / len(scores), 1)
+
+    strengths = [f"{METRIC_LABELS[name]}: {metrics[name]['description']}" for name, score in scores.items() if score >= 75]
+    weak = sorted((score, name) for name, score in scores.items() if score < 70)
+    areas = [
+        {
+            "area": METRIC_LABELS[name],
+            "suggestion": METRIC_SUGGESTIONS[name],
+            "priority": "high" if score < 40 else "medium" if score < 55 else "low",
+        }
+        for score, name in weak
+    ]
+    if weak:
+        overall_feedback = f"Score {overall:.0f}/100. Focus next on {METRIC_LABELS[weak[0][1]].lower()}."
+    else:
+        overall_feedback = f"Score {overall:.0f}/100. A close match to the reference - keep it up!"
+
+    return {
+        "yodelComparison": {
+            "overallScore": overall,
+            "metrics": metrics,
+            "feedback": {
+                "strengths": strengths,
+                "areasForImprovement": areas,
+                "practiceRecommendations": [METRIC_SUGGESTIONS[name] for _, name in weak[:3]],
+                "overallFeedback": overall_feedback,
+            },
+        }
+    }
+
+
+def apply_measured_metrics(metric_name, metric, measured):
+    """
+    Overwrites the numbers in one of the model's metric objects with the
+    measured ones, keeping the model's description; returns the metric.
+    """
+    if metric_name in MEASURED_METRICS and isinstance(metric, dict):
+        metric.update(measured[metric_name])
+    return metric
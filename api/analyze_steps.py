@@ -1,45 +1,168 @@
 import os
-import base64
+import sys
 import json
+import time
+import hashlib
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from api import generate_gemini_response
+from reference_registry import MANIFEST_FILENAME, analysis_filename
 
-def analyze_wav_files():
+
+def write_json_atomic(path, data, indent=4):
     """
-    Analyzes all WAV files in the 'steps' directory by calling the Gemini API directly.
+    Writes data as JSON to path via a temp file and rename, so readers (like the
+    frontend serving steps/) never see a partially written file.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp_", suffix=".json")
+    try:
+        with os.fdopen(fd, "w") as tmp_file:
+            json.dump(data, tmp_file, indent=indent)
+            tmp_file.flush()
+            os.fsync(tmp_file.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def load_manifest(steps_dir):
+    manifest_path = os.path.join(steps_dir, MANIFEST_FILENAME)
+    if not os.path.exists(manifest_path):
+        return {}
+    try:
+        with open(manifest_path) as manifest_file:
+            return json.load(manifest_file)
+    except json.JSONDecodeError:
+        print(f"Ignoring unreadable manifest: {manifest_path}")
+        return {}
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def analyze_file(input_path, output_path, retries, backoff_seconds):
+    """
+    Analyzes one WAV file, retrying failed calls with exponential backoff.
+
+    Returns:
+        The number of attempts it took
     """
-    steps_dir = "steps"
+    with open(input_path, "rb") as wav_file:
+        wav_data = wav_file.read()
+
+    for attempt in range(1, retries + 2):
+        try:
+            # Call the Gemini API function directly. Compares use these analyses as
+            # the reference, so they always come from the quality tier
+            gemini_response = generate_gemini_response(wav_data, quality="high")
+
+            # Parse the JSON response
+            analysis_result = json.loads(gemini_response)
+
+            write_json_atomic(output_path, analysis_result)
+            return attempt
+        except Exception as e:
+            if attempt > retries:
+                raise
+            delay = backoff_seconds * (2 ** (attempt - 1))
+            print(f"Attempt {attempt} failed for {os.path.basename(input_path)}: {e} - retrying in {delay:.1f}s")
+            time.sleep(delay)
 
+
+def analyze_wav_files(steps_dir="steps", workers=4, retries=2, force=False, backoff_seconds=2.0):
+    """
+    Analyzes all WAV files in the 'steps' directory by calling the Gemini API directly.
+
+    Files are processed on a bounded worker pool. A manifest of input hashes is
+    kept next to the outputs and updated after every file, so unchanged files are
+    skipped and an interrupted run resumes where it stopped.
+
+    Returns:
+        True if every file is up to date or was analyzed successfully
+    """
     if not os.path.exists(steps_dir):
         print(f"Directory not found: {steps_dir}")
-        return
+        return False
 
-    for filename in os.listdir(steps_dir):
-        if filename.endswith(".wav"):
-            input_path = os.path.join(steps_dir, filename)
-            output_filename = f"{os.path.splitext(filename)[0]}_analysis.json"
-            output_path = os.path.join(steps_dir, output_filename)
+    manifest = load_manifest(steps_dir)
+    manifest_path = os.path.join(steps_dir, MANIFEST_FILENAME)
+    manifest_lock = threading.Lock()
 
-            print(f"Processing {filename}...")
+    pending = []
+    for filename in sorted(os.listdir(steps_dir)):
+        if not filename.endswith(".wav"):
+            continue
+        input_path = os.path.join(steps_dir, filename)
+        output_filename = analysis_filename(os.path.splitext(filename)[0])
+        output_path = os.path.join(steps_dir, output_filename)
+        sha256 = file_sha256(input_path)
 
-            try:
-                with open(input_path, "rb") as wav_file:
-                    wav_data = wav_file.read()
+        entry = manifest.get(filename)
+        if not force and entry and entry.get("sha256") == sha256 and os.path.exists(output_path):
+            print(f"Skipping {filename} (unchanged)")
+            continue
+        pending.append((filename, input_path, output_filename, output_path, sha256))
 
-                # Call the Gemini API function directly
-                gemini_response = generate_gemini_response(wav_data)
-                
-                # Parse the JSON response
-                analysis_result = json.loads(gemini_response)
+    if not pending:
+        print("All analyses are up to date")
+        return True
 
-                with open(output_path, "w") as json_file:
-                    json.dump(analysis_result, json_file, indent=4)
+    print(f"Processing {len(pending)} file(s) with {workers} worker(s)...")
+    batch_start = time.perf_counter()
+    failures = 0
 
-                print(f"Successfully created {output_filename}")
+    def process(filename, input_path, output_filename, output_path, sha256):
+        print(f"Processing {filename}...")
+        start_time = time.perf_counter()
+        attempts = analyze_file(input_path, output_path, retries, backoff_seconds)
+        seconds = time.perf_counter() - start_time
 
+        with manifest_lock:
+            manifest[filename] = {
+                "sha256": sha256,
+                "output": output_filename,
+                "seconds": round(seconds, 2),
+                "attempts": attempts,
+                "analyzed_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            }
+            write_json_atomic(manifest_path, manifest, indent=2)
+
+        print(f"Successfully created {output_filename} in {seconds:.1f}s ({attempts} attempt(s))")
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(process, *item): item[0] for item in pending}
+        for future in as_completed(futures):
+            filename = futures[future]
+            try:
+                future.result()
             except json.JSONDecodeError as e:
+                failures += 1
                 print(f"Error decoding JSON response for {filename}: {e}")
             except Exception as e:
+                failures += 1
                 print(f"An unexpected error occurred for {filename}: {e}")
 
+    print(f"Finished {len(pending) - failures}/{len(pending)} file(s) in {time.perf_counter() - batch_start:.1f}s")
+    return failures == 0
+
+
 if __name__ == "__main__":
-    analyze_wav_files() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Generate <step>_analysis.json files for the WAVs in steps/.")
+    parser.add_argument("--steps-dir", default="steps", help="Directory containing the step WAV files")
+    parser.add_argument("--workers", type=int, default=4, help="Number of files analyzed concurrently")
+    parser.add_argument("--retries", type=int, default=2, help="Retries per file after a failed call")
+    parser.add_argument("--force", action="store_true", help="Re-analyze files even if they are unchanged")
+    args = parser.parse_args()
+
+    ok = analyze_wav_files(args.steps_dir, workers=args.workers, retries=args.retries, force=args.force)
+    sys.exit(0 if ok else 1)
@@ -1,29 +1,69 @@
 import os
 import json
-import base64
+import math
+import time
+import queue
+import atexit
 import logging
+import threading
+import traceback
 from datetime import datetime
-from flask import Flask, request, jsonify, send_from_directory, send_file
+from functools import lru_cache
+from logging.handlers import QueueHandler, QueueListener
+# First, so the startup breakdown covers the imports below
+from startup import startup_timer
+from flask import Flask, Response, g, request, jsonify, send_file, url_for
 from flask_cors import CORS
-from google import genai
-from google.genai import types
 from dotenv import load_dotenv
+from schemas import yodel_analysis_schema, yodel_comparison_schema
+from model_gateway import ModelGateway, RequestTemplate, audio_part, load_sdk, text_part
+from model_backends import create_backend
+from reference_registry import ReferenceRegistry, ReferenceNotFound, ReferenceChanged
+from result_cache import ResultCache, make_cache_key, schema_version, sha256_hex
+from audio_upload import MAX_CONTENT_LENGTH, UploadError, parse_audio_request
+from jobs import JobStore, JobRunner, JobQueueFull, FINISHED_STATES
+from history_store import HistoryStore, valid_user_id
+from wav_io import WavFormatError, is_wav, parse_wav_header
+from pitch_engine import generate_local_response
+from alignment_scoring import MEASURED_METRICS, SCORING_SIGNATURE, apply_measured_metrics, build_comparison, score_comparison
+from audio_preprocess import PREPROCESS_SIGNATURE, check_audio, prepare_audio, prepare_reference_audio
+from timestamps import shift_analysis_timestamps, shift_phrase_timestamps
+from chunked_analysis import CHUNKING_SIGNATURE, analyze_in_chunks, split_wav
+from json_stream import IncrementalJsonParser, iter_matches
+from schema_validation import InvalidModelResponse
+from model_routing import MODEL_FAST, MODEL_FAST_THINKING_BUDGET, QUALITY_LEVELS, TierRouter
+from resilience import CIRCUIT_CLOSED, UpstreamTimeout, UpstreamUnavailable, request_deadline
+from admission import AdmissionController, LoadShed
+from static_assets import StaticIndex
+from singleflight import SingleFlight
+from metrics import REGISTRY, REQUESTS_IN_FLIGHT, REQUEST_SECONDS, REQUEST_BYTES, RESPONSE_BYTES, STAGE_SECONDS, ERRORS, RESULT_OUTCOMES
+
+startup_timer.mark("imports")
 
 load_dotenv()
 
-# Configure logging
+# Configure logging. Records are written by a background thread (QueueListener),
+# so request threads never wait on the disk; LOG_FILE="" logs to stderr only,
+# which is all a container platform collects anyway
+LOG_FILE = os.environ.get("LOG_FILE", "api.log")
+log_queue = queue.SimpleQueue()
+log_listener = QueueListener(
+    log_queue, logging.StreamHandler(), *([logging.FileHandler(LOG_FILE, delay=True)] if LOG_FILE else [])
+)
+log_listener.start()
+atexit.register(log_listener.stop)
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('api.log'),
-        logging.StreamHandler()
-    ]
+    handlers=[QueueHandler(log_queue)]
 )
 logger = logging.getLogger(__name__)
 
-# Initialize Flask app with static folder for React build
-app = Flask(__name__, static_folder='../static', static_url_path='')
+# Initialize Flask app; the React build is served by serve_static_files rather
+# than Flask's built-in static route
+STATIC_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'static')
+app = Flask(__name__, static_folder=None)
+app.config["MAX_CONTENT_LENGTH"] = MAX_CONTENT_LENGTH
 CORS(app)  # Enable CORS for all routes
 
 logger.info("Flask app initialized with CORS enabled")
@@ -31,288 +71,62 @@ logger.info("Flask app initialized with CORS enabled")
 # Get the Gemini API key from environment variables
 GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
 
-# Define the yodel analysis schema
-yodel_analysis_schema = {
-    "$schema": "http://json-schema.org/draft-07/schema#",
-    "title": "Yodel Analysis",
-    "description": "A schema for analyzing yodeling performances from a video / audio source.",
-    "type": "object",
-    "properties": {
-        "yodelAnalysis": {
-            "type": "object",
-            "description": "The root object containing the yodel analysis.",
-            "properties": {
-                "video / audioSource": {
-                    "type": "string",
-                    "description": "The time range in the video / audio source that was analyzed.",
-                    "pattern": "^\\d{2}:\\d{2}-\\d{2}:\\d{2}$",
-                },
-                "totalYodelSyllables": {
-                    "type": "integer",
-                    "description": "The total count of yodel syllables in the analyzed segment.",
-                    "minimum": 0,
-                },
-                "phrases": {
-                    "type": "array",
-                    "description": "A list of distinct yodeling phrases identified in the segment.",
-                    "items": {
-                        "type": "object",
-                        "properties": {
-                            "phraseNumber": {
-                                "type": "integer",
-                                "description": "A sequential identifier for the phrase.",
-                                "minimum": 1,
-                            },
-                            "startTime": {
-                                "type": "string",
-                                "description": "The start time of the phrase in MM:SS.s format.",
-                                "pattern": "^\\d{2}:\\d{2}\\.\\d+$",
-                            },
-                            "endTime": {
-                                "type": "string",
-                                "description": "The end time of the phrase in MM:SS.s format.",
-                                "pattern": "^\\d{2}:\\d{2}\\.\\d+$",
-                            },
-                            "yodelSyllablesInPhrase": {
-                                "type": "integer",
-                                "description": "The count of yodel syllables within this specific phrase.",
-                                "minimum": 0,
-                            },
-                            "events": {
-                                "type": "array",
-                                "description": "A sequence of vocal events within the phrase.",
-                                "items": {
-                                    "type": "object",
-                                    "properties": {
-                                        "timestamp": {
-                                            "type": "string",
-                                            "description": "The precise time of the event in MM:SS.s format.",
-                                            "pattern": "^\\d{2}:\\d{2}\\.\\d+$",
-                                        },
-                                        "type": {
-                                            "type": "string",
-                                            "description": "The type of vocal event.",
-                                            "enum": ["headVoice", "chestVoice", "yodelBreak"],
-                                        },
-                                        "description": {
-                                            "type": "string",
-                                            "description": "A textual description of the vocal event.",
-                                        },
-                                        "syllable": {
-                                            "type": "string",
-                                            "description": "The phonetic syllable associated with the event.",
-                                        },
-                                        "pitch": {
-                                            "type": "object",
-                                            "description": "The musical pitch of the event.",
-                                            "properties": {
-                                                "note": {
-                                                    "type": "string",
-                                                    "description": "The musical note (e.g., A, B, C#).",
-                                                    "pattern": "^[A-G](?:#|b)?$",
-                                                },
-                                                "octave": {
-                                                    "type": "integer",
-                                                    "description": "The octave number for the note.",
-                                                },
-                                            },
-                                            "required": ["note", "octave"],
-                                        },
-                                    },
-                                    "required": [
-                                        "timestamp",
-                                        "type",
-                                        "description",
-                                        "syllable",
-                                        "pitch",
-                                    ],
-                                },
-                            },
-                            "notes": {
-                                "type": "string",
-                                "description": "General notes or observations about the phrase.",
-                            },
-                        },
-                        "required": [
-                            "phraseNumber",
-                            "startTime",
-                            "endTime",
-                            "yodelSyllablesInPhrase",
-                            "events",
-                            "notes",
-                        ],
-                    },
-                },
-            },
-            "required": ["video / audioSource", "totalYodelSyllables", "phrases"],
-        }
-    },
-    "required": ["yodelAnalysis"],
-}
-
-# Define the yodel comparison schema
-yodel_comparison_schema = {
-    "$schema": "http://json-schema.org/draft-07/schema#",
-    "title": "Yodel Comparison",
-    "description": "A schema for comparing two yodeling performances.",
-    "type": "object",
-    "properties": {
-        "yodelComparison": {
-            "type": "object",
-            "description": "The root object containing the yodel comparison analysis.",
-            "properties": {
-                "overallScore": {
-                    "type": "number",
-                    "description": "Overall performance score from 0-100.",
-                    "minimum": 0,
-                    "maximum": 100
-                },
-                "metrics": {
-                    "type": "object",
-                    "description": "Detailed comparison metrics.",
-                    "properties": {
-                        "pitchAccuracy": {
-                            "type": "object",
-                            "properties": {
-                                "score": {"type": "number", "minimum": 0, "maximum": 100},
-                                "averageDeviationCents": {"type": "number"},
-                                "description": {"type": "string"}
-                            },
-                            "required": ["score", "averageDeviationCents", "description"]
-                        },
-                        "timingAccuracy": {
-                            "type": "object",
-                            "properties": {
-                                "score": {"type": "number", "minimum": 0, "maximum": 100},
-                                "averageDeviationMs": {"type": "number"},
-                                "description": {"type": "string"}
-                            },
-                            "required": ["score", "averageDeviationMs", "description"]
-                        },
-                        "yodelBreakQuality": {
-                            "type": "object",
-                            "properties": {
-                                "score": {"type": "number", "minimum": 0, "maximum": 100},
-                                "smoothnessRating": {"type": "string", "enum": ["excellent", "good", "fair", "poor"]},
-                                "description": {"type": "string"}
-                            },
-                            "required": ["score", "smoothnessRating", "description"]
-                        },
-                        "syllableAccuracy": {
-                            "type": "object",
-                            "properties": {
-                                "score": {"type": "number", "minimum": 0, "maximum": 100},
-                                "matchedSyllables": {"type": "integer", "minimum": 0},
-                                "totalSyllables": {"type": "integer", "minimum": 0},
-                                "description": {"type": "string"}
-                            },
-                            "required": ["score", "matchedSyllables", "totalSyllables", "description"]
-                        },
-                        "rhythmConsistency": {
-                            "type": "object",
-                            "properties": {
-                                "score": {"type": "number", "minimum": 0, "maximum": 100},
-                                "tempoVariation": {"type": "number"},
-                                "description": {"type": "string"}
-                            },
-                            "required": ["score", "tempoVariation", "description"]
-                        }
-                    },
-                    "required": ["pitchAccuracy", "timingAccuracy", "yodelBreakQuality", "syllableAccuracy", "rhythmConsistency"]
-                },
-                "feedback": {
-                    "type": "object",
-                    "description": "Detailed feedback for improvement.",
-                    "properties": {
-                        "strengths": {
-                            "type": "array",
-                            "description": "Areas where the user performed well.",
-                            "items": {"type": "string"}
-                        },
-                        "areasForImprovement": {
-                            "type": "array",
-                            "description": "Specific areas that need work.",
-                            "items": {
-                                "type": "object",
-                                "properties": {
-                                    "area": {"type": "string"},
-                                    "suggestion": {"type": "string"},
-                                    "priority": {"type": "string", "enum": ["high", "medium", "low"]}
-                                },
-                                "required": ["area", "suggestion", "priority"]
-                            }
-                        },
-                        "practiceRecommendations": {
-                            "type": "array",
-                            "description": "Specific exercises or techniques to practice.",
-                            "items": {"type": "string"}
-                        },
-                        "overallFeedback": {
-                            "type": "string",
-                            "description": "General encouraging feedback and summary. Limit this to 160 characters."
-                        }
-                    },
-                    "required": ["strengths", "areasForImprovement", "practiceRecommendations", "overallFeedback"]
-                }
-            },
-            "required": ["overallScore", "metrics", "feedback"]
-        }
-    },
-    "required": ["yodelComparison"]
-}
+# Model settings shared by analysis and comparison requests (the quality tier;
+# the fast tier is configured in model_routing.py)
+GEMINI_MODEL = "gemini-2.5-pro-preview-06-05"
+THINKING_BUDGET = 8192
 
+# Preload reference step WAVs so compare requests can refer to them by id
+reference_registry = ReferenceRegistry().load()
 
-def convert_json_schema_to_genai_schema(json_schema: dict) -> types.Schema:
-    """
-    Converts a JSON schema dictionary to a google.generativeai.types.Schema object.
-    """
-    type_mapping = {
-        "string": types.Type.STRING,
-        "integer": types.Type.INTEGER,
-        "number": types.Type.NUMBER,
-        "boolean": types.Type.BOOLEAN,
-        "object": types.Type.OBJECT,
-        "array": types.Type.ARRAY,
-    }
+# Index of the React build, with compressed variants prepared once
+static_index = StaticIndex(STATIC_FOLDER).load()
 
-    genai_schema_args = {}
+# Cache of model responses keyed by audio hash and model settings
+result_cache = ResultCache()
 
-    schema_type = json_schema.get("type")
-    if schema_type and schema_type in type_mapping:
-        genai_schema_args["type"] = type_mapping[schema_type]
+# Identical model calls that are already running, joined instead of repeated
+model_calls_in_flight = SingleFlight()
 
-    if "description" in json_schema:
-        genai_schema_args["description"] = json_schema["description"]
+# Slots for model work, shared by analyze, compare and batch (job) calls in priority order
+admission = AdmissionController()
 
-    if "enum" in json_schema:
-        genai_schema_args["enum"] = json_schema["enum"]
+# Background jobs for clients that poll instead of holding a request open
+job_store = JobStore()
+job_store.recover_orphans()
+job_runner = JobRunner(job_store)
 
-    if "properties" in json_schema:
-        genai_schema_args["properties"] = {
-            k: convert_json_schema_to_genai_schema(v)
-            for k, v in json_schema["properties"].items()
-        }
+# Per-user performance history and the rolling aggregates used as comparison context
+history_store = HistoryStore()
 
-    if "items" in json_schema:
-        genai_schema_args["items"] = convert_json_schema_to_genai_schema(json_schema["items"])
+startup_timer.mark("stores")
 
-    if "required" in json_schema:
-        genai_schema_args["required"] = json_schema["required"]
+# Use the local pitch tracker when the model call fails (only possible for WAV input)
+ANALYSIS_LOCAL_FALLBACK = os.environ.get("ANALYSIS_LOCAL_FALLBACK", "true").lower() in ("1", "true", "yes")
 
-    return types.Schema(**genai_schema_args)
+# Measure pitch, timing and yodel break scores locally (alignment_scoring.py) for
+# model compares of WAV takes; the model then only writes the narrative around them
+COMPARE_LOCAL_SCORING = os.environ.get("COMPARE_LOCAL_SCORING", "true").lower() in ("1", "true", "yes")
+# Takes longer than this are left to the model alone, which keeps pitch tracking
+# of both full takes off the model path for long uploads
+COMPARE_LOCAL_SCORING_MAX_SECONDS = float(os.environ.get("COMPARE_LOCAL_SCORING_MAX_SECONDS", 300))
 
+# How compares against a registered reference describe it to the model: "analysis"
+# sends its precomputed <step>_analysis.json as text instead of the reference audio
+# (when there is one for the current WAV), "audio" always sends the audio
+COMPARE_REFERENCE_MODE = os.environ.get("COMPARE_REFERENCE_MODE", "analysis")
+REFERENCE_MODES = ("analysis", "audio")
 
-def generate_gemini_response(wav_data):
-    """
-    Generates a response from the Gemini API based on the provided WAV file data.
-    """
-    logger.info(f"Starting Gemini analysis - Audio data size: {len(wav_data)} bytes")
-    
-    try:
-        client = genai.Client(api_key=GEMINI_API_KEY)
-        logger.info("Gemini client initialized successfully")
-        
-        prompt = f"""
+JOB_EVENT_POLL_SECONDS = float(os.environ.get("JOB_EVENT_POLL_SECONDS", 0.5))
+JOB_EVENT_TIMEOUT_SECONDS = float(os.environ.get("JOB_EVENT_TIMEOUT_SECONDS", 300))
+# Job event streams open at once in this process. Each holds a server thread
+# while it polls (gunicorn runs 8, admission gives up to 6 to model calls);
+# clients turned away can poll GET /jobs/<job_id> instead
+JOB_EVENT_MAX_SUBSCRIBERS = int(os.environ.get("JOB_EVENT_MAX_SUBSCRIBERS", 2))
+job_event_slots = threading.BoundedSemaphore(JOB_EVENT_MAX_SUBSCRIBERS)
+
+# Prompts are rendered once; only the comparison context varies per request
+ANALYSIS_PROMPT = f"""
         Analyze the provided audio recording of a yodeling performance and extract the following information in JSON format. The JSON output must strictly adhere to the following schema:
 
         ```json
@@ -320,120 +134,17 @@ def generate_gemini_response(wav_data):
         ```
         """
 
-        # Create audio part using the correct method
-        audio_part = types.Part(
-            inline_data=types.Blob(
-                mime_type='audio/wav',
-                data=wav_data
-            )
-        )
-        logger.info("Audio part created for Gemini API")
-
-        contents = [
-            types.Content(
-                role="user",
-                parts=[
-                    types.Part.from_text(text=prompt),
-                    audio_part
-                ]
-            )
-        ]
-
-        model = "gemini-2.5-pro-preview-06-05"
-        logger.info(f"Using model: {model}")
-        
-        gemini_analysis_schema = convert_json_schema_to_genai_schema(yodel_analysis_schema)
-        
-        generate_content_config = types.GenerateContentConfig(
-            response_mime_type="application/json",
-            response_schema=gemini_analysis_schema,
-            thinking_config=types.ThinkingConfig(
-                thinking_budget=8192,
-            )
-        )
+COMPARISON_PROMPT_HEADER = """
+        Compare these two yodeling performances and provide a detailed analysis. The first audio file is the original/reference performance, and the second is the user's attempt. 
 
-        logger.info("Sending request to Gemini API...")
-        response = client.models.generate_content(
-            model=model,
-            contents=contents,
-            config=generate_content_config,
-        )
-        
-        logger.info(f"Gemini API response received - Length: {len(response.text)} characters")
-        return response.text
-        
-    except Exception as e:
-        logger.error(f"Error in generate_gemini_response: {str(e)}", exc_info=True)
-        raise
+        """
 
+COMPARISON_WITH_REFERENCE_ANALYSIS_PROMPT_HEADER = """
+        Compare this yodeling performance with a reference performance and provide a detailed analysis. The reference is not attached as audio: it was transcribed ahead of time and is described below phrase by phrase, with the time, vocal register, syllable and pitch of each event. The attached audio is the user's attempt.
 
-def generate_yodel_comparison(original_wav_data, user_wav_data, past_performances=None, user_info=None):
-    """
-    Generates a comparison analysis between original and user yodel performances.
-    
-    Args:
-        original_wav_data: Binary data of the original/reference yodel performance
-        user_wav_data: Binary data of the user's yodel performance
-        past_performances: Optional list of past performance analyses for context
-        user_info: Optional dictionary containing user information (skill level, practice time, etc.)
-    """
-    logger.info(f"Starting yodel comparison - Original: {len(original_wav_data)} bytes, User: {len(user_wav_data)} bytes")
-    
-    # Log additional context information
-    if past_performances:
-        logger.info(f"Including {len(past_performances)} past performances for context")
-    if user_info:
-        logger.info(f"Including user info: {user_info.keys() if isinstance(user_info, dict) else 'provided'}")
-    
-    try:
-        client = genai.Client(api_key=GEMINI_API_KEY)
-        logger.info("Gemini client initialized for comparison")
-        
-        # Build context information for the prompt
-        context_info = ""
-        
-        if past_performances and len(past_performances) > 0:
-            context_info += f"\n\nPAST PERFORMANCE CONTEXT:\n"
-            context_info += f"The user has completed {len(past_performances)} previous yodeling analysis(es). Here's their performance history:\n\n"
-            
-            for i, past_perf in enumerate(past_performances[-5:], 1):  # Include last 5 performances
-                if isinstance(past_perf, dict):
-                    context_info += f"Performance #{i}:\n"
-                    if 'yodelComparison' in past_perf:
-                        comp_data = past_perf['yodelComparison']
-                        if 'overallScore' in comp_data:
-                            context_info += f"  - Overall Score: {comp_data['overallScore']}/100\n"
-                        if 'metrics' in comp_data:
-                            metrics = comp_data['metrics']
-                            context_info += f"  - Pitch Accuracy: {metrics.get('pitchAccuracy', {}).get('score', 'N/A')}/100\n"
-                            context_info += f"  - Timing Accuracy: {metrics.get('timingAccuracy', {}).get('score', 'N/A')}/100\n"
-                            context_info += f"  - Yodel Break Quality: {metrics.get('yodelBreakQuality', {}).get('score', 'N/A')}/100\n"
-                        if 'feedback' in comp_data and 'areasForImprovement' in comp_data['feedback']:
-                            improvements = comp_data['feedback']['areasForImprovement']
-                            if improvements:
-                                context_info += f"  - Previous areas for improvement: {', '.join([area.get('area', '') for area in improvements[:3]])}\n"
-                    elif 'overallScore' in past_perf:
-                        context_info += f"  - Overall Score: {past_perf['overallScore']}/100\n"
-                    context_info += "\n"
-        
-        if user_info:
-            context_info += f"\nUSER INFORMATION:\n"
-            if isinstance(user_info, dict):
-                if 'experience_level' in user_info:
-                    context_info += f"- Experience Level: {user_info['experience_level']}\n"
-                if 'practice_frequency' in user_info:
-                    context_info += f"- Practice Frequency: {user_info['practice_frequency']}\n"
-                if 'goals' in user_info:
-                    context_info += f"- Goals: {user_info['goals']}\n"
-                if 'challenges' in user_info:
-                    context_info += f"- Known Challenges: {user_info['challenges']}\n"
-                if 'total_practice_time' in user_info:
-                    context_info += f"- Total Practice Time: {user_info['total_practice_time']}\n"
-        
-        prompt = f"""
-        Compare these two yodeling performances and provide a detailed analysis. The first audio file is the original/reference performance, and the second is the user's attempt. 
+        """
 
-        {context_info}
+COMPARISON_PROMPT_BODY = """
 
         Based on the context above, analyze and compare the following aspects:
         1. Pitch accuracy - How well does the user match the original pitches?
@@ -458,126 +169,1028 @@ def generate_yodel_comparison(original_wav_data, user_wav_data, past_performance
         Be encouraging but honest in your assessment. Focus on specific, actionable feedback that will help the user improve their yodeling technique. Make the feedback personal and relevant to their journey.
         """
 
-        # Create audio parts for both files
-        original_audio_part = types.Part(
-            inline_data=types.Blob(
-                mime_type='audio/wav',
-                data=original_wav_data
-            )
+# Shared model backend (MODEL_BACKEND) and request templates, compiled during warm-up
+model_gateway = ModelGateway(create_backend(GEMINI_API_KEY))
+model_gateway.register(RequestTemplate(
+    "analysis", GEMINI_MODEL, yodel_analysis_schema, THINKING_BUDGET, prompt=ANALYSIS_PROMPT
+))
+model_gateway.register(RequestTemplate(
+    "comparison", GEMINI_MODEL, yodel_comparison_schema, THINKING_BUDGET
+))
+model_gateway.register(RequestTemplate(
+    "analysis_fast", MODEL_FAST, yodel_analysis_schema, MODEL_FAST_THINKING_BUDGET, prompt=ANALYSIS_PROMPT
+))
+model_gateway.register(RequestTemplate(
+    "comparison_fast", MODEL_FAST, yodel_comparison_schema, MODEL_FAST_THINKING_BUDGET
+))
+# Picks the fast or quality tier per call (see model_routing.py)
+model_router = TierRouter(model_gateway)
+ORIGINAL_LABEL = "Original/Reference Performance:"
+USER_LABEL = "User's Performance:"
+
+
+@lru_cache(maxsize=None)
+def label_part(label):
+    """The text part for a fixed label, built once."""
+    return text_part(label)
+
+
+def prepare_requests():
+    """Builds everything about model requests that doesn't depend on the audio: template schemas, configs and prompt parts."""
+    model_gateway.prepare()
+    label_part(ORIGINAL_LABEL)
+    label_part(USER_LABEL)
+
+
+def generate_gemini_response(wav_data, quality="auto"):
+    """
+    Generates a response from the Gemini API based on the provided WAV file data.
+
+    The audio is normalized (mono, resampled, silence trimmed) before upload and
+    the returned timestamps are shifted back onto the original recording's timeline.
+    Recordings longer than ANALYSIS_CHUNK_MIN_SECONDS are split at pauses and the
+    chunks are analyzed concurrently, then merged into a single analysis.
+    The model tier is chosen from quality and the length of the whole
+    recording, so chunks of a long song don't count as short clips.
+    """
+    logger.info(f"Starting Gemini analysis - Audio data size: {len(wav_data)} bytes")
+    
+    try:
+        prepared, chunks = prepare_analysis_audio(wav_data)
+        if chunks:
+            return analyze_chunks(prepared, chunks, quality)
+        return shift_response_timestamps(
+            request_analysis(prepared.data, prepared.mime_type, quality), prepared.offset_seconds
         )
         
-        user_audio_part = types.Part(
-            inline_data=types.Blob(
-                mime_type='audio/wav',
-                data=user_wav_data
-            )
+    except Exception as e:
+        logger.error(f"Error in generate_gemini_response: {str(e)}", exc_info=True)
+        raise
+
+
+def prepare_analysis_audio(wav_data):
+    """
+    Normalizes wav_data for upload and, for recordings long enough to chunk,
+    splits it at pauses.
+
+    Returns:
+        A (prepared, chunks) tuple; chunks is None unless the recording is chunked
+    """
+    with STAGE_SECONDS.time(operation="analysis", stage="preprocess"):
+        prepared = prepare_audio(wav_data)
+
+    return prepared, split_wav(prepared.data) if prepared.mime_type == "audio/wav" else None
+
+
+def analyze_chunks(prepared, chunks, quality="auto"):
+    """
+    Analyzes the chunks of a prepared recording concurrently and returns the
+    merged response text. All chunks share one deadline for the recording.
+    """
+    deadline = request_deadline(prepared.duration_seconds)
+    analysis = analyze_in_chunks(
+        chunks,
+        lambda chunk: json.loads(request_analysis(chunk, "audio/wav", quality, prepared.duration_seconds, deadline)),
+        prepared.duration_seconds,
+    )
+    return json.dumps(shift_analysis_timestamps(analysis, prepared.offset_seconds))
+
+
+def shift_response_timestamps(response_text, offset_seconds):
+    """Moves the timestamps in an analysis response from the trimmed clip back onto the original recording."""
+    if not offset_seconds:
+        return response_text
+    try:
+        return json.dumps(shift_analysis_timestamps(json.loads(response_text), offset_seconds))
+    except json.JSONDecodeError:
+        return response_text  # Left for the caller to report as an invalid response
+
+
+def request_analysis(audio_data, mime_type, quality="auto", clip_seconds=None, deadline=None):
+    """
+    Sends one clip to the analysis model tier and returns the response text,
+    validated against the schema. clip_seconds overrides the clip's own length
+    for routing and deadline the request's deadline (both used for chunks of
+    a longer recording).
+    """
+    logger.info("Sending request to Gemini API...")
+    response_text = model_router.generate(
+        "analysis", [model_gateway.template("analysis").prompt_part, audio_part(audio_data, mime_type)],
+        quality, clip_seconds, deadline,
+    )
+    logger.info(f"Gemini API response received - Length: {len(response_text)} characters")
+    return response_text
+
+
+def build_comparison_context(past_performances=None, user_info=None, history=None):
+    """
+    Builds the personalization section of the comparison prompt from the
+    user's past performances (last 5 only) and user information.
+
+    When the user's stored history (a UserHistory) is given it replaces
+    past_performances, and its score averages and recurring improvement areas
+    are added; all of it comes precomputed from the history store.
+    """
+    context_info = ""
+
+    total_performances = len(past_performances) if past_performances else 0
+    if history is not None and history.count:
+        past_performances = history.recent
+        total_performances = history.count
+
+    if past_performances and len(past_performances) > 0:
+        context_info += f"\n\nPAST PERFORMANCE CONTEXT:\n"
+        context_info += f"The user has completed {total_performances} previous yodeling analysis(es). Here's their performance history:\n\n"
+
+        for i, past_perf in enumerate(past_performances[-5:], 1):  # Include last 5 performances
+            if isinstance(past_perf, dict):
+                context_info += f"Performance #{i}:\n"
+                if 'yodelComparison' in past_perf:
+                    comp_data = past_perf['yodelComparison']
+                    if 'overallScore' in comp_data:
+                        context_info += f"  - Overall Score: {comp_data['overallScore']}/100\n"
+                    if 'metrics' in comp_data:
+                        metrics = comp_data['metrics']
+                        context_info += f"  - Pitch Accuracy: {metrics.get('pitchAccuracy', {}).get('score', 'N/A')}/100\n"
+                        context_info += f"  - Timing Accuracy: {metrics.get('timingAccuracy', {}).get('score', 'N/A')}/100\n"
+                        context_info += f"  - Yodel Break Quality: {metrics.get('yodelBreakQuality', {}).get('score', 'N/A')}/100\n"
+                    if 'feedback' in comp_data and 'areasForImprovement' in comp_data['feedback']:
+                        improvements = comp_data['feedback']['areasForImprovement']
+                        if improvements:
+                            context_info += f"  - Previous areas for improvement: {', '.join([area.get('area', '') for area in improvements[:3]])}\n"
+                elif 'overallScore' in past_perf:
+                    context_info += f"  - Overall Score: {past_perf['overallScore']}/100\n"
+                context_info += "\n"
+
+    if history is not None and history.count:
+        context_info += f"Progress across all {history.count} performance(s):\n"
+        for key, label in (("overallScore", "Overall Score"), ("pitchAccuracy", "Pitch Accuracy"),
+                           ("timingAccuracy", "Timing Accuracy"), ("yodelBreakQuality", "Yodel Break Quality")):
+            if key in history.averages:
+                line = f"  - {label}: average {history.averages[key]}/100"
+                if key in history.recent_averages and history.count > len(history.recent):
+                    trend = history.recent_averages[key] - history.averages[key]
+                    line += f", last {len(history.recent)} average {history.recent_averages[key]}/100 ({trend:+.1f})"
+                context_info += line + "\n"
+        recurring = [f"{area} ({count}x)" for area, count in history.recurring_areas[:5] if count > 1]
+        if recurring:
+            context_info += f"  - Recurring areas for improvement: {', '.join(recurring)}\n"
+
+    if user_info:
+        context_info += f"\nUSER INFORMATION:\n"
+        if isinstance(user_info, dict):
+            if 'experience_level' in user_info:
+                context_info += f"- Experience Level: {user_info['experience_level']}\n"
+            if 'practice_frequency' in user_info:
+                context_info += f"- Practice Frequency: {user_info['practice_frequency']}\n"
+            if 'goals' in user_info:
+                context_info += f"- Goals: {user_info['goals']}\n"
+            if 'challenges' in user_info:
+                context_info += f"- Known Challenges: {user_info['challenges']}\n"
+            if 'total_practice_time' in user_info:
+                context_info += f"- Total Practice Time: {user_info['total_practice_time']}\n"
+
+    return context_info
+
+
+REGISTER_NAMES = {"chestVoice": "chest", "headVoice": "head", "yodelBreak": "break"}
+# Phrase notes beyond this are cut; the events carry what the model needs to listen for
+REFERENCE_NOTES_MAX_CHARS = 160
+
+
+def build_reference_context(reference_analysis):
+    """
+    Renders a stored reference analysis as compact prompt text: a line per
+    phrase with its time range and syllable count, then its events as
+    "time register syllable note+octave". Event descriptions are left out.
+    """
+    root = reference_analysis.get("yodelAnalysis", {})
+    context_info = "\n\nREFERENCE PERFORMANCE:\n"
+    context_info += f"Total yodel syllables: {root.get('totalYodelSyllables', 'N/A')}\n"
+    context_info += "Events are listed as: time register(chest/head/break) syllable pitch\n"
+    for phrase in root.get("phrases", []):
+        context_info += (
+            f"Phrase {phrase.get('phraseNumber')} ({phrase.get('startTime')}-{phrase.get('endTime')}, "
+            f"{phrase.get('yodelSyllablesInPhrase')} syllables):\n"
         )
-        logger.info("Audio parts created for comparison")
-
-        contents = [
-            types.Content(
-                role="user",
-                parts=[
-                    types.Part.from_text(text=prompt),
-                    types.Part.from_text(text="Original/Reference Performance:"),
-                    original_audio_part,
-                    types.Part.from_text(text="User's Performance:"),
-                    user_audio_part
-                ]
+        events = []
+        for event in phrase.get("events", []):
+            pitch = event.get("pitch") or {}
+            events.append(
+                f"{event.get('timestamp')} {REGISTER_NAMES.get(event.get('type'), event.get('type'))} "
+                f"{event.get('syllable')} {pitch.get('note', '?')}{pitch.get('octave', '')}"
             )
-        ]
+        if events:
+            context_info += f"  {'; '.join(events)}\n"
+        notes = (phrase.get("notes") or "").strip()
+        if notes:
+            if len(notes) > REFERENCE_NOTES_MAX_CHARS:
+                notes = notes[:REFERENCE_NOTES_MAX_CHARS].rsplit(" ", 1)[0] + "..."
+            context_info += f"  Notes: {notes}\n"
+    return context_info
 
-        model = "gemini-2.5-pro-preview-06-05"
-        logger.info(f"Using model for comparison: {model}")
-        
-        gemini_comparison_schema = convert_json_schema_to_genai_schema(yodel_comparison_schema)
-        
-        generate_content_config = types.GenerateContentConfig(
-            response_mime_type="application/json",
-            response_schema=gemini_comparison_schema,
-            thinking_config=types.ThinkingConfig(
-                thinking_budget=8192,
-            )
+
+def measure_comparison(original_wav_data, user_wav_data, original_sha256=None):
+    """
+    Local alignment scores for a comparison (see score_comparison), or None when
+    COMPARE_LOCAL_SCORING is off, either take isn't WAV or either is longer
+    than COMPARE_LOCAL_SCORING_MAX_SECONDS.
+    """
+    if not COMPARE_LOCAL_SCORING:
+        return None
+    with STAGE_SECONDS.time(operation="comparison", stage="score"):
+        try:
+            longest = max(parse_wav_header(data).duration_seconds for data in (original_wav_data, user_wav_data))
+            if longest > COMPARE_LOCAL_SCORING_MAX_SECONDS:
+                logger.info(f"Skipping local scoring: {longest:.0f}s take, limit {COMPARE_LOCAL_SCORING_MAX_SECONDS:.0f}s")
+                return None
+            return score_comparison(original_wav_data, user_wav_data, original_sha256)
+        except WavFormatError:
+            return None
+
+
+def build_measured_context(measured):
+    """Renders the locally measured scores as a prompt section the model is told to keep."""
+    pitch, timing, breaks = (measured[name] for name in MEASURED_METRICS)
+    context_info = "\n\nMEASURED SCORES:\n"
+    context_info += "These were measured from the audio by aligning the pitch contours of both performances. Use them as given for these metrics and explain them in the descriptions and feedback; judge the other metrics yourself.\n"
+    context_info += f"- Pitch Accuracy: {pitch['score']}/100 (average deviation {pitch['averageDeviationCents']} cents)\n"
+    context_info += f"- Timing Accuracy: {timing['score']}/100 (average onset deviation {timing['averageDeviationMs']} ms)\n"
+    context_info += f"- Yodel Break Quality: {breaks['score']}/100 (smoothness {breaks['smoothnessRating']})\n"
+    return context_info
+
+
+def keep_measured_metrics(comparison, measured):
+    """Puts the measured numbers back into a model comparison, in case the model changed them; returns it."""
+    metrics = comparison.get("yodelComparison", {}).get("metrics", {})
+    for name in MEASURED_METRICS:
+        apply_measured_metrics(name, metrics.get(name), measured)
+    return comparison
+
+
+def comparison_parts(original_wav_data, user_wav_data, past_performances=None, user_info=None, history=None,
+                     reference_analysis=None, measured=None, original_sha256=None):
+    """
+    Builds the request parts for a comparison: the personalized prompt followed
+    by both labelled recordings. With a reference_analysis, the reference is
+    described in the prompt instead and only the user's recording is attached.
+    Measured scores, if any, are added to the prompt. The prepared reference
+    audio is reused across requests, keyed by original_sha256.
+    """
+    with STAGE_SECONDS.time(operation="comparison", stage="preprocess"):
+        original_audio = (
+            prepare_reference_audio(original_wav_data, original_sha256) if reference_analysis is None else None
         )
+        user_audio = prepare_audio(user_wav_data)
 
+    # Build context information for the prompt
+    with STAGE_SECONDS.time(operation="comparison", stage="prompt_build"):
+        context_info = build_comparison_context(past_performances, user_info, history)
+        if measured is not None:
+            context_info = build_measured_context(measured) + context_info
+        if reference_analysis is not None:
+            prompt = (COMPARISON_WITH_REFERENCE_ANALYSIS_PROMPT_HEADER + build_reference_context(reference_analysis)
+                      + context_info + COMPARISON_PROMPT_BODY)
+        else:
+            prompt = COMPARISON_PROMPT_HEADER + context_info + COMPARISON_PROMPT_BODY
+
+    if original_audio is None:
+        return [text_part(prompt), label_part(USER_LABEL), audio_part(user_audio.data, user_audio.mime_type)]
+    return [
+        text_part(prompt),
+        label_part(ORIGINAL_LABEL),
+        audio_part(original_audio.data, original_audio.mime_type),
+        label_part(USER_LABEL),
+        audio_part(user_audio.data, user_audio.mime_type),
+    ]
+
+
+def generate_yodel_comparison(original_wav_data, user_wav_data, past_performances=None, user_info=None, history=None,
+                              quality="auto", reference_analysis=None, original_sha256=None):
+    """
+    Generates a comparison analysis between original and user yodel performances.
+    
+    Args:
+        original_wav_data: Binary data of the original/reference yodel performance
+        user_wav_data: Binary data of the user's yodel performance
+        past_performances: Optional list of past performance analyses for context
+        user_info: Optional dictionary containing user information (skill level, practice time, etc.)
+        history: Optional UserHistory from the history store, used instead of past_performances
+        quality: "auto", "fast" or "high"; picks the model tier (see TierRouter)
+        reference_analysis: Optional precomputed analysis of the reference, sent as
+            text in place of original_wav_data
+        original_sha256: Optional digest of original_wav_data, keying its cached pitch contour
+    """
+    log_comparison_inputs(original_wav_data, user_wav_data, past_performances, user_info, history, reference_analysis)
+    
+    try:
+        measured = measure_comparison(original_wav_data, user_wav_data, original_sha256)
         logger.info("Sending comparison request to Gemini API...")
-        response = client.models.generate_content(
-            model=model,
-            contents=contents,
-            config=generate_content_config,
+        response_text = model_router.generate(
+            "comparison",
+            comparison_parts(
+                original_wav_data, user_wav_data, past_performances, user_info, history, reference_analysis, measured,
+                original_sha256,
+            ),
+            quality,
         )
+        if measured is not None:
+            response_text = json.dumps(keep_measured_metrics(json.loads(response_text), measured))
         
-        logger.info(f"Comparison response received - Length: {len(response.text)} characters")
-        logger.info(f"Comparison response: {response.text}")
-        return response.text
+        logger.info(f"Comparison response received - Length: {len(response_text)} characters")
+        logger.info(f"Comparison response: {response_text}")
+        return response_text
         
     except Exception as e:
         logger.error(f"Error in generate_yodel_comparison: {str(e)}", exc_info=True)
         raise
 
 
-@app.route("/analyze-yodel", methods=["POST"])
-def analyze_yodel():
+def log_comparison_inputs(original_wav_data, user_wav_data, past_performances=None, user_info=None, history=None,
+                          reference_analysis=None):
+    logger.info(f"Starting yodel comparison - Original: {len(original_wav_data)} bytes, User: {len(user_wav_data)} bytes")
+    
+    # Log additional context information
+    if history is not None:
+        logger.info(f"Including stored history for context ({history.count} performances)")
+    elif past_performances:
+        logger.info(f"Including {len(past_performances)} past performances for context")
+    if user_info:
+        logger.info(f"Including user info: {user_info.keys() if isinstance(user_info, dict) else 'provided'}")
+    if reference_analysis is not None:
+        logger.info("Describing the reference with its stored analysis instead of sending its audio")
+
+
+# Values pushed to streaming clients as soon as they are complete; () is the whole result
+ANALYSIS_STREAM_PATHS = [("yodelAnalysis", "phrases", "*"), ()]
+COMPARISON_STREAM_PATHS = [
+    ("yodelComparison", "overallScore"),
+    ("yodelComparison", "metrics", "*"),
+    ("yodelComparison", "feedback", "*"),
+    (),
+]
+
+
+def stream_model_values(template_name, parts, paths):
     """
-    API endpoint to analyze a yodel performance from a base64 encoded WAV file.
+    Streams a model call through the incremental JSON parser.
+
+    Yields:
+        (path, value) for each value matching paths as soon as the model has
+        finished writing it, ending with ((), full_result)
     """
-    request_id = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
-    logger.info(f"[{request_id}] Received analyze-yodel request")
-    
+    parser = IncrementalJsonParser(paths)
+    for text in model_gateway.generate_stream(template_name, parts):
+        yield from parser.feed(text)
+    yield from parser.close()
+
+
+def stream_template_name(operation, quality):
+    """
+    Streams can't be taken back once values have been sent, so there is no
+    escalation: they use the quality tier unless the fast one was asked for.
+    """
+    return model_router.template_name(operation, "fast" if quality == "fast" else "quality")
+
+
+def stream_gemini_response(wav_data, quality="auto"):
+    """
+    Streaming counterpart of generate_gemini_response; yields (path, value) pairs
+    for ANALYSIS_STREAM_PATHS with timestamps already on the original timeline.
+
+    Long recordings are analyzed in chunks as usual and their merged phrases
+    are replayed once the whole analysis is done.
+    """
+    with STAGE_SECONDS.time(operation="analysis", stage="preprocess"):
+        prepared = prepare_audio(wav_data)
+    if prepared.mime_type == "audio/wav" and split_wav(prepared.data):
+        yield from iter_matches(json.loads(generate_gemini_response(wav_data, quality)), ANALYSIS_STREAM_PATHS)
+        return
+
+    logger.info(f"Starting streamed Gemini analysis - Audio data size: {len(wav_data)} bytes")
+    parts = [model_gateway.template("analysis").prompt_part, audio_part(prepared.data, prepared.mime_type)]
+    for path, value in stream_model_values(stream_template_name("analysis", quality), parts, ANALYSIS_STREAM_PATHS):
+        if path == ():
+            shift_analysis_timestamps(value, prepared.offset_seconds)
+        else:
+            shift_phrase_timestamps(value, prepared.offset_seconds)
+        yield path, value
+
+
+def stream_yodel_comparison(original_wav_data, user_wav_data, past_performances=None, user_info=None, history=None,
+                            quality="auto", reference_analysis=None, original_sha256=None):
+    """Streaming counterpart of generate_yodel_comparison; yields (path, value) pairs for COMPARISON_STREAM_PATHS."""
+    logger.info(f"Starting streamed yodel comparison - Original: {len(original_wav_data)} bytes, User: {len(user_wav_data)} bytes")
+    measured = measure_comparison(original_wav_data, user_wav_data, original_sha256)
+    parts = comparison_parts(
+        original_wav_data, user_wav_data, past_performances, user_info, history, reference_analysis, measured,
+        original_sha256,
+    )
+    for path, value in stream_model_values(stream_template_name("comparison", quality), parts, COMPARISON_STREAM_PATHS):
+        if measured is not None:
+            if path == ():
+                keep_measured_metrics(value, measured)
+            elif path[-2] == "metrics":
+                apply_measured_metrics(path[-1], value, measured)
+        yield path, value
+
+
+ANALYSIS_SCHEMA_VERSION = schema_version(yodel_analysis_schema)
+COMPARISON_SCHEMA_VERSION = schema_version(yodel_comparison_schema)
+
+
+def analysis_cache_key(audio_sha256, quality="auto"):
+    """Cache key for an analysis: the audio content plus everything that shapes the model output."""
+    return make_cache_key(
+        "analyze",
+        audio=audio_sha256,
+        preprocess=PREPROCESS_SIGNATURE,
+        chunking=CHUNKING_SIGNATURE,
+        backend=model_gateway.backend.name,
+        model=GEMINI_MODEL,
+        schema=ANALYSIS_SCHEMA_VERSION,
+        thinking_budget=THINKING_BUDGET,
+        routing=model_router.signature(quality),
+    )
+
+
+def comparison_cache_key(original_sha256, user_sha256, context_info, quality="auto", reference_context=None):
+    """
+    Cache key for a comparison; context_info is the normalized personalization
+    prompt and reference_context the rendered reference analysis, if one was sent
+    instead of the reference audio.
+    """
+    return make_cache_key(
+        "compare",
+        original=original_sha256,
+        user=user_sha256,
+        preprocess=PREPROCESS_SIGNATURE,
+        backend=model_gateway.backend.name,
+        model=GEMINI_MODEL,
+        schema=COMPARISON_SCHEMA_VERSION,
+        thinking_budget=THINKING_BUDGET,
+        routing=model_router.signature(quality),
+        scoring=f"{SCORING_SIGNATURE}:{COMPARE_LOCAL_SCORING_MAX_SECONDS}" if COMPARE_LOCAL_SCORING else None,
+        context=context_info,
+        reference=reference_context,
+    )
+
+
+def comparison_request_cache_key(original_sha256, user_wav_data, past_performances=None, user_info=None, history=None,
+                                 quality="auto", reference_analysis=None):
+    return comparison_cache_key(
+        original_sha256,
+        sha256_hex(user_wav_data),
+        build_comparison_context(past_performances, user_info, history),
+        quality,
+        build_reference_context(reference_analysis) if reference_analysis is not None else None,
+    )
+
+
+def cache_bypass_requested():
+    """True when the client asked to skip the result cache via X-Cache-Bypass or Cache-Control: no-cache."""
+    if request.headers.get("X-Cache-Bypass", "").lower() in ("1", "true", "yes"):
+        return True
+    return "no-cache" in request.headers.get("Cache-Control", "").lower()
+
+
+def cached_model_call(cache_key, generate, bypass_cache=False, operation="analysis", work_class="analyze"):
+    """
+    Returns the parsed model result for cache_key, calling generate() on a miss.
+
+    generate() runs in an admission slot of work_class, so it may be queued or
+    shed with LoadShed. Concurrent misses for the same key share one generate() call. Only
+    responses that parse as JSON are stored. Returns a (result, cache_status)
+    tuple where cache_status is "hit", "miss", "bypass", "coalesced" (the
+    result came from an identical request that was already in flight) or
+    "fallback" (a bypass request served from the cache because the model
+    circuit breaker is open).
+    """
+    cached, cache_status = cache_lookup(cache_key, bypass_cache)
+    if cached is not None:
+        return json.loads(cached), cache_status
+
+    def call():
+        with admission.slot(work_class):
+            response_text = generate()
+        return store_response(cache_key, response_text, operation)
+
     try:
-        if not request.json or "wav_base64" not in request.json:
-            logger.warning(f"[{request_id}] Invalid request - missing wav_base64")
-            return jsonify({"error": "No base64 encoded wav file part"}), 400
+        (response_text, result), shared = model_calls_in_flight.do(cache_key, call)
+    except UpstreamUnavailable:
+        result = circuit_fallback(cache_key, bypass_cache)
+        if result is None:
+            raise
+        return result, "fallback"
+    if shared:
+        # Each caller gets its own copy; the leader's dict may be mutated downstream
+        return json.loads(response_text), "coalesced"
+    return result, cache_status
+
+
+def cache_lookup(cache_key, bypass_cache=False):
+    """
+    Returns a (cached_response_text, cache_status) tuple; the text is None
+    unless cache_status is "hit".
+    """
+    if bypass_cache:
+        result_cache.record_bypass()
+        return None, "bypass"
+    cached = result_cache.get(cache_key)
+    return cached, "hit" if cached is not None else "miss"
+
+
+def store_response(cache_key, response_text, operation="analysis"):
+    """Parses a fresh model response and caches it; returns (response_text, result). Invalid JSON is not stored."""
+    with STAGE_SECONDS.time(operation=operation, stage="parse"):
+        result = json.loads(response_text)
+    result_cache.put(cache_key, response_text)
+    return response_text, result
+
+
+def circuit_fallback(cache_key, bypass_cache=False):
+    """
+    The cached result a bypass request gets while the model circuit breaker is
+    open, or None; a cached result beats an error while the upstream is down,
+    even if a fresh one was asked for.
+    """
+    cached = result_cache.get(cache_key) if bypass_cache else None
+    if cached is None:
+        return None
+    logger.warning("Model circuit open; serving the cached result instead of a fresh one")
+    return json.loads(cached)
+
+
+def streamed_model_call(cache_key, stream, paths, bypass_cache=False, work_class="analyze"):
+    """
+    Streaming counterpart of cached_model_call.
 
-        wav_base64 = request.json["wav_base64"]
-        logger.info(f"[{request_id}] Base64 data length: {len(wav_base64)} characters")
+    The admission check happens before the response starts, so an overloaded
+    server can still answer 503; the slot itself is held while the stream runs.
+
+    Returns:
+        A ((path, value) iterator, cache_status) tuple. On a hit the cached
+        result is replayed through the same paths; on a miss the complete
+        result is cached once the stream finishes.
+    """
+    cached, cache_status = cache_lookup(cache_key, bypass_cache)
+    if cached is not None:
+        return iter_matches(json.loads(cached), paths), cache_status
+    admission.check(work_class)
+
+    def values():
+        with admission.slot(work_class):
+            for path, value in stream():
+                if path == ():
+                    result_cache.put(cache_key, json.dumps(value))
+                yield path, value
+
+    return values(), cache_status
+
+
+def read_quality(params):
+    """
+    The requested model tier, from the body or query string: "auto" (default),
+    "fast" or "high".
+
+    Raises:
+        UploadError: For any other value
+    """
+    quality = params.get("quality") or request.args.get("quality") or "auto"
+    if quality not in QUALITY_LEVELS:
+        raise UploadError(f"Unknown quality: {quality}")
+    return quality
+
+
+def read_analysis_request(request_id):
+    """
+    Extracts the WAV bytes, analysis mode ("model" or "fast") and model quality
+    (see read_quality) from an analysis request.
+
+    Raises:
+        UploadError: If the request carries no usable audio
+    """
+    with STAGE_SECONDS.time(operation="analysis", stage="decode"):
+        audio_request = parse_audio_request(request, {"wav": "wav_base64"})
+    if audio_request is None or "wav" not in audio_request.audio:
+        logger.warning(f"[{request_id}] Invalid request - missing wav_base64")
+        raise UploadError("No base64 encoded wav file part")
 
-        # Decode the base64 string
-        wav_data = base64.b64decode(wav_base64)
-        logger.info(f"[{request_id}] Decoded WAV data size: {len(wav_data)} bytes")
+    wav_data = audio_request.audio["wav"]
+    logger.info(f"[{request_id}] Decoded WAV data size: {len(wav_data)} bytes ({audio_request.transport} upload)")
+    check_audio(wav_data)
 
-        # Generate the analysis from Gemini
-        logger.info(f"[{request_id}] Starting Gemini analysis...")
-        gemini_response = generate_gemini_response(wav_data)
+    mode = audio_request.params.get("mode") or request.args.get("mode") or "model"
+    if mode not in ("model", "fast"):
+        raise UploadError(f"Unknown mode: {mode}")
+    return wav_data, mode, read_quality(audio_request.params)
 
-        # Parse the JSON response from Gemini
-        logger.info(f"[{request_id}] Parsing Gemini response...")
-        analysis_result = json.loads(gemini_response)
+
+def read_comparison_request(request_id):
+    """
+    Extracts the reference audio, user audio and personalization context from a
+    comparison request. With a user_id, the context comes from the user's
+    stored history rather than a client-supplied past_performances list. A
+    registered reference comes with its stored analysis unless reference_mode
+    (default COMPARE_REFERENCE_MODE) is "audio".
+
+    Returns:
+        A dict of keyword arguments for run_comparison
+
+    Raises:
+        UploadError: If audio is missing, the user_id is malformed or the
+            reference_id cannot be resolved
+    """
+    with STAGE_SECONDS.time(operation="comparison", stage="decode"):
+        audio_request = parse_audio_request(
+            request,
+            {"user_wav": "user_wav_base64", "original_wav": "original_wav_base64"},
+            json_fields=("past_performances", "user_info"),
+        )
+    if audio_request is None:
+        logger.warning(f"[{request_id}] Invalid request - no JSON data")
+        raise UploadError("No JSON data provided")
+
+    params = audio_request.params
+    reference_id = params.get("reference_id")
+    if reference_id is None and "original_wav" not in audio_request.audio:
+        logger.warning(f"[{request_id}] Invalid request - missing reference_id and original_wav_base64")
+        raise UploadError("No reference_id or original_wav_base64 provided")
         
-        logger.info(f"[{request_id}] Analysis completed successfully")
-        return jsonify(analysis_result)
+    if "user_wav" not in audio_request.audio:
+        logger.warning(f"[{request_id}] Invalid request - missing user_wav_base64")
+        raise UploadError("No user_wav_base64 provided")
 
-    except json.JSONDecodeError as e:
-        logger.error(f"[{request_id}] JSON decode error: {str(e)}")
+    user_wav_data = audio_request.audio["user_wav"]
+    check_audio(user_wav_data)
+    
+    # Optional parameters for enhanced personalization
+    past_performances = params.get("past_performances", None)
+    user_info = params.get("user_info", None)
+    user_id = params.get("user_id", None)
+    quality = read_quality(params)
+    mode = params.get("mode") or request.args.get("mode") or "model"
+    if mode not in ("model", "fast"):
+        raise UploadError(f"Unknown mode: {mode}")
+    reference_mode = params.get("reference_mode") or request.args.get("reference_mode") or COMPARE_REFERENCE_MODE
+    if reference_mode not in REFERENCE_MODES:
+        raise UploadError(f"Unknown reference_mode: {reference_mode}")
+
+    history = None
+    if user_id is not None:
+        if not valid_user_id(user_id):
+            logger.warning(f"[{request_id}] Invalid user_id")
+            raise UploadError("user_id must be 1-128 letters, digits or ._:- characters")
+        history = history_store.get(user_id)
+        logger.info(f"[{request_id}] User {user_id}: {history.count if history else 0} stored performances")
+    
+    # Log additional context parameters
+    if past_performances:
+        logger.info(f"[{request_id}] Past performances provided: {len(past_performances)} entries")
+    if user_info:
+        logger.info(f"[{request_id}] User info provided: {list(user_info.keys()) if isinstance(user_info, dict) else 'non-dict format'}")
+
+    # Resolve the reference audio, preferring the server-side registry
+    if reference_id is not None:
+        try:
+            reference = reference_registry.get(reference_id)
+        except ReferenceNotFound:
+            logger.warning(f"[{request_id}] Unknown reference_id: {reference_id}")
+            raise UploadError(f"Unknown reference_id: {reference_id}", 404)
+        except ReferenceChanged as e:
+            logger.warning(f"[{request_id}] Stale reference_id: {str(e)}")
+            raise UploadError(str(e), 409)
+        original_wav_data = reference.data
+        original_sha256 = reference.sha256
+        reference_analysis = reference.analysis if reference_mode == "analysis" else None
+        logger.info(
+            f"[{request_id}] Using registered reference {reference.reference_id} "
+            f"({'stored analysis' if reference_analysis is not None else 'audio'})"
+        )
+    else:
+        reference_analysis = None
+        original_wav_data = audio_request.audio["original_wav"]
+        check_audio(original_wav_data)
+        original_sha256 = sha256_hex(original_wav_data)
+
+    logger.info(f"[{request_id}] Audio received via {audio_request.transport} upload")
+    logger.info(f"[{request_id}] Original WAV size: {len(original_wav_data)} bytes")
+    logger.info(f"[{request_id}] User WAV size: {len(user_wav_data)} bytes")
+
+    return {
+        "original_wav_data": original_wav_data,
+        "original_sha256": original_sha256,
+        "user_wav_data": user_wav_data,
+        "past_performances": past_performances,
+        "user_info": user_info,
+        "history": history,
+        "user_id": user_id,
+        "reference_id": reference_id,
+        "quality": quality,
+        "reference_analysis": reference_analysis,
+        "mode": mode,
+    }
+
+
+def run_local_analysis(wav_data):
+    """
+    Analyzes wav_data with the local pitch tracker.
+
+    Raises:
+        UploadError: If the audio is not a WAV file the tracker can decode
+    """
+    try:
+        return json.loads(generate_local_response(wav_data))
+    except WavFormatError as e:
+        raise UploadError(f"Fast analysis requires WAV audio: {str(e)}", 415)
+
+
+def run_local_comparison(original_wav_data, user_wav_data, original_sha256=None):
+    """
+    Scores a comparison with the local alignment scorer alone, feedback included.
+
+    Raises:
+        UploadError: If either take is not a WAV file the tracker can decode
+    """
+    with STAGE_SECONDS.time(operation="comparison", stage="score"):
+        try:
+            return build_comparison(score_comparison(original_wav_data, user_wav_data, original_sha256))
+        except WavFormatError as e:
+            raise UploadError(f"Fast comparison requires WAV audio: {str(e)}", 415)
+
+
+def run_analysis(wav_data, bypass_cache=False, mode="model", work_class="analyze", quality="auto"):
+    """
+    Produces the analysis for wav_data.
+
+    mode="fast" uses the local pitch tracker. Otherwise the model tier picked by quality is called
+    (reusing a cached result for identical audio), falling back to the local
+    tracker when the model backend is unavailable (no API key) or the call fails.
+    Calls shed by admission control are not retried locally; the client gets a 503.
+
+    Returns:
+        An (analysis_result, outcome) tuple; outcome holds the "cache" status and
+        the "source" of the result ("model" or "local")
+    """
+    if mode == "fast" or not model_gateway.available:
+        return run_local_analysis(wav_data), record_outcome("analysis", {"cache": "skipped", "source": "local"})
+
+    cache_key = analysis_cache_key(sha256_hex(wav_data), quality)
+    try:
+        result, cache_status = cached_model_call(
+            cache_key, lambda: generate_gemini_response(wav_data, quality), bypass_cache, work_class=work_class
+        )
+        return result, record_outcome("analysis", {"cache": cache_status, "source": "model"})
+    except (UploadError, LoadShed):
+        raise
+    except Exception as e:
+        if not ANALYSIS_LOCAL_FALLBACK or not is_wav(wav_data):
+            raise
+        result = run_local_analysis(wav_data)
+        logger.warning(f"Model analysis failed ({type(e).__name__}: {str(e)}); returned local analysis instead")
+        return result, record_outcome("analysis", {"cache": "skipped", "source": "local"})
+
+
+def run_comparison(original_wav_data, original_sha256, user_wav_data, past_performances=None, user_info=None,
+                   history=None, user_id=None, reference_id=None, quality="auto", reference_analysis=None,
+                   mode="model", bypass_cache=False, work_class="compare"):
+    """
+    Produces the comparison for a reference/user pair, reusing a cached result
+    when the audio and personalization context are unchanged. With a user_id,
+    a newly generated result is added to that user's history.
+
+    mode="fast" (or a model backend that is unavailable) scores the takes
+    locally instead, in milliseconds and without calling the model.
+
+    Returns:
+        A (comparison_result, outcome) tuple, as for run_analysis
+    """
+    if mode == "fast" or not model_gateway.available:
+        result = run_local_comparison(original_wav_data, user_wav_data, original_sha256)
+        return result, record_outcome("comparison", {"cache": "skipped", "source": "local"})
+
+    cache_key = comparison_request_cache_key(
+        original_sha256, user_wav_data, past_performances, user_info, history, quality, reference_analysis
+    )
+    result, cache_status = cached_model_call(
+        cache_key,
+        lambda: generate_yodel_comparison(
+            original_wav_data, 
+            user_wav_data, 
+            past_performances=past_performances,
+            user_info=user_info,
+            history=history,
+            quality=quality,
+            reference_analysis=reference_analysis,
+            original_sha256=original_sha256,
+        ),
+        bypass_cache,
+        operation="comparison",
+        work_class=work_class,
+    )
+    record_history(user_id, result, reference_id, cache_status)
+    return result, record_outcome("comparison", {"cache": cache_status, "source": "model"})
+
+
+def record_history(user_id, comparison_result, reference_id, cache_status):
+    """
+    Adds a comparison to the user's stored history. Cache hits and coalesced
+    results are the same take submitted again, so only fresh results count.
+    """
+    if user_id is None or cache_status not in ("miss", "bypass"):
+        return
+    try:
+        history_store.record(user_id, comparison_result, reference_id)
+    except Exception as e:
+        # The comparison itself succeeded; losing one history entry shouldn't fail it
+        logger.error(f"Failed to record history for user {user_id}: {str(e)}", exc_info=True)
+
+
+def recorded_stream(values, user_id, reference_id, cache_status):
+    """Passes streamed (path, value) pairs through, recording the final result in the user's history."""
+    for path, value in values:
+        if path == ():
+            record_history(user_id, value, reference_id, cache_status)
+        yield path, value
+
+
+def metrics_endpoint():
+    """The matched route pattern, which keeps label cardinality bounded (one series per route, not per URL)."""
+    return request.url_rule.rule if request.url_rule is not None else "unmatched"
+
+
+def count_error(e, endpoint=None):
+    ERRORS.inc(endpoint=endpoint or metrics_endpoint(), type=type(e).__name__)
+
+
+def unavailable_response(request_id, e):
+    """
+    503 with Retry-After when admission control sheds the request or the model
+    circuit breaker is open, 504 when the model missed its deadline.
+    """
+    if isinstance(e, (LoadShed, UpstreamUnavailable)):
+        logger.warning(f"[{request_id}] Failing fast: {str(e)}")
+        return jsonify({"error": str(e), "type": type(e).__name__}), 503, {"Retry-After": str(int(math.ceil(e.retry_after)))}
+    logger.error(f"[{request_id}] {str(e)}")
+    return jsonify({"error": str(e), "type": type(e).__name__}), 504
+
+
+def record_outcome(operation, outcome):
+    """Counts a served result by cache outcome and source; returns outcome unchanged."""
+    RESULT_OUTCOMES.inc(operation=operation, cache=outcome["cache"], source=outcome["source"])
+    return outcome
+
+
+def outcome_response(result, outcome, operation="analysis"):
+    """JSON response for a result, with X-Cache and X-Analysis-Source headers describing how it was produced."""
+    with STAGE_SECONDS.time(operation=operation, stage="serialize"):
+        response = jsonify(result)
+    response.headers["X-Cache"] = outcome["cache"]
+    response.headers["X-Analysis-Source"] = outcome["source"]
+    return response
+
+
+STREAM_EVENT_NAMES = {"phrases": "phrase", "metrics": "metric", "feedback": "feedback"}
+
+
+def stream_event(path, value):
+    """
+    Maps a streamed (path, value) pair to an (event, payload) pair: "phrase"
+    events carry a phrase object, "metric"/"feedback"/"overallScore" events a
+    {"name", "value"} pair and the final "result" event the complete result.
+    """
+    if path == ():
+        return "result", value
+    if path[-2] == "phrases":
+        return "phrase", value
+    return STREAM_EVENT_NAMES.get(path[-2], path[-1]), {"name": path[-1], "value": value}
+
+
+def ndjson_requested():
+    return request.args.get("format") == "ndjson" or "application/x-ndjson" in request.headers.get("Accept", "")
+
+
+def stream_response(request_id, values, outcome, ndjson=False):
+    """
+    Streams (path, value) pairs to the client as server-sent events, or as
+    newline-delimited JSON objects with "event" and "data" keys when ndjson is set.
+
+    Errors after the stream has started can't change the status code, so they
+    are sent as a final "error" event.
+    """
+    def encode(event, payload):
+        if ndjson:
+            return json.dumps({"event": event, "data": payload}) + "\n"
+        return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+    endpoint = metrics_endpoint()
+
+    def body():
+        events = 0
+        try:
+            for path, value in values:
+                yield encode(*stream_event(path, value))
+                events += 1
+            logger.info(f"[{request_id}] Stream completed after {events} events")
+        except json.JSONDecodeError as e:
+            count_error(e, endpoint)
+            logger.error(f"[{request_id}] JSON decode error in stream: {str(e)}")
+            yield encode("error", {"error": "Invalid JSON response from Gemini", "type": "JSONDecodeError", "details": str(e)})
+        except Exception as e:
+            count_error(e, endpoint)
+            logger.error(f"[{request_id}] Error in stream after {events} events: {str(e)}", exc_info=True)
+            yield encode("error", {"error": str(e), "type": type(e).__name__})
+
+    return Response(body(), mimetype="application/x-ndjson" if ndjson else "text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+        "X-Cache": outcome["cache"],
+        "X-Analysis-Source": outcome["source"],
+    })
+
+
+def error_response(request_id, e, operation="analysis"):
+    """
+    Error response for a failed /analyze-yodel or /compare-yodel request:
+    the upload's own status for rejected uploads, 503/504 when the model is
+    unavailable and 500 (with details) for anything else.
+    """
+    count_error(e)
+    in_operation = " in comparison" if operation == "comparison" else ""
+    if isinstance(e, UploadError):
+        logger.warning(f"[{request_id}] Rejected upload: {str(e)}")
+        return jsonify({"error": str(e)}), e.status
+    if isinstance(e, (LoadShed, UpstreamUnavailable, UpstreamTimeout)):
+        return unavailable_response(request_id, e)
+    if isinstance(e, (json.JSONDecodeError, InvalidModelResponse)):
+        logger.error(f"[{request_id}] Invalid model response{in_operation}: {str(e)}")
         error_details = {
             "error": "Invalid JSON response from Gemini",
-            "type": "JSONDecodeError",
+            "type": type(e).__name__,
             "details": str(e)
         }
         return jsonify(error_details), 500
+    logger.error(f"[{request_id}] Unexpected error{in_operation}: {str(e)}", exc_info=True)
+    error_details = {
+        "error": str(e),
+        "type": type(e).__name__,
+        "traceback": traceback.format_exc()
+    }
+    return jsonify(error_details), 500
+
+
+@app.route("/analyze-yodel", methods=["POST"])
+def analyze_yodel():
+    """
+    API endpoint to analyze a yodel performance from a WAV file.
+
+    The audio can be sent as a raw audio/wav body, as a multipart "wav" file
+    part, or (for older clients) base64 encoded as wav_base64 in the JSON body.
+    Pass mode=fast (query string or body) to use the local pitch tracker
+    instead of the model, or quality=fast/high to pin the model tier.
+    """
+    request_id = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    logger.info(f"[{request_id}] Received analyze-yodel request")
+    
+    try:
+        wav_data, mode, quality = read_analysis_request(request_id)
+
+        # Generate the analysis from Gemini, or reuse a cached result for identical audio
+        logger.info(f"[{request_id}] Starting {mode} analysis...")
+        analysis_result, outcome = run_analysis(wav_data, cache_bypass_requested(), mode, quality=quality)
+        
+        logger.info(f"[{request_id}] Analysis completed successfully ({outcome['source']}, cache {outcome['cache']})")
+        return outcome_response(analysis_result, outcome)
+
     except Exception as e:
-        import traceback
-        logger.error(f"[{request_id}] Unexpected error: {str(e)}", exc_info=True)
-        error_details = {
-            "error": str(e),
-            "type": type(e).__name__,
-            "traceback": traceback.format_exc()
-        }
-        return jsonify(error_details), 500
+        return error_response(request_id, e)
 
 
 @app.route("/compare-yodel", methods=["POST"])
 def compare_yodel():
     """
     API endpoint to compare two yodel performances and provide detailed feedback.
-    Expects original_wav_base64 and user_wav_base64 in the request JSON.
-    Optional: past_performances (list) and user_info (dict) for personalized feedback.
+    Expects user_wav_base64 plus either reference_id (a step id known to the
+    reference registry) or original_wav_base64 in the request JSON.
+    Optional: user_id (str) and user_info (dict) for personalized feedback. With
+    a user_id the server keeps the user's performance history and records this
+    result in it; clients without one may still send past_performances (list).
+
+    Binary uploads are also accepted: multipart/form-data with "user_wav" and
+    optional "original_wav" file parts (other fields as form values, JSON
+    encoded where structured), or a raw audio/wav body holding the user take
+    with reference_id and friends in the query string.
     
     Expected JSON format:
     {
-        "original_wav_base64": "base64_encoded_wav_data",
+        "reference_id": "1",  // Or "1@<sha256 prefix>" to pin a specific version
+        "original_wav_base64": "base64_encoded_wav_data",  // Legacy alternative to reference_id
         "user_wav_base64": "base64_encoded_wav_data",
-        "past_performances": [  // Optional - array of past comparison results
+        "user_id": "8f14e45f-ceea-467f-a8f0-3a4b2c1d9e7b",  // Optional - server-side history key
+        "quality": "auto",  // Optional - "auto", "fast" or "high" model tier
+        "reference_mode": "analysis",  // Optional - "audio" to send the reference recording instead of its stored analysis
+        "mode": "model",  // Optional - "fast" to score locally without the model (WAV only)
+        "past_performances": [  // Optional, ignored once the user_id has stored history
             {
                 "yodelComparison": {
                     "overallScore": 85,
@@ -599,75 +1212,244 @@ def compare_yodel():
     logger.info(f"[{request_id}] Received compare-yodel request")
     
     try:
-        if not request.json:
-            logger.warning(f"[{request_id}] Invalid request - no JSON data")
-            return jsonify({"error": "No JSON data provided"}), 400
-        
-        if "original_wav_base64" not in request.json:
-            logger.warning(f"[{request_id}] Invalid request - missing original_wav_base64")
-            return jsonify({"error": "No original_wav_base64 provided"}), 400
-            
-        if "user_wav_base64" not in request.json:
-            logger.warning(f"[{request_id}] Invalid request - missing user_wav_base64")
-            return jsonify({"error": "No user_wav_base64 provided"}), 400
-
-        original_wav_base64 = request.json["original_wav_base64"]
-        user_wav_base64 = request.json["user_wav_base64"]
-        
-        # Optional parameters for enhanced personalization
-        past_performances = request.json.get("past_performances", None)
-        user_info = request.json.get("user_info", None)
-        
-        logger.info(f"[{request_id}] Original base64 length: {len(original_wav_base64)} characters")
-        logger.info(f"[{request_id}] User base64 length: {len(user_wav_base64)} characters")
-        
-        # Log additional context parameters
-        if past_performances:
-            logger.info(f"[{request_id}] Past performances provided: {len(past_performances)} entries")
-        if user_info:
-            logger.info(f"[{request_id}] User info provided: {list(user_info.keys()) if isinstance(user_info, dict) else 'non-dict format'}")
-
-        # Decode the base64 strings
-        logger.info(f"[{request_id}] Decoding base64 data...")
-        original_wav_data = base64.b64decode(original_wav_base64)
-        user_wav_data = base64.b64decode(user_wav_base64)
-        
-        logger.info(f"[{request_id}] Original WAV size: {len(original_wav_data)} bytes")
-        logger.info(f"[{request_id}] User WAV size: {len(user_wav_data)} bytes")
+        comparison_args = read_comparison_request(request_id)
 
         # Generate the comparison analysis from Gemini with enhanced context
         logger.info(f"[{request_id}] Starting comparison analysis...")
-        gemini_response = generate_yodel_comparison(
-            original_wav_data, 
-            user_wav_data, 
-            past_performances=past_performances,
-            user_info=user_info
+        comparison_result, outcome = run_comparison(
+            bypass_cache=cache_bypass_requested(), **comparison_args
         )
-
-        # Parse the JSON response from Gemini
-        logger.info(f"[{request_id}] Parsing comparison response...")
-        comparison_result = json.loads(gemini_response)
         
-        logger.info(f"[{request_id}] Comparison completed successfully")
-        return jsonify(comparison_result)
+        logger.info(f"[{request_id}] Comparison completed successfully (cache {outcome['cache']})")
+        return outcome_response(comparison_result, outcome, "comparison")
 
-    except json.JSONDecodeError as e:
-        logger.error(f"[{request_id}] JSON decode error in comparison: {str(e)}")
-        error_details = {
-            "error": "Invalid JSON response from Gemini",
-            "type": "JSONDecodeError",
-            "details": str(e)
-        }
-        return jsonify(error_details), 500
     except Exception as e:
-        import traceback
+        return error_response(request_id, e, "comparison")
+
+
+@app.route("/analyze-yodel/stream", methods=["POST"])
+def analyze_yodel_stream():
+    """
+    Streaming variant of /analyze-yodel: accepts the same request and sends
+    each phrase as soon as the model has finished writing it, then the full
+    analysis as a final "result" event. Server-sent events by default;
+    newline-delimited JSON with ?format=ndjson or Accept: application/x-ndjson.
+    """
+    request_id = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    logger.info(f"[{request_id}] Received streaming analyze-yodel request")
+
+    try:
+        wav_data, mode, quality = read_analysis_request(request_id)
+
+        if mode == "fast" or not model_gateway.available:
+            values = iter_matches(run_local_analysis(wav_data), ANALYSIS_STREAM_PATHS)
+            outcome = record_outcome("analysis", {"cache": "skipped", "source": "local"})
+        else:
+            values, cache_status = streamed_model_call(
+                analysis_cache_key(sha256_hex(wav_data), quality),
+                lambda: stream_gemini_response(wav_data, quality),
+                ANALYSIS_STREAM_PATHS,
+                cache_bypass_requested(),
+            )
+            outcome = record_outcome("analysis", {"cache": cache_status, "source": "model"})
+
+        logger.info(f"[{request_id}] Streaming {mode} analysis ({outcome['source']}, cache {outcome['cache']})")
+        return stream_response(request_id, values, outcome, ndjson_requested())
+
+    except UploadError as e:
+        count_error(e)
+        logger.warning(f"[{request_id}] Rejected upload: {str(e)}")
+        return jsonify({"error": str(e)}), e.status
+    except (LoadShed, UpstreamUnavailable, UpstreamTimeout) as e:
+        count_error(e)
+        return unavailable_response(request_id, e)
+    except Exception as e:
+        count_error(e)
+        logger.error(f"[{request_id}] Unexpected error: {str(e)}", exc_info=True)
+        return jsonify({"error": str(e), "type": type(e).__name__}), 500
+
+
+@app.route("/compare-yodel/stream", methods=["POST"])
+def compare_yodel_stream():
+    """
+    Streaming variant of /compare-yodel: accepts the same request and sends
+    overallScore, each metric and each feedback field as soon as they are
+    complete, then the full comparison as a final "result" event.
+    """
+    request_id = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    logger.info(f"[{request_id}] Received streaming compare-yodel request")
+
+    try:
+        comparison_args = read_comparison_request(request_id)
+        if comparison_args.pop("mode") == "fast" or not model_gateway.available:
+            result = run_local_comparison(
+                comparison_args["original_wav_data"], comparison_args["user_wav_data"], comparison_args["original_sha256"]
+            )
+            outcome = record_outcome("comparison", {"cache": "skipped", "source": "local"})
+            logger.info(f"[{request_id}] Streaming local comparison")
+            return stream_response(request_id, iter_matches(result, COMPARISON_STREAM_PATHS), outcome, ndjson_requested())
+
+        user_id = comparison_args.pop("user_id")
+        reference_id = comparison_args.pop("reference_id")
+        values, cache_status = streamed_model_call(
+            comparison_request_cache_key(
+                comparison_args["original_sha256"],
+                comparison_args["user_wav_data"],
+                comparison_args["past_performances"],
+                comparison_args["user_info"],
+                comparison_args["history"],
+                comparison_args["quality"],
+                comparison_args["reference_analysis"],
+            ),
+            lambda: stream_yodel_comparison(**comparison_args),
+            COMPARISON_STREAM_PATHS,
+            cache_bypass_requested(),
+            work_class="compare",
+        )
+        values = recorded_stream(values, user_id, reference_id, cache_status)
+        outcome = record_outcome("comparison", {"cache": cache_status, "source": "model"})
+
+        logger.info(f"[{request_id}] Streaming comparison (cache {cache_status})")
+        return stream_response(request_id, values, outcome, ndjson_requested())
+
+    except UploadError as e:
+        count_error(e)
+        logger.warning(f"[{request_id}] Rejected upload: {str(e)}")
+        return jsonify({"error": str(e)}), e.status
+    except (LoadShed, UpstreamUnavailable, UpstreamTimeout) as e:
+        count_error(e)
+        return unavailable_response(request_id, e)
+    except Exception as e:
+        count_error(e)
         logger.error(f"[{request_id}] Unexpected error in comparison: {str(e)}", exc_info=True)
-        error_details = {
-            "error": str(e),
-            "type": type(e).__name__,
-            "traceback": traceback.format_exc()
-        }
-        return jsonify(error_details), 500
+        return jsonify({"error": str(e), "type": type(e).__name__}), 500
+
+
+def job_accepted(job_id):
+    """Builds the 202 response returned when a job has been queued."""
+    response = jsonify({
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": url_for("get_job", job_id=job_id),
+        "events_url": url_for("stream_job_events", job_id=job_id),
+    })
+    response.status_code = 202
+    response.headers["Location"] = url_for("get_job", job_id=job_id)
+    return response
+
+
+@app.route("/jobs/analyze", methods=["POST"])
+def submit_analysis_job():
+    """
+    Queues an analysis and returns a job id immediately.
+    Accepts the same request formats as /analyze-yodel.
+    """
+    request_id = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    logger.info(f"[{request_id}] Received analysis job request")
+
+    try:
+        wav_data, mode, quality = read_analysis_request(request_id)
+        bypass_cache = cache_bypass_requested()
+        job_id = job_runner.submit("analyze", lambda: run_analysis(wav_data, bypass_cache, mode, "batch", quality)[0])
+        logger.info(f"[{request_id}] Analysis queued as job {job_id}")
+        return job_accepted(job_id)
+
+    except UploadError as e:
+        logger.warning(f"[{request_id}] Rejected upload: {str(e)}")
+        return jsonify({"error": str(e)}), e.status
+    except JobQueueFull as e:
+        logger.warning(f"[{request_id}] Job queue full: {str(e)}")
+        return jsonify({"error": "Too many pending jobs, try again shortly"}), 503, {"Retry-After": "10"}
+
+
+@app.route("/jobs/compare", methods=["POST"])
+def submit_comparison_job():
+    """
+    Queues a comparison and returns a job id immediately.
+    Accepts the same request formats as /compare-yodel.
+    """
+    request_id = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    logger.info(f"[{request_id}] Received comparison job request")
+
+    try:
+        comparison_args = read_comparison_request(request_id)
+        bypass_cache = cache_bypass_requested()
+        job_id = job_runner.submit(
+            "compare", lambda: run_comparison(bypass_cache=bypass_cache, work_class="batch", **comparison_args)[0]
+        )
+        logger.info(f"[{request_id}] Comparison queued as job {job_id}")
+        return job_accepted(job_id)
+
+    except UploadError as e:
+        logger.warning(f"[{request_id}] Rejected upload: {str(e)}")
+        return jsonify({"error": str(e)}), e.status
+    except JobQueueFull as e:
+        logger.warning(f"[{request_id}] Job queue full: {str(e)}")
+        return jsonify({"error": "Too many pending jobs, try again shortly"}), 503, {"Retry-After": "10"}
+
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    """Returns the job status, plus its result or error once finished."""
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({"error": f"Unknown job: {job_id}"}), 404
+    return jsonify(job)
+
+
+@app.route("/jobs/<job_id>/events", methods=["GET"])
+def stream_job_events(job_id):
+    """
+    Streams job progress as server-sent events.
+
+    A "status" event is sent whenever the state changes and a final "result"
+    event carries the same payload as GET /jobs/<job_id>. At most
+    JOB_EVENT_MAX_SUBSCRIBERS streams are open at once; beyond that the
+    response is a 503 with Retry-After.
+    """
+    if job_store.get(job_id) is None:
+        return jsonify({"error": f"Unknown job: {job_id}"}), 404
+    if not job_event_slots.acquire(blocking=False):
+        logger.warning(f"Refusing event stream for job {job_id}: {JOB_EVENT_MAX_SUBSCRIBERS} already open")
+        return jsonify({"error": f"Too many open event streams, poll /jobs/{job_id} instead"}), 503, {"Retry-After": "5"}
+
+    def events():
+        last_status = None
+        deadline = time.time() + JOB_EVENT_TIMEOUT_SECONDS
+        while time.time() < deadline:
+            job = job_store.get(job_id)
+            if job is None:
+                yield f"event: error\ndata: {json.dumps({'error': 'Job expired'})}\n\n"
+                return
+            if job["status"] in FINISHED_STATES:
+                yield f"event: result\ndata: {json.dumps(job)}\n\n"
+                return
+            if job["status"] != last_status:
+                last_status = job["status"]
+                yield f"event: status\ndata: {json.dumps({'job_id': job_id, 'status': last_status})}\n\n"
+            else:
+                yield ": keep-alive\n\n"
+            time.sleep(JOB_EVENT_POLL_SECONDS)
+        yield f"event: timeout\ndata: {json.dumps({'job_id': job_id, 'status': last_status})}\n\n"
+
+    response = Response(events(), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+    # Called by the server once the stream ends or the client goes away
+    response.call_on_close(job_event_slots.release)
+    return response
+
+
+@app.route("/users/<user_id>/history", methods=["GET"])
+def get_user_history(user_id):
+    """Returns the user's stored performance summary: averages, recurring improvement areas and recent results."""
+    if not valid_user_id(user_id):
+        return jsonify({"error": "Invalid user_id"}), 400
+    history = history_store.get(user_id)
+    if history is None:
+        return jsonify({"error": f"No history for user: {user_id}"}), 404
+    return jsonify(history.to_dict())
 
 
 @app.route("/mock-compare-yodel", methods=["GET"])
@@ -745,6 +1527,115 @@ def mock_compare_yodel():
     return jsonify(mock_response)
 
 
+@app.errorhandler(413)
+def request_entity_too_large(e):
+    """Returns a JSON error when a request exceeds MAX_CONTENT_LENGTH."""
+    return jsonify({"error": f"Request exceeds {MAX_CONTENT_LENGTH} bytes"}), 413
+
+
+@app.route("/references", methods=["GET"])
+def list_references():
+    """Lists the reference tracks that can be passed to /compare-yodel as reference_id."""
+    return jsonify({"references": reference_registry.list()})
+
+
+# Scrape-time mirrors of state kept elsewhere; the counters above are updated inline
+RESULT_CACHE_STATS = REGISTRY.gauge(
+    "yodelstar_result_cache", "Result cache counters and tier sizes, as reported by /cache-stats.", ["stat"])
+MODEL_CALLS = REGISTRY.gauge(
+    "yodelstar_model_calls", "Model calls per request template, as reported by /model-stats.", ["template"])
+SINGLE_FLIGHT_STATS = REGISTRY.gauge(
+    "yodelstar_single_flight", "Model calls started and duplicate requests coalesced onto them.", ["stat"])
+JOBS_PENDING = REGISTRY.gauge(
+    "yodelstar_jobs_pending", "Background jobs queued or running in this process.")
+ADMISSION_QUEUED = REGISTRY.gauge(
+    "yodelstar_admission_queued", "Model calls waiting for an admission slot, by work class.", ["work_class"])
+ADMISSION_RUNNING = REGISTRY.gauge(
+    "yodelstar_admission_running", "Model calls holding an admission slot, by work class.", ["work_class"])
+ADMISSION_ESTIMATED_WAIT = REGISTRY.gauge(
+    "yodelstar_admission_estimated_wait_seconds", "Expected queueing time for a call arriving now, by work class.", ["work_class"])
+UPSTREAM_CIRCUIT_OPEN = REGISTRY.gauge(
+    "yodelstar_upstream_circuit_open", "1 while the model circuit breaker is rejecting calls (open or half-open).")
+READY = REGISTRY.gauge(
+    "yodelstar_ready", "1 once startup warm-up has finished, as reported by /ready.")
+STARTUP_PHASE_SECONDS = REGISTRY.gauge(
+    "yodelstar_startup_phase_seconds", "Time each startup phase took, as reported by /ready.", ["phase"])
+
+
+def collect_state_metrics():
+    for stat, value in result_cache.stats().items():
+        RESULT_CACHE_STATS.set(value, stat=stat)
+    for template, entry in model_gateway.stats()["templates"].items():
+        MODEL_CALLS.set(entry["calls"], template=template)
+    for stat, value in model_calls_in_flight.stats().items():
+        SINGLE_FLIGHT_STATS.set(value, stat=stat)
+    JOBS_PENDING.set(job_runner.pending())
+    for work_class, entry in admission.stats()["classes"].items():
+        ADMISSION_QUEUED.set(entry["queued"], work_class=work_class)
+        ADMISSION_RUNNING.set(entry["running"], work_class=work_class)
+        ADMISSION_ESTIMATED_WAIT.set(entry["estimated_wait_seconds"], work_class=work_class)
+    UPSTREAM_CIRCUIT_OPEN.set(0 if model_gateway.guard.breaker.state == CIRCUIT_CLOSED else 1)
+    READY.set(1 if startup_timer.ready else 0)
+    for phase, seconds in startup_timer.phase_seconds().items():
+        STARTUP_PHASE_SECONDS.set(seconds, phase=phase)
+
+
+REGISTRY.add_collector(collect_state_metrics)
+
+
+@app.before_request
+def start_request_metrics():
+    g.request_start = time.perf_counter()
+    g.metrics_endpoint = metrics_endpoint()
+    REQUESTS_IN_FLIGHT.inc(endpoint=g.metrics_endpoint)
+    if request.content_length:
+        REQUEST_BYTES.observe(request.content_length, endpoint=g.metrics_endpoint)
+
+
+@app.after_request
+def record_request_metrics(response):
+    # For streamed responses this is the time to the first byte, not the whole stream
+    REQUEST_SECONDS.observe(
+        time.perf_counter() - g.request_start, endpoint=g.metrics_endpoint, status=response.status_code
+    )
+    if not response.is_streamed and response.content_length is not None:
+        RESPONSE_BYTES.observe(response.content_length, endpoint=g.metrics_endpoint)
+    return response
+
+
+@app.teardown_request
+def finish_request_metrics(exc):
+    if "metrics_endpoint" in g:
+        REQUESTS_IN_FLIGHT.dec(endpoint=g.metrics_endpoint)
+
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    """Request, stage, upstream, error and cache metrics in the Prometheus text exposition format."""
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/model-stats", methods=["GET"])
+def model_stats():
+    """
+    Returns per-template model call counts with setup and upstream timings,
+    and per-tier routing counts with the latency and cost the fast tier saved.
+    """
+    return jsonify(dict(model_gateway.stats(), tiers=model_router.stats()))
+
+
+@app.route("/queue-stats", methods=["GET"])
+def queue_stats():
+    """Returns admission queue depth, running calls and estimated wait per work class."""
+    return jsonify(admission.stats())
+
+
+@app.route("/cache-stats", methods=["GET"])
+def cache_stats():
+    """Returns result cache hit/miss counters and tier sizes, plus how many model calls coalescing saved."""
+    return jsonify(dict(result_cache.stats(), single_flight=model_calls_in_flight.stats()))
+
+
 # Health check endpoint for Docker/Cloud deployment
 @app.route("/health", methods=["GET"])
 def health_check():
@@ -752,32 +1643,48 @@ def health_check():
     return jsonify({
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
-        "gemini_configured": bool(GEMINI_API_KEY)
+        "gemini_configured": bool(GEMINI_API_KEY),
+        "model_backend": model_gateway.backend.name
     }), 200
 
+@app.route("/ready", methods=["GET"])
+def readiness_check():
+    """
+    Readiness probe: 503 until startup warm-up has finished (or if it failed),
+    then 200. /health only says the process is up. Both cases report how long
+    each startup phase took.
+    """
+    report = startup_timer.report()
+    return jsonify(report), 200 if report["ready"] else 503
+
 # Serve React app
 @app.route('/')
 def serve_react_app():
     """Serve the React application"""
-    try:
-        return send_from_directory(app.static_folder, 'index.html')
-    except Exception as e:
-        logger.error(f"Error serving React app: {str(e)}")
-        return jsonify({"error": "Frontend not available"}), 404
+    return serve_static_files("index.html")
 
 # Serve static files for React app
 @app.route('/<path:path>')
 def serve_static_files(path):
-    """Serve static files for the React application"""
-    try:
-        return send_from_directory(app.static_folder, path)
-    except Exception as e:
-        # If file not found, serve React app (for client-side routing)
-        try:
-            return send_from_directory(app.static_folder, 'index.html')
-        except Exception as e2:
-            logger.error(f"Error serving static file {path}: {str(e2)}")
-            return jsonify({"error": "File not found"}), 404
+    """
+    Serve static files for the React application from the startup index,
+    falling back to index.html for client-side routes.
+    """
+    asset = static_index.resolve(path)
+    if asset is None:
+        if static_index.get("index.html") is None:
+            return jsonify({"error": "Frontend not available"}), 404
+        return jsonify({"error": "File not found"}), 404
+    return static_index.serve(asset)
+
+# Import the SDK, build the request templates and create the model client now,
+# rather than in the first request; /ready reports when that's done
+startup_timer.mark("app")
+startup_timer.warm_up([
+    ("sdk_import", load_sdk),
+    ("request_templates", prepare_requests),
+    ("model_client", model_gateway.warm_up),
+])
 
 if __name__ == "__main__":
     logger.info("Starting Flask application on port 5002")
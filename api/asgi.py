@@ -0,0 +1,418 @@
+"""
+Async serving mode: an ASGI application for running the API under an ASGI
+server, e.g. `uvicorn asgi:app` or gunicorn with `-k uvicorn.workers.UvicornWorker`.
+
+/analyze-yodel and /compare-yodel are served by the coroutine handlers below,
+which await the model through the SDK's async client, so a single process can
+hold dozens of upstream calls without a thread for each. Every other route
+(static files, /health, streams, jobs, stats) goes to the Flask app in api.py on
+a small thread pool, so its handlers stay exactly as under the sync deployment
+(`gunicorn api:app`).
+"""
+import os
+import sys
+import json
+import asyncio
+import logging
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from api import (
+    app as flask_app, ANALYSIS_LOCAL_FALLBACK, admission, model_calls_in_flight, model_gateway, model_router,
+    analysis_cache_key, analyze_chunks, audio_part, cache_bypass_requested, cache_lookup, circuit_fallback,
+    comparison_parts, comparison_request_cache_key, error_response, keep_measured_metrics, log_comparison_inputs,
+    measure_comparison, outcome_response, prepare_analysis_audio, read_analysis_request, read_comparison_request,
+    record_history, record_outcome, run_local_analysis, run_local_comparison, shift_response_timestamps,
+    store_response,
+)
+from audio_upload import MAX_CONTENT_LENGTH, UPLOAD_SPOOL_MAX_MEMORY, UploadError
+from admission import LoadShed
+from resilience import UpstreamUnavailable
+from result_cache import sha256_hex
+from wav_io import is_wav
+
+logger = logging.getLogger(__name__)
+
+# Threads serving the routes that go through the Flask app; a streaming
+# response holds one for as long as it streams
+ASGI_SYNC_THREADS = int(os.environ.get("ASGI_SYNC_THREADS", 8))
+
+
+async def request_analysis_async(audio_data, mime_type, quality="auto"):
+    """Coroutine version of api.request_analysis()."""
+    logger.info("Sending request to Gemini API...")
+    response_text = await model_router.agenerate(
+        "analysis", [model_gateway.template("analysis").prompt_part, audio_part(audio_data, mime_type)], quality
+    )
+    logger.info(f"Gemini API response received - Length: {len(response_text)} characters")
+    return response_text
+
+
+async def generate_gemini_response_async(wav_data, quality="auto"):
+    """
+    Coroutine version of api.generate_gemini_response(). Preprocessing runs on
+    a worker thread; recordings long enough to be chunked are analyzed there
+    on the blocking path, as their chunks already run concurrently.
+    """
+    logger.info(f"Starting Gemini analysis - Audio data size: {len(wav_data)} bytes")
+
+    try:
+        prepared, chunks = await asyncio.to_thread(prepare_analysis_audio, wav_data)
+        if chunks:
+            return await asyncio.to_thread(analyze_chunks, prepared, chunks, quality)
+        return shift_response_timestamps(
+            await request_analysis_async(prepared.data, prepared.mime_type, quality), prepared.offset_seconds
+        )
+
+    except Exception as e:
+        logger.error(f"Error in generate_gemini_response_async: {str(e)}", exc_info=True)
+        raise
+
+
+async def generate_yodel_comparison_async(original_wav_data, user_wav_data, past_performances=None, user_info=None,
+                                          history=None, quality="auto", reference_analysis=None, original_sha256=None):
+    """Coroutine version of api.generate_yodel_comparison(); scoring and preprocessing run on a worker thread."""
+    log_comparison_inputs(original_wav_data, user_wav_data, past_performances, user_info, history, reference_analysis)
+
+    try:
+        measured = await asyncio.to_thread(measure_comparison, original_wav_data, user_wav_data, original_sha256)
+        parts = await asyncio.to_thread(
+            comparison_parts, original_wav_data, user_wav_data, past_performances, user_info, history,
+            reference_analysis, measured, original_sha256,
+        )
+        logger.info("Sending comparison request to Gemini API...")
+        response_text = await model_router.agenerate("comparison", parts, quality)
+        if measured is not None:
+            response_text = json.dumps(keep_measured_metrics(json.loads(response_text), measured))
+
+        logger.info(f"Comparison response received - Length: {len(response_text)} characters")
+        logger.info(f"Comparison response: {response_text}")
+        return response_text
+
+    except Exception as e:
+        logger.error(f"Error in generate_yodel_comparison_async: {str(e)}", exc_info=True)
+        raise
+
+
+async def cached_model_call_async(cache_key, agenerate, bypass_cache=False, operation="analysis", work_class="analyze"):
+    """
+    Coroutine version of api.cached_model_call(): same cache, admission slots
+    and in-flight coalescing (shared with the blocking path), awaiting
+    agenerate() on a miss. Cache reads and writes (SQLite) run on worker
+    threads, so a lock wait doesn't stall the event loop.
+    """
+    cached, cache_status = await asyncio.to_thread(cache_lookup, cache_key, bypass_cache)
+    if cached is not None:
+        return json.loads(cached), cache_status
+
+    async def call():
+        async with admission.aslot(work_class):
+            response_text = await agenerate()
+        return await asyncio.to_thread(store_response, cache_key, response_text, operation)
+
+    try:
+        (response_text, result), shared = await model_calls_in_flight.ado(cache_key, call)
+    except UpstreamUnavailable:
+        result = await asyncio.to_thread(circuit_fallback, cache_key, bypass_cache)
+        if result is None:
+            raise
+        return result, "fallback"
+    if shared:
+        return json.loads(response_text), "coalesced"
+    return result, cache_status
+
+
+async def run_analysis_async(wav_data, bypass_cache=False, mode="model", quality="auto"):
+    """Coroutine version of api.run_analysis(); local analyses run on a worker thread."""
+    if mode == "fast" or not model_gateway.available:
+        result = await asyncio.to_thread(run_local_analysis, wav_data)
+        return result, record_outcome("analysis", {"cache": "skipped", "source": "local"})
+
+    cache_key = analysis_cache_key(await asyncio.to_thread(sha256_hex, wav_data), quality)
+    try:
+        result, cache_status = await cached_model_call_async(
+            cache_key, lambda: generate_gemini_response_async(wav_data, quality), bypass_cache
+        )
+        return result, record_outcome("analysis", {"cache": cache_status, "source": "model"})
+    except (UploadError, LoadShed):
+        raise
+    except Exception as e:
+        if not ANALYSIS_LOCAL_FALLBACK or not is_wav(wav_data):
+            raise
+        result = await asyncio.to_thread(run_local_analysis, wav_data)
+        logger.warning(f"Model analysis failed ({type(e).__name__}: {str(e)}); returned local analysis instead")
+        return result, record_outcome("analysis", {"cache": "skipped", "source": "local"})
+
+
+async def run_comparison_async(original_wav_data, original_sha256, user_wav_data, past_performances=None,
+                               user_info=None, history=None, user_id=None, reference_id=None, quality="auto",
+                               reference_analysis=None, mode="model", bypass_cache=False):
+    """Coroutine version of api.run_comparison(); local scoring runs on a worker thread."""
+    if mode == "fast" or not model_gateway.available:
+        result = await asyncio.to_thread(run_local_comparison, original_wav_data, user_wav_data, original_sha256)
+        return result, record_outcome("comparison", {"cache": "skipped", "source": "local"})
+
+    cache_key = await asyncio.to_thread(
+        comparison_request_cache_key,
+        original_sha256, user_wav_data, past_performances, user_info, history, quality, reference_analysis,
+    )
+    result, cache_status = await cached_model_call_async(
+        cache_key,
+        lambda: generate_yodel_comparison_async(
+            original_wav_data,
+            user_wav_data,
+            past_performances=past_performances,
+            user_info=user_info,
+            history=history,
+            quality=quality,
+            reference_analysis=reference_analysis,
+            original_sha256=original_sha256,
+        ),
+        bypass_cache,
+        operation="comparison",
+        work_class="compare",
+    )
+    await asyncio.to_thread(record_history, user_id, result, reference_id, cache_status)
+    return result, record_outcome("comparison", {"cache": cache_status, "source": "model"})
+
+
+async def analyze_yodel():
+    """Async /analyze-yodel: same requests and responses as api.analyze_yodel()."""
+    request_id = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    logger.info(f"[{request_id}] Received analyze-yodel request")
+
+    try:
+        # Decoding and checking the upload; the request context goes along to the thread
+        wav_data, mode, quality = await asyncio.to_thread(read_analysis_request, request_id)
+
+        logger.info(f"[{request_id}] Starting {mode} analysis...")
+        analysis_result, outcome = await run_analysis_async(wav_data, cache_bypass_requested(), mode, quality)
+
+        logger.info(f"[{request_id}] Analysis completed successfully ({outcome['source']}, cache {outcome['cache']})")
+        return outcome_response(analysis_result, outcome)
+
+    except Exception as e:
+        return error_response(request_id, e)
+
+
+async def compare_yodel():
+    """Async /compare-yodel: same requests and responses as api.compare_yodel()."""
+    request_id = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    logger.info(f"[{request_id}] Received compare-yodel request")
+
+    try:
+        # Decoding, hashing and the reference and history lookups
+        comparison_args = await asyncio.to_thread(read_comparison_request, request_id)
+
+        logger.info(f"[{request_id}] Starting comparison analysis...")
+        comparison_result, outcome = await run_comparison_async(bypass_cache=cache_bypass_requested(), **comparison_args)
+
+        logger.info(f"[{request_id}] Comparison completed successfully (cache {outcome['cache']})")
+        return outcome_response(comparison_result, outcome, "comparison")
+
+    except Exception as e:
+        return error_response(request_id, e, "comparison")
+
+
+ASYNC_ROUTES = {
+    ("POST", "/analyze-yodel"): analyze_yodel,
+    ("POST", "/compare-yodel"): compare_yodel,
+}
+
+
+def wsgi_environ(scope, body, size):
+    """The WSGI environ for an ASGI HTTP request whose body (size bytes) has already been spooled."""
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope["query_string"].decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "CONTENT_LENGTH": str(size),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": body,
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope["headers"]:
+        name = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if name in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            # A declared length wins, so an oversized upload still gets Flask's 413
+            environ[name] = value
+        elif f"HTTP_{name}" in environ:
+            environ[f"HTTP_{name}"] += f",{value}"
+        else:
+            environ[f"HTTP_{name}"] = value
+    return environ
+
+
+async def read_body(scope, receive):
+    """
+    Spools the whole request body, like audio_upload.read_raw_body() under the
+    sync server: bodies up to UPLOAD_SPOOL_MAX_MEMORY stay in memory, larger
+    ones are written to a temp file from a worker thread as they arrive.
+    Reading stops once the body passes MAX_CONTENT_LENGTH (or straight away
+    when the declared length does): the Flask app rejects such requests with
+    a 413 without looking at the body.
+
+    Returns:
+        A (spool, size) tuple; the caller closes spool, which is rewound
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_MAX_MEMORY)
+    for name, value in scope["headers"]:
+        if name == b"content-length" and value.isdigit() and int(value) > MAX_CONTENT_LENGTH:
+            return spool, 0
+    size = 0
+    try:
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                break
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if size > UPLOAD_SPOOL_MAX_MEMORY:
+                # Past the memory limit the spool is (or now becomes) a file on disk
+                await asyncio.to_thread(spool.write, chunk)
+            else:
+                spool.write(chunk)
+            if size > MAX_CONTENT_LENGTH or not message.get("more_body", False):
+                break
+        spool.seek(0)
+    except BaseException:
+        spool.close()
+        raise
+    return spool, size
+
+
+class AsyncApp:
+    """
+    ASGI application routing requests either to a coroutine handler or to a
+    WSGI (Flask) app.
+
+    Coroutine handlers run in a Flask request context for the WSGI app, with
+    its before/after request hooks (request metrics, CORS headers), so they
+    can use the same request parsing and response helpers as the Flask views.
+    """
+
+    def __init__(self, wsgi_app, routes):
+        self.wsgi_app = wsgi_app
+        self.routes = routes
+        self._executor = ThreadPoolExecutor(max_workers=ASGI_SYNC_THREADS, thread_name_prefix="yodel-wsgi")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return  # No websocket routes; the server closes the connection
+
+        body, size = await read_body(scope, receive)
+        try:
+            environ = wsgi_environ(scope, body, size)
+            handler = self.routes.get((scope["method"], scope["path"]))
+            if handler is None:
+                await self._call_wsgi(environ, receive, send)
+            else:
+                await self._call_handler(handler, environ, send)
+        finally:
+            body.close()
+
+    async def _call_handler(self, handler, environ, send):
+        with self.wsgi_app.request_context(environ):
+            try:
+                rv = self.wsgi_app.preprocess_request()
+                if rv is None:
+                    rv = await handler()
+            except Exception as e:
+                rv = self.wsgi_app.handle_user_exception(e)
+            response = self.wsgi_app.finalize_request(rv)
+            app_iter, status, headers = response.get_wsgi_response(environ)
+            await send({"type": "http.response.start", "status": int(status.split(" ", 1)[0]),
+                        "headers": encode_headers(headers)})
+            await send({"type": "http.response.body", "body": b"".join(app_iter)})
+
+    async def _call_wsgi(self, environ, receive, send):
+        """
+        Runs the WSGI app on the thread pool, forwarding its response as it is
+        produced so streamed responses stay streamed. A client that disconnects
+        stops the iteration at the next chunk.
+        """
+        loop = asyncio.get_running_loop()
+        messages = asyncio.Queue()
+        disconnected = threading.Event()
+
+        def emit(message):
+            loop.call_soon_threadsafe(messages.put_nowait, message)
+
+        def run():
+            response_start = {}
+
+            def start_response(status, headers, exc_info=None):
+                response_start.update(status=int(status.split(" ", 1)[0]), headers=encode_headers(headers))
+
+            try:
+                app_iter = self.wsgi_app(environ, start_response)
+                try:
+                    for chunk in app_iter:
+                        if response_start:
+                            emit(dict(response_start, type="http.response.start"))
+                            response_start.clear()
+                        if chunk:
+                            emit({"type": "http.response.body", "body": chunk, "more_body": True})
+                        if disconnected.is_set():
+                            break
+                finally:
+                    if hasattr(app_iter, "close"):
+                        app_iter.close()
+                if response_start:
+                    emit(dict(response_start, type="http.response.start"))
+                emit({"type": "http.response.body", "body": b""})
+            except BaseException as e:
+                emit(e)
+
+        async def watch_disconnect():
+            while (await receive())["type"] != "http.disconnect":
+                pass
+            disconnected.set()
+
+        watcher = asyncio.ensure_future(watch_disconnect())
+        worker = loop.run_in_executor(self._executor, run)
+        try:
+            while True:
+                message = await messages.get()
+                if isinstance(message, BaseException):
+                    raise message
+                await send(message)
+                if message["type"] == "http.response.body" and not message.get("more_body", False):
+                    break
+            await worker
+        finally:
+            disconnected.set()
+            watcher.cancel()
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self._executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+def encode_headers(headers):
+    return [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers]
+
+
+app = AsyncApp(flask_app, ASYNC_ROUTES)
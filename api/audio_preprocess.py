@@ -0,0 +1,223 @@
+import os
+import math
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+from audio_upload import UploadError
+from result_cache import sha256_hex
+from wav_io import WavFormatError, is_wav, parse_wav_header, decode_wav, encode_wav
+
+logger = logging.getLogger(__name__)
+
+AUDIO_PREPROCESS = os.environ.get("AUDIO_PREPROCESS", "true").lower() in ("1", "true", "yes")
+AUDIO_TARGET_SAMPLE_RATE = int(os.environ.get("AUDIO_TARGET_SAMPLE_RATE", 16000))
+AUDIO_MAX_SECONDS = float(os.environ.get("AUDIO_MAX_SECONDS", 600))
+AUDIO_TRIM_DB = float(os.environ.get("AUDIO_TRIM_DB", 40))
+AUDIO_TRIM_PADDING_SECONDS = float(os.environ.get("AUDIO_TRIM_PADDING_SECONDS", 0.15))
+
+TRIM_FRAME_SECONDS = 0.02
+
+# Long recordings are resampled in blocks of this much audio, each with this much
+# overlap on either side that is resampled too and then discarded, so the FFT
+# never spans the whole upload
+RESAMPLE_BLOCK_SECONDS = 10.0
+RESAMPLE_MARGIN_SECONDS = 0.5
+
+# Prepared reference tracks kept in memory, by sha256; user takes are prepared per request
+REFERENCE_AUDIO_CACHE_SIZE = int(os.environ.get("REFERENCE_AUDIO_CACHE_SIZE", 8))
+
+# Part of the result cache key: changing any setting changes what the model hears
+PREPROCESS_SIGNATURE = (
+    f"{AUDIO_PREPROCESS}:{AUDIO_TARGET_SAMPLE_RATE}:{AUDIO_TRIM_DB}:{AUDIO_TRIM_PADDING_SECONDS}"
+)
+
+# Magic numbers of the containers browsers record into, checked in order
+CONTAINER_SIGNATURES = [
+    (0, b"\x1a\x45\xdf\xa3", "audio/webm"),
+    (0, b"OggS", "audio/ogg"),
+    (4, b"ftyp", "audio/mp4"),
+    (0, b"fLaC", "audio/flac"),
+    (0, b"ID3", "audio/mpeg"),
+    (0, b"\xff\xfb", "audio/mpeg"),
+    (0, b"\xff\xf3", "audio/mpeg"),
+]
+
+
+class PreparedAudio:
+    """
+    Audio ready to send upstream.
+
+    Attributes:
+        data: The bytes to upload
+        mime_type: MIME type matching data
+        offset_seconds: Where data starts in the original recording; add this to
+            any timestamp the model returns
+        duration_seconds: Length of data (None for compressed containers)
+        original_bytes: Size of the audio as received
+    """
+
+    def __init__(self, data, mime_type, offset_seconds=0.0, duration_seconds=None, original_bytes=None):
+        self.data = data
+        self.mime_type = mime_type
+        self.offset_seconds = offset_seconds
+        self.duration_seconds = duration_seconds
+        self.original_bytes = original_bytes if original_bytes is not None else len(data)
+
+
+def sniff_mime_type(data):
+    """Returns the audio MIME type implied by the container's magic number, or None."""
+    if is_wav(data):
+        return "audio/wav"
+    for offset, signature, mime_type in CONTAINER_SIGNATURES:
+        if data[offset:offset + len(signature)] == signature:
+            return mime_type
+    return None
+
+
+def check_audio(data):
+    """
+    Cheap header-only validation, run as soon as a request is parsed.
+
+    Raises:
+        UploadError: For unrecognized containers, malformed WAV headers or WAVs
+            longer than AUDIO_MAX_SECONDS
+    """
+    mime_type = sniff_mime_type(data)
+    if mime_type is None:
+        raise UploadError("Unrecognized audio format", 415)
+    if mime_type == "audio/wav":
+        try:
+            info = parse_wav_header(data)
+        except WavFormatError as e:
+            raise UploadError(f"Malformed WAV file: {str(e)}")
+        if info.duration_seconds > AUDIO_MAX_SECONDS:
+            raise UploadError(f"Audio is {info.duration_seconds:.0f}s long; the limit is {AUDIO_MAX_SECONDS:.0f}s", 413)
+    return mime_type
+
+
+def resample(samples, source_rate, target_rate):
+    """
+    Band-limited resampling via the FFT; also acts as the anti-aliasing filter
+    when downsampling. Recordings longer than RESAMPLE_BLOCK_SECONDS are done
+    block by block, with overlapping margins to hide the block edges.
+    """
+    if source_rate == target_rate or len(samples) == 0:
+        return samples
+    divisor = math.gcd(int(source_rate), int(target_rate))
+    up, down = int(target_rate) // divisor, int(source_rate) // divisor
+    # Blocks and margins start on whole multiples of `down` source samples, where
+    # the output has a sample too, so blocks line up exactly
+    block = down * max(1, int(RESAMPLE_BLOCK_SECONDS * source_rate) // down)
+    if len(samples) <= block:
+        return _fft_resample(samples, max(1, int(round(len(samples) * up / down))))
+
+    margin = down * max(1, int(RESAMPLE_MARGIN_SECONDS * source_rate) // down)
+    resampled = np.empty(int(round(len(samples) * up / down)), dtype=np.float32)
+    for start in range(0, len(samples), block):
+        low, high = max(0, start - margin), min(len(samples), start + block + margin)
+        padded = _fft_resample(samples[low:high], int(round((high - low) * up / down)))
+        first = start * up // down
+        count = min(block * up // down, len(resampled) - first)
+        skip = (start - low) * up // down
+        resampled[first:first + count] = padded[skip:skip + count]
+    return resampled
+
+
+def _fft_resample(samples, target_length):
+    spectrum = np.fft.rfft(samples)
+    bins = target_length // 2 + 1
+    if bins <= len(spectrum):
+        spectrum = spectrum[:bins]
+    else:
+        spectrum = np.concatenate([spectrum, np.zeros(bins - len(spectrum), dtype=spectrum.dtype)])
+    return (np.fft.irfft(spectrum, target_length) * (target_length / len(samples))).astype(np.float32)
+
+
+def trim_silence(samples, sample_rate):
+    """
+    Energy-gated trim of leading and trailing silence.
+
+    Returns:
+        A (start, end) sample range; frames quieter than AUDIO_TRIM_DB below the
+        loudest frame count as silence, and AUDIO_TRIM_PADDING_SECONDS is kept
+        on either side of the loud region
+    """
+    frame = max(1, int(TRIM_FRAME_SECONDS * sample_rate))
+    n_frames = len(samples) // frame
+    if n_frames == 0:
+        return 0, len(samples)
+
+    rms = np.sqrt(np.mean(samples[:n_frames * frame].reshape(n_frames, frame) ** 2, axis=1))
+    peak = rms.max()
+    if peak <= 1e-5:
+        return 0, len(samples)
+
+    loud = np.flatnonzero(rms >= peak * 10 ** (-AUDIO_TRIM_DB / 20.0))
+    padding = int(AUDIO_TRIM_PADDING_SECONDS * sample_rate)
+    start = max(0, loud[0] * frame - padding)
+    end = min(len(samples), (loud[-1] + 1) * frame + padding)
+    return start, end
+
+
+def prepare_audio(data):
+    """
+    Normalizes audio before it is sent to the model.
+
+    WAV input is downmixed to mono, resampled to AUDIO_TARGET_SAMPLE_RATE and
+    trimmed of leading/trailing silence, then re-encoded as 16-bit PCM.
+    Compressed containers (the browser's webm/ogg/mp4 recordings) are passed
+    through untouched with their real MIME type.
+
+    Raises:
+        UploadError: If check_audio rejects the input
+    """
+    mime_type = check_audio(data)
+    if mime_type != "audio/wav":
+        return PreparedAudio(data, mime_type)
+    if not AUDIO_PREPROCESS:
+        return PreparedAudio(data, mime_type, duration_seconds=parse_wav_header(data).duration_seconds)
+
+    samples, sample_rate = decode_wav(data)
+    start, end = trim_silence(samples, sample_rate)
+    samples = resample(samples[start:end], sample_rate, AUDIO_TARGET_SAMPLE_RATE)
+
+    prepared = PreparedAudio(
+        encode_wav(samples, AUDIO_TARGET_SAMPLE_RATE),
+        "audio/wav",
+        offset_seconds=start / sample_rate,
+        duration_seconds=len(samples) / AUDIO_TARGET_SAMPLE_RATE,
+        original_bytes=len(data),
+    )
+    logger.info(
+        f"Prepared audio: {len(data)} -> {len(prepared.data)} bytes, "
+        f"trimmed {prepared.offset_seconds:.2f}s of leading silence"
+    )
+    return prepared
+
+
+_reference_audio = OrderedDict()
+_reference_audio_lock = threading.Lock()
+
+
+def prepare_reference_audio(data, sha256=None):
+    """
+    prepare_audio() for a reference track, memoized by its sha256 (computed
+    when not given) so each reference is only processed once.
+
+    Raises:
+        UploadError: If check_audio rejects the input
+    """
+    key = sha256 or sha256_hex(data)
+    with _reference_audio_lock:
+        prepared = _reference_audio.get(key)
+        if prepared is not None:
+            _reference_audio.move_to_end(key)
+            return prepared
+
+    prepared = prepare_audio(data)
+    with _reference_audio_lock:
+        _reference_audio[key] = prepared
+        while len(_reference_audio) > REFERENCE_AUDIO_CACHE_SIZE:
+            _reference_audio.popitem(last=False)
+    return prepared
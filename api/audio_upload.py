@@ -0,0 +1,139 @@
+import os
+import json
+import base64
+import shutil
+import logging
+import tempfile
+from werkzeug.exceptions import RequestEntityTooLarge
+
+logger = logging.getLogger(__name__)
+
+# Largest request body accepted on any endpoint (Flask's MAX_CONTENT_LENGTH)
+MAX_CONTENT_LENGTH = int(os.environ.get("MAX_CONTENT_LENGTH", 50 * 1024 * 1024))
+
+# Raw uploads stay in memory up to this size, then spill to a temp file
+UPLOAD_SPOOL_MAX_MEMORY = int(os.environ.get("UPLOAD_SPOOL_MAX_MEMORY", 4 * 1024 * 1024))
+
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+RAW_AUDIO_MIME_TYPES = {
+    "audio/wav",
+    "audio/wave",
+    "audio/x-wav",
+    "audio/vnd.wave",
+    "application/octet-stream",
+}
+
+
+class UploadError(ValueError):
+    """An unusable upload; carries the HTTP status the endpoint should return."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class AudioRequest:
+    """
+    Normalized view of an audio request, whichever way the client sent it.
+
+    Attributes:
+        params: Non-audio request fields (reference_id, past_performances, ...)
+        audio: Mapping of audio field name to raw WAV bytes
+        transport: "json", "multipart" or "raw"
+    """
+
+    def __init__(self, params, audio, transport):
+        self.params = params
+        self.audio = audio
+        self.transport = transport
+
+
+def parse_audio_request(req, audio_fields, json_fields=()):
+    """
+    Extracts audio and parameters from a JSON, multipart or raw audio request.
+
+    Args:
+        req: The Flask request
+        audio_fields: Ordered mapping of audio field name to its legacy base64 JSON
+            key, e.g. {"wav": "wav_base64"}. A raw audio/wav body fills the first field.
+        json_fields: Parameter names that multipart and query-string clients send
+            as JSON-encoded strings (e.g. past_performances)
+
+    Returns:
+        An AudioRequest, or None when the body is not JSON, multipart or audio.
+    """
+    mimetype = req.mimetype
+
+    if mimetype in RAW_AUDIO_MIME_TYPES:
+        params = _decode_json_fields(req.args.to_dict(), json_fields)
+        first_field = next(iter(audio_fields))
+        return AudioRequest(params, {first_field: read_raw_body(req)}, "raw")
+
+    if mimetype == "multipart/form-data":
+        try:
+            files = req.files
+            params = _decode_json_fields(req.form.to_dict(), json_fields)
+        except RequestEntityTooLarge:
+            raise UploadError(f"Upload exceeds {MAX_CONTENT_LENGTH} bytes", 413)
+
+        audio = {}
+        for field in audio_fields:
+            if field in files:
+                # Werkzeug already spooled the part to a temp file; one read yields the only copy
+                audio[field] = files[field].read()
+        return AudioRequest(params, audio, "multipart")
+
+    try:
+        params = req.get_json(silent=True)
+    except RequestEntityTooLarge:
+        raise UploadError(f"Upload exceeds {MAX_CONTENT_LENGTH} bytes", 413)
+    if not isinstance(params, dict):
+        return None
+
+    params = dict(params)
+    audio = {}
+    for field, base64_key in audio_fields.items():
+        if base64_key in params:
+            encoded = params.pop(base64_key)
+            try:
+                logger.info(f"{base64_key} length: {len(encoded)} characters")
+                audio[field] = base64.b64decode(encoded)
+            except (TypeError, ValueError):
+                # Not a string, non-ASCII text, or bad padding (binascii.Error is a ValueError)
+                raise UploadError(f"Field {base64_key} must be a base64 encoded string")
+    return AudioRequest(params, audio, "json")
+
+
+def read_raw_body(req):
+    """
+    Streams a raw request body into a spooled temp file and returns its bytes.
+
+    Small bodies never leave memory; large ones are written to disk as they
+    arrive instead of being buffered by the WSGI layer.
+    """
+    if req.content_length is not None and req.content_length > MAX_CONTENT_LENGTH:
+        raise UploadError(f"Upload exceeds {MAX_CONTENT_LENGTH} bytes", 413)
+
+    with tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_MAX_MEMORY) as spool:
+        try:
+            shutil.copyfileobj(req.stream, spool, UPLOAD_CHUNK_SIZE)
+        except RequestEntityTooLarge:
+            raise UploadError(f"Upload exceeds {MAX_CONTENT_LENGTH} bytes", 413)
+
+        size = spool.tell()
+        if size == 0:
+            raise UploadError("Empty audio upload")
+        spool.seek(0)
+        return spool.read(size)
+
+
+def _decode_json_fields(params, json_fields):
+    for field in json_fields:
+        value = params.get(field)
+        if isinstance(value, str) and value:
+            try:
+                params[field] = json.loads(value)
+            except json.JSONDecodeError:
+                raise UploadError(f"Field {field} must be JSON encoded")
+    return params
@@ -0,0 +1,259 @@
+"""
+Offline microbenchmarks for the request hot path.
+
+The model is replaced by the zero-latency fake backend, so only our own code
+is measured: schema conversion, base64 decoding, prompt assembly, JSON
+parsing, validation and serialization, and Flask request overhead. Results
+are written to JSON and can be compared against a previous run:
+
+    python benchmark.py --output before.json
+    python benchmark.py --compare before.json
+"""
+import os
+import sys
+import json
+import time
+import base64
+import random
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+
+# Must be set before api is imported: offline model, no shared cache or job files
+_scratch_dir = tempfile.mkdtemp(prefix="yodel-bench-")
+os.environ.update({
+    "MODEL_BACKEND": "fake",
+    "MODEL_FAKE_LATENCY_SECONDS": "0",
+    "MODEL_FAKE_JITTER_SECONDS": "0",
+    "RESULT_CACHE_PATH": "",
+    "JOB_STORE_PATH": os.path.join(_scratch_dir, "jobs.sqlite3"),
+    "REFERENCE_STEPS_DIRS": _scratch_dir,
+})
+
+import logging
+import numpy as np
+
+logging.disable(logging.CRITICAL)
+
+import api
+import alignment_scoring
+from model_backends import fake_value
+from model_gateway import convert_json_schema_to_genai_schema
+from schemas import yodel_analysis_schema, yodel_comparison_schema
+from synthetic_audio import synthetic_wav
+
+DEFAULT_OUTPUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "benchmarks")
+
+
+def synthetic_analysis(phrases=40, seed=0):
+    """A schema-shaped analysis about as large as the model returns for a long take."""
+    rng = random.Random(seed)
+    analysis = fake_value(yodel_analysis_schema, rng)
+    template = analysis["yodelAnalysis"]["phrases"][0]
+    phrase_schema = yodel_analysis_schema["properties"]["yodelAnalysis"]["properties"]["phrases"]["items"]
+    template["events"] = [fake_value(phrase_schema["properties"]["events"]["items"], rng, "events") for _ in range(12)]
+    analysis["yodelAnalysis"]["phrases"] = [dict(template, phraseNumber=i + 1) for i in range(phrases)]
+    return analysis
+
+
+def synthetic_past_performances(count, seed=0):
+    rng = random.Random(seed)
+    return [fake_value(yodel_comparison_schema, rng) for _ in range(count)]
+
+
+USER_INFO = {
+    "experience_level": "intermediate",
+    "practice_frequency": "3 times per week",
+    "goals": "Improve yodel breaks and pitch accuracy",
+    "challenges": "Difficulty with high notes",
+    "total_practice_time": "6 months",
+}
+
+
+def build_cases():
+    """Returns (name, setup) pairs; setup() returns the zero-argument callable to time."""
+    client = api.app.test_client()
+    no_cache = {"X-Cache-Bypass": "1"}
+    cases = []
+
+    cases.append(("schema_conversion/analysis", lambda: lambda: convert_json_schema_to_genai_schema(yodel_analysis_schema)))
+    cases.append(("schema_conversion/comparison", lambda: lambda: convert_json_schema_to_genai_schema(yodel_comparison_schema)))
+
+    for megabytes in (1, 5, 10):
+        def setup(megabytes=megabytes):
+            encoded = base64.b64encode(synthetic_wav(megabytes)).decode("ascii")
+            return lambda: base64.b64decode(encoded)
+        cases.append((f"base64_decode/{megabytes}mb", setup))
+
+    for count in (5, 100, 1000):
+        def setup(count=count):
+            past = synthetic_past_performances(count)
+            return lambda: api.build_comparison_context(past, USER_INFO)
+        cases.append((f"comparison_context/{count}_past", setup))
+
+    def setup_reference_context():
+        analysis = synthetic_analysis()
+        return lambda: api.build_reference_context(analysis)
+    cases.append(("comparison_context/reference_analysis", setup_reference_context))
+
+    def setup_prepare():
+        wav = synthetic_wav(5)
+        return lambda: api.prepare_audio(wav)
+    cases.append(("audio/prepare_5mb", setup_prepare))
+
+    def setup_local_analysis():
+        wav = synthetic_wav(1)
+        return lambda: api.generate_local_response(wav)
+    cases.append(("audio/local_analysis_1mb", setup_local_analysis))
+
+    def setup_scoring():
+        reference, take = synthetic_wav(seconds=60, seed=1), synthetic_wav(seconds=60, seed=2)
+        # The reference contour is memoized, so this times tracking the take plus the alignment and metrics
+        alignment_scoring.score_comparison(reference, take)
+        return lambda: alignment_scoring.score_comparison(reference, take)
+    cases.append(("scoring/align_60s", setup_scoring))
+
+    def setup_loads():
+        text = json.dumps(synthetic_analysis())
+        return lambda: json.loads(text)
+    cases.append(("json/loads_analysis", setup_loads))
+
+    def setup_validate():
+        text = json.dumps(synthetic_analysis())
+        validator = api.model_gateway.template("analysis").validator
+        return lambda: validator.parse(text)
+    cases.append(("json/validate_analysis", setup_validate))
+
+    def setup_repair_truncated():
+        text = json.dumps(synthetic_analysis())
+        truncated = text[: len(text) * 2 // 3]
+        validator = api.model_gateway.template("analysis").validator
+        return lambda: validator.parse(truncated)
+    cases.append(("json/repair_truncated_analysis", setup_repair_truncated))
+
+    def setup_jsonify():
+        analysis = synthetic_analysis()
+
+        def run():
+            with api.app.app_context():
+                api.jsonify(analysis).get_data()
+        return run
+    cases.append(("json/jsonify_analysis", setup_jsonify))
+
+    cases.append(("flask/health", lambda: lambda: client.get("/health")))
+
+    def setup_analyze_raw():
+        wav = synthetic_wav(1)
+        return lambda: client.post("/analyze-yodel", data=wav, content_type="audio/wav", headers=no_cache)
+    cases.append(("flask/analyze_raw_1mb", setup_analyze_raw))
+
+    def setup_analyze_base64():
+        body = json.dumps({"wav_base64": base64.b64encode(synthetic_wav(1)).decode("ascii")})
+        return lambda: client.post("/analyze-yodel", data=body, content_type="application/json", headers=no_cache)
+    cases.append(("flask/analyze_base64_1mb", setup_analyze_base64))
+
+    def setup_compare():
+        body = json.dumps({
+            "original_wav_base64": base64.b64encode(synthetic_wav(1, seed=1)).decode("ascii"),
+            "user_wav_base64": base64.b64encode(synthetic_wav(1, seed=2)).decode("ascii"),
+            "past_performances": synthetic_past_performances(5),
+            "user_info": USER_INFO,
+        })
+        return lambda: client.post("/compare-yodel", data=body, content_type="application/json", headers=no_cache)
+    cases.append(("flask/compare_base64_1mb", setup_compare))
+
+    return cases
+
+
+def measure(fn, min_seconds, min_rounds, warmup):
+    """Runs fn repeatedly and returns per-call timing statistics in milliseconds."""
+    for _ in range(warmup):
+        fn()
+    timings = []
+    started = time.perf_counter()
+    while len(timings) < min_rounds or time.perf_counter() - started < min_seconds:
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        "rounds": len(timings),
+        "min_ms": round(timings[0], 4),
+        "median_ms": round(statistics.median(timings), 4),
+        "mean_ms": round(statistics.fmean(timings), 4),
+        "p95_ms": round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 4),
+        "stdev_ms": round(statistics.stdev(timings), 4) if len(timings) > 1 else 0.0,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL, text=True,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_benchmarks(name_filter=None, min_seconds=1.0, min_rounds=5, warmup=2):
+    results = {}
+    for name, setup in build_cases():
+        if name_filter and name_filter not in name:
+            continue
+        results[name] = measure(setup(), min_seconds, min_rounds, warmup)
+        print(f"{name:34s} median {results[name]['median_ms']:10.3f} ms   p95 {results[name]['p95_ms']:10.3f} ms   ({results[name]['rounds']} rounds)")
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+
+
+def compare(current, baseline, threshold):
+    """Prints median changes against a baseline run; returns the names that got slower than threshold."""
+    print(f"\nCompared with {baseline['meta'].get('commit', '?')} (median, regression threshold {threshold:.0%}):")
+    regressions = []
+    for name, stats in current["results"].items():
+        before = baseline["results"].get(name)
+        if before is None:
+            print(f"  {name:34s} new")
+            continue
+        change = stats["median_ms"] / before["median_ms"] - 1 if before["median_ms"] else 0.0
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(f"  {name:34s} {before['median_ms']:10.3f} -> {stats['median_ms']:10.3f} ms  {change:+7.1%}{flag}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline microbenchmarks for the analyze/compare hot path.")
+    parser.add_argument("--filter", help="Only run benchmarks whose name contains this string")
+    parser.add_argument("--min-seconds", type=float, default=1.0, help="Minimum time spent measuring each benchmark")
+    parser.add_argument("--min-rounds", type=int, default=5, help="Minimum number of timed calls per benchmark")
+    parser.add_argument("--output", help="Where to write the JSON results (default: cache/benchmarks/<commit>.json)")
+    parser.add_argument("--compare", help="A previous results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Relative median slowdown reported as a regression")
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.filter, args.min_seconds, args.min_rounds)
+
+    output = args.output or os.path.join(DEFAULT_OUTPUT_DIR, f"{report['meta']['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,140 @@
+import os
+import logging
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from wav_io import decode_wav, encode_wav, parse_wav_header
+from timestamps import format_source_range, shift_analysis_timestamps
+
+logger = logging.getLogger(__name__)
+
+# Recordings shorter than this are analyzed in a single request
+ANALYSIS_CHUNK_MIN_SECONDS = float(os.environ.get("ANALYSIS_CHUNK_MIN_SECONDS", 90))
+ANALYSIS_CHUNK_TARGET_SECONDS = float(os.environ.get("ANALYSIS_CHUNK_TARGET_SECONDS", 45))
+ANALYSIS_CHUNK_MAX_SECONDS = float(os.environ.get("ANALYSIS_CHUNK_MAX_SECONDS", 75))
+# Upper bound on concurrent chunk requests across the whole process
+ANALYSIS_CHUNK_WORKERS = int(os.environ.get("ANALYSIS_CHUNK_WORKERS", 4))
+
+SPLIT_FRAME_SECONDS = 0.02
+# A frame this far below the loudest frame counts as a pause between phrases
+SPLIT_SILENCE_DB = 35.0
+
+# Part of the result cache key: chunk boundaries change what the model sees
+CHUNKING_SIGNATURE = f"{ANALYSIS_CHUNK_MIN_SECONDS}:{ANALYSIS_CHUNK_TARGET_SECONDS}:{ANALYSIS_CHUNK_MAX_SECONDS}"
+
+_executor = ThreadPoolExecutor(max_workers=ANALYSIS_CHUNK_WORKERS, thread_name_prefix="yodel-chunk")
+
+
+def find_split_points(samples, sample_rate):
+    """
+    Picks sample indices to cut a long recording at, preferring pauses between phrases.
+
+    Each cut is placed in the window between ANALYSIS_CHUNK_TARGET_SECONDS and
+    ANALYSIS_CHUNK_MAX_SECONDS after the previous one: in the middle of the
+    longest silent run there, or at the quietest frame when nobody stops to
+    breathe.
+    """
+    frame = max(1, int(SPLIT_FRAME_SECONDS * sample_rate))
+    n_frames = len(samples) // frame
+    if n_frames == 0:
+        return []
+
+    rms = np.sqrt(np.mean(samples[:n_frames * frame].reshape(n_frames, frame) ** 2, axis=1))
+    silent = rms < max(rms.max(), 1e-10) * 10 ** (-SPLIT_SILENCE_DB / 20.0)
+
+    target = int(ANALYSIS_CHUNK_TARGET_SECONDS / SPLIT_FRAME_SECONDS)
+    maximum = max(target + 1, int(ANALYSIS_CHUNK_MAX_SECONDS / SPLIT_FRAME_SECONDS))
+
+    cuts = []
+    start = 0
+    while n_frames - start > maximum:
+        lo, hi = start + target, start + maximum
+        window = silent[lo:hi]
+
+        best_run, best_length, run_start = None, 0, None
+        for i, is_silent in enumerate(np.append(window, False)):
+            if is_silent and run_start is None:
+                run_start = i
+            elif not is_silent and run_start is not None:
+                if i - run_start > best_length:
+                    best_run, best_length = run_start, i - run_start
+                run_start = None
+
+        if best_run is not None:
+            cut = lo + best_run + best_length // 2
+        else:
+            cut = lo + int(np.argmin(rms[lo:hi]))
+        cuts.append(cut * frame)
+        start = cut
+    return cuts
+
+
+def split_wav(wav_data):
+    """
+    Splits a WAV recording into chunks if it is longer than ANALYSIS_CHUNK_MIN_SECONDS.
+
+    Returns:
+        A list of (offset_seconds, wav_bytes) tuples, or None when the recording
+        is short enough to analyze in one request
+    """
+    if parse_wav_header(wav_data).duration_seconds <= ANALYSIS_CHUNK_MIN_SECONDS:
+        return None
+
+    samples, sample_rate = decode_wav(wav_data)
+    bounds = [0] + find_split_points(samples, sample_rate) + [len(samples)]
+    return [
+        (start / sample_rate, encode_wav(samples[start:end], sample_rate))
+        for start, end in zip(bounds, bounds[1:])
+    ]
+
+
+def merge_analyses(chunk_results, total_seconds):
+    """
+    Merges per-chunk yodelAnalysis results into one.
+
+    Args:
+        chunk_results: (offset_seconds, analysis dict) tuples in recording order
+        total_seconds: Length of the full recording, for the audio source range
+
+    Returns:
+        A single analysis with every chunk's timestamps moved onto the full
+        recording's timeline, phrases renumbered from 1 and syllables summed
+    """
+    phrases = []
+    total_syllables = 0
+    for offset_seconds, analysis in chunk_results:
+        root = shift_analysis_timestamps(analysis, offset_seconds).get("yodelAnalysis") or {}
+        chunk_phrases = [p for p in root.get("phrases") or [] if isinstance(p, dict)]
+        phrases.extend(chunk_phrases)
+
+        syllables = root.get("totalYodelSyllables")
+        if not isinstance(syllables, int):
+            syllables = sum(p.get("yodelSyllablesInPhrase", 0) for p in chunk_phrases)
+        total_syllables += syllables
+
+    for number, phrase in enumerate(phrases, 1):
+        phrase["phraseNumber"] = number
+
+    return {
+        "yodelAnalysis": {
+            "video / audioSource": format_source_range(0.0, total_seconds),
+            "totalYodelSyllables": total_syllables,
+            "phrases": phrases,
+        }
+    }
+
+
+def analyze_in_chunks(chunks, analyze_chunk, total_seconds):
+    """
+    Runs analyze_chunk on every chunk concurrently and merges the results.
+
+    At most ANALYSIS_CHUNK_WORKERS chunk requests are in flight at once, shared
+    across all requests being served. If any chunk fails, its exception is raised.
+
+    Args:
+        chunks: (offset_seconds, wav_bytes) tuples from split_wav
+        analyze_chunk: Callable taking wav bytes and returning an analysis dict
+        total_seconds: Length of the full recording
+    """
+    logger.info(f"Analyzing {len(chunks)} chunks with up to {ANALYSIS_CHUNK_WORKERS} in flight")
+    futures = [(offset, _executor.submit(analyze_chunk, data)) for offset, data in chunks]
+    return merge_analyses([(offset, future.result()) for offset, future in futures], total_seconds)
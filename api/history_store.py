@@ -0,0 +1,215 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HISTORY_STORE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "history.sqlite3")
+
+# How many recent performances are kept in a user's summary (and shown to the model)
+HISTORY_RECENT_PERFORMANCES = int(os.environ.get("HISTORY_RECENT_PERFORMANCES", 5))
+# Distinct improvement areas tracked per user; the least frequent are dropped beyond this
+HISTORY_MAX_AREAS = int(os.environ.get("HISTORY_MAX_AREAS", 20))
+
+# Metrics whose scores are aggregated, in the order they appear in the prompt
+TRACKED_METRICS = ("pitchAccuracy", "timingAccuracy", "yodelBreakQuality")
+
+USER_ID_PATTERN = re.compile(r"^[A-Za-z0-9_.:-]{1,128}$")
+
+
+def valid_user_id(user_id):
+    return isinstance(user_id, str) and bool(USER_ID_PATTERN.match(user_id))
+
+
+def compact_performance(comparison, reference_id=None, timestamp=None):
+    """
+    Reduces a yodelComparison result to the fields the comparison prompt uses,
+    in the same shape clients send as past_performances.
+    """
+    data = comparison.get("yodelComparison", {}) if isinstance(comparison, dict) else {}
+    metrics = data.get("metrics") or {}
+    feedback = data.get("feedback") or {}
+    entry = {
+        "yodelComparison": {
+            "overallScore": data.get("overallScore"),
+            "metrics": {name: {"score": (metrics.get(name) or {}).get("score")} for name in TRACKED_METRICS},
+            "feedback": {
+                "areasForImprovement": [
+                    {"area": area.get("area", "")}
+                    for area in (feedback.get("areasForImprovement") or [])[:3]
+                    if isinstance(area, dict)
+                ],
+            },
+        },
+        "timestamp": timestamp,
+    }
+    if reference_id is not None:
+        entry["reference_id"] = str(reference_id)
+    return entry
+
+
+class UserHistory:
+    """
+    A user's precomputed performance summary.
+
+    Attributes:
+        count: Total number of recorded comparisons
+        recent: The last few performances, oldest first, shaped like past_performances
+        averages: All-time average score for "overallScore" and each tracked metric
+        recent_averages: The same averages over `recent` only
+        recurring_areas: (area, times mentioned) pairs, most frequent first
+    """
+
+    def __init__(self, user_id, summary):
+        self.user_id = user_id
+        self.count = summary["count"]
+        self.recent = summary["recent"]
+        self.averages = {
+            name: round(total / scored, 1)
+            for name, (total, scored) in summary["totals"].items() if scored
+        }
+        self.recent_averages = {}
+        for name in summary["totals"]:
+            scores = [_score(entry, name) for entry in self.recent]
+            scores = [s for s in scores if s is not None]
+            if scores:
+                self.recent_averages[name] = round(sum(scores) / len(scores), 1)
+        self.recurring_areas = sorted(summary["areas"].items(), key=lambda item: (-item[1], item[0]))
+        self.updated_at = summary.get("updated_at")
+
+    def to_dict(self):
+        return {
+            "user_id": self.user_id,
+            "count": self.count,
+            "averages": self.averages,
+            "recent_averages": self.recent_averages,
+            "recurring_areas": [{"area": area, "count": count} for area, count in self.recurring_areas],
+            "recent": self.recent,
+            "updated_at": self.updated_at,
+        }
+
+
+def _score(entry, name):
+    data = entry.get("yodelComparison", {})
+    score = data.get("overallScore") if name == "overallScore" else data.get("metrics", {}).get(name, {}).get("score")
+    return score if isinstance(score, (int, float)) and not isinstance(score, bool) else None
+
+
+def _empty_summary():
+    return {
+        "count": 0,
+        "recent": [],
+        "totals": {name: [0.0, 0] for name in ("overallScore",) + TRACKED_METRICS},
+        "areas": {},
+    }
+
+
+class HistoryStore:
+    """
+    SQLite-backed performance history, keyed by user id.
+
+    Every comparison is kept in a performances table, but the prompt context
+    only ever reads the user's summary row: the last few performances plus
+    running score totals and improvement-area counts, updated in the same
+    transaction that records a performance. Building the context is therefore
+    a single primary-key lookup however long a singer's history gets.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.environ.get("HISTORY_STORE_PATH", DEFAULT_HISTORY_STORE_PATH)
+        self._local = threading.local()
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS performances ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT NOT NULL, reference_id TEXT, "
+            "overall_score REAL, result TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS performances_user ON performances (user_id, id)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS user_summaries ("
+            "user_id TEXT PRIMARY KEY, summary TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+
+    def get(self, user_id):
+        """Returns the user's UserHistory, or None if nothing has been recorded for them."""
+        row = self._connection().execute(
+            "SELECT summary, updated_at FROM user_summaries WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        summary = json.loads(row[0])
+        summary["updated_at"] = row[1]
+        return UserHistory(user_id, summary)
+
+    def record(self, user_id, comparison, reference_id=None):
+        """
+        Stores a comparison result and folds it into the user's summary.
+
+        Returns:
+            The updated UserHistory
+        """
+        now = time.time()
+        entry = compact_performance(comparison, reference_id, timestamp=now)
+        conn = self._connection()
+        # BEGIN IMMEDIATE takes the write lock up front, so two workers recording
+        # for the same user can't both read the old summary
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT INTO performances (user_id, reference_id, overall_score, result, created_at) VALUES (?, ?, ?, ?, ?)",
+                (user_id, entry.get("reference_id"), _score(entry, "overallScore"), json.dumps(comparison), now),
+            )
+            row = conn.execute("SELECT summary FROM user_summaries WHERE user_id = ?", (user_id,)).fetchone()
+            summary = json.loads(row[0]) if row is not None else _empty_summary()
+            _fold(summary, entry)
+            conn.execute(
+                "INSERT OR REPLACE INTO user_summaries (user_id, summary, updated_at) VALUES (?, ?, ?)",
+                (user_id, json.dumps(summary), now),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        summary["updated_at"] = now
+        return UserHistory(user_id, summary)
+
+    def stats(self):
+        conn = self._connection()
+        users = conn.execute("SELECT COUNT(*) FROM user_summaries").fetchone()[0]
+        performances = conn.execute("SELECT COUNT(*) FROM performances").fetchone()[0]
+        return {"users": users, "performances": performances}
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit mode; record() manages its own transaction
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+
+def _fold(summary, entry):
+    summary["count"] += 1
+    summary["recent"] = (summary["recent"] + [entry])[-HISTORY_RECENT_PERFORMANCES:]
+
+    for name, totals in summary["totals"].items():
+        score = _score(entry, name)
+        if score is not None:
+            totals[0] += score
+            totals[1] += 1
+
+    areas = summary["areas"]
+    for area in entry["yodelComparison"]["feedback"]["areasForImprovement"]:
+        name = " ".join(area["area"].split()).lower()
+        if name:
+            areas[name] = areas.get(name, 0) + 1
+    if len(areas) > HISTORY_MAX_AREAS:
+        kept = sorted(areas.items(), key=lambda item: (-item[1], item[0]))[:HISTORY_MAX_AREAS]
+        summary["areas"] = dict(kept)
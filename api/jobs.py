@@ -0,0 +1,200 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_JOB_STORE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "jobs.sqlite3")
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+FINISHED_STATES = (JOB_SUCCEEDED, JOB_FAILED)
+
+# Identifies this boot of the service. Jobs recorded under another boot were
+# interrupted by a restart whatever their PIDs say, since PIDs are reused when
+# a container restarts. start.sh sets it once per container so all gunicorn
+# workers share it; otherwise each process gets its own.
+INSTANCE_ID = os.environ.get("JOB_INSTANCE_ID") or uuid.uuid4().hex
+
+
+class JobQueueFull(RuntimeError):
+    """Raised when the executor already holds its maximum number of pending jobs."""
+
+
+class JobStore:
+    """
+    SQLite-backed job state shared by all workers.
+
+    Job rows outlive the process that created them, so a client polling after a
+    worker restart still gets the result (or learns the job was interrupted).
+    """
+
+    def __init__(self, path=None, ttl_seconds=None):
+        self.path = path or os.environ.get("JOB_STORE_PATH", DEFAULT_JOB_STORE_PATH)
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else int(os.environ.get("JOB_TTL_SECONDS", 24 * 3600))
+        self._local = threading.local()
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL, "
+                "result TEXT, error TEXT, owner_pid INTEGER, owner_instance TEXT, "
+                "created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(jobs)")]
+            if "owner_instance" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN owner_instance TEXT")
+
+    def create(self, kind):
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, kind, status, owner_pid, owner_instance, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, kind, JOB_QUEUED, os.getpid(), INSTANCE_ID, now, now),
+            )
+        return job_id
+
+    def update(self, job_id, status, result=None, error=None):
+        with self._connection() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, updated_at = ? WHERE id = ?",
+                (status, json.dumps(result) if result is not None else None, error, time.time(), job_id),
+            )
+
+    def get(self, job_id):
+        """Returns the job as a dict, or None if it is unknown or expired."""
+        with self._connection() as conn:
+            row = conn.execute(
+                "SELECT id, kind, status, result, error, created_at, updated_at FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+
+        job = {
+            "job_id": row[0],
+            "kind": row[1],
+            "status": row[2],
+            "created_at": row[5],
+            "updated_at": row[6],
+        }
+        if row[3] is not None:
+            job["result"] = json.loads(row[3])
+        if row[4] is not None:
+            job["error"] = row[4]
+        return job
+
+    def recover_orphans(self):
+        """
+        Fails unfinished jobs started by an earlier boot (see INSTANCE_ID), or
+        by a worker process of this one that no longer exists.
+
+        Audio is not persisted, so an interrupted job cannot be resumed; marking it
+        failed lets pollers resubmit instead of waiting forever.
+        """
+        now = time.time()
+        with self._connection() as conn:
+            conn.execute("DELETE FROM jobs WHERE updated_at < ?", (now - self.ttl_seconds,))
+            rows = conn.execute(
+                "SELECT id, owner_pid, owner_instance FROM jobs WHERE status IN (?, ?)", (JOB_QUEUED, JOB_RUNNING)
+            ).fetchall()
+            orphaned = [
+                job_id for job_id, pid, instance in rows
+                if instance != INSTANCE_ID or not _process_alive(pid)
+            ]
+            conn.executemany(
+                "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ?",
+                [(JOB_FAILED, "Worker restarted before the job finished", now, job_id) for job_id in orphaned],
+            )
+        if orphaned:
+            logger.warning(f"Marked {len(orphaned)} orphaned job(s) as failed")
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+
+class JobRunner:
+    """
+    Runs analysis and comparison jobs on a bounded thread pool.
+
+    At most max_workers jobs run at once and at most max_pending are accepted
+    (running plus queued); beyond that submit() raises JobQueueFull.
+    """
+
+    def __init__(self, store, max_workers=None, max_pending=None):
+        self.store = store
+        self.max_workers = max_workers or int(os.environ.get("JOB_WORKERS", 4))
+        self.max_pending = max_pending or int(os.environ.get("JOB_MAX_PENDING", 32))
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="yodel-job")
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def submit(self, kind, fn, *args, **kwargs):
+        """
+        Queues fn(*args, **kwargs) and returns the new job id immediately.
+
+        fn must return a JSON-serializable result; any exception it raises is
+        recorded as the job's error.
+        """
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise JobQueueFull(f"{self._pending} jobs already pending")
+            self._pending += 1
+
+        try:
+            job_id = self.store.create(kind)
+            self._executor.submit(self._run, job_id, kind, fn, args, kwargs)
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+            raise
+        logger.info(f"[job {job_id}] Queued {kind} job")
+        return job_id
+
+    def pending(self):
+        with self._lock:
+            return self._pending
+
+    def _run(self, job_id, kind, fn, args, kwargs):
+        start_time = time.time()
+        try:
+            self.store.update(job_id, JOB_RUNNING)
+            result = fn(*args, **kwargs)
+            self.store.update(job_id, JOB_SUCCEEDED, result=result)
+            logger.info(f"[job {job_id}] {kind} job succeeded in {time.time() - start_time:.2f}s")
+        except Exception as e:
+            logger.error(f"[job {job_id}] {kind} job failed: {str(e)}", exc_info=True)
+            self.store.update(job_id, JOB_FAILED, error=f"{type(e).__name__}: {str(e)}")
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+
+def _process_alive(pid):
+    if not pid:
+        return False
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
@@ -0,0 +1,144 @@
+import json
+
+WILDCARD = "*"
+
+
+def path_matches(path, pattern):
+    """True if path (a tuple of object keys and array indices) matches pattern; "*" matches any one step."""
+    return len(path) == len(pattern) and all(p == WILDCARD or p == step for step, p in zip(path, pattern))
+
+
+def iter_matches(document, patterns, path=()):
+    """
+    Yields (path, value) for every value in an already-parsed document whose
+    path matches one of patterns.
+
+    Values are yielded in the order IncrementalJsonParser would complete them
+    (children before their parents), so a cached result can be replayed as if
+    it were streamed.
+    """
+    if isinstance(document, dict):
+        for key, value in document.items():
+            yield from iter_matches(value, patterns, path + (key,))
+    elif isinstance(document, list):
+        for index, value in enumerate(document):
+            yield from iter_matches(value, patterns, path + (index,))
+    if any(path_matches(path, pattern) for pattern in patterns):
+        yield path, document
+
+
+class IncrementalJsonParser:
+    """
+    Parses a JSON document that arrives in pieces and reports values as soon as
+    they close.
+
+    Only values whose path matches one of the patterns are decoded; a pattern is
+    a tuple of object keys and array indices with "*" as a wildcard, e.g.
+    ("yodelAnalysis", "phrases", "*") for every phrase. The empty pattern ()
+    matches the whole document once it is complete.
+    """
+
+    def __init__(self, patterns):
+        self.patterns = [tuple(pattern) for pattern in patterns]
+        self.text = ""
+        self._pos = 0
+        # One frame per open container: [kind, current key or index, expecting_key]
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._string_is_key = False
+        self._string_start = None
+        self._scalar_start = None
+        # (start offset, depth, path) of every open value we will report
+        self._captures = []
+        self.complete = False
+
+    def feed(self, chunk):
+        """
+        Consumes the next piece of text and returns a list of (path, value)
+        pairs for the matching values it completed.
+        """
+        self.text += chunk
+        completed = []
+        text = self.text
+
+        for i in range(self._pos, len(text)):
+            c = text[i]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    if self._string_is_key:
+                        self._stack[-1][1] = json.loads(text[self._string_start:i + 1])
+                    else:
+                        self._end_value(i + 1, completed)
+                continue
+
+            if self._scalar_start is not None and c in " \t\r\n,}]":
+                self._scalar_start = None
+                self._end_value(i, completed)
+
+            if c in " \t\r\n":
+                continue
+            if c == '"':
+                self._in_string = True
+                self._string_start = i
+                self._string_is_key = bool(self._stack) and self._stack[-1][0] == "object" and self._stack[-1][2]
+                if not self._string_is_key:
+                    self._begin_value(i)
+            elif c in "{[":
+                self._begin_value(i)
+                self._stack.append(["object", None, True] if c == "{" else ["array", 0, False])
+            elif c in "}]":
+                self._stack.pop()
+                self._end_value(i + 1, completed)
+            elif c == ":":
+                self._stack[-1][2] = False
+            elif c == ",":
+                frame = self._stack[-1]
+                if frame[0] == "object":
+                    frame[2] = True
+                else:
+                    frame[1] += 1
+            elif self._scalar_start is None:
+                self._scalar_start = i
+                self._begin_value(i)
+
+        self._pos = len(text)
+        return completed
+
+    def close(self):
+        """
+        Finishes parsing and returns any values completed by the end of input
+        (a bare top-level number, for instance).
+
+        Raises:
+            json.JSONDecodeError: If the document is incomplete
+        """
+        completed = []
+        if self._scalar_start is not None and not self._stack:
+            self._scalar_start = None
+            self._end_value(len(self.text), completed)
+        if not self.complete:
+            raise json.JSONDecodeError("Unterminated JSON document", self.text, len(self.text))
+        return completed
+
+    def _path(self):
+        return tuple(frame[1] for frame in self._stack)
+
+    def _begin_value(self, start):
+        path = self._path()
+        if any(path_matches(path, pattern) for pattern in self.patterns):
+            self._captures.append((start, len(self._stack), path))
+
+    def _end_value(self, end, completed):
+        depth = len(self._stack)
+        if depth == 0:
+            self.complete = True
+        if self._captures and self._captures[-1][1] == depth:
+            start, _, path = self._captures.pop()
+            completed.append((path, json.loads(self.text[start:end])))
@@ -0,0 +1,265 @@
+"""
+End-to-end load test for /analyze-yodel and /compare-yodel.
+
+Starts the app under gunicorn with the fake model backend (a local stub with
+configurable latency) for every worker/thread configuration in the sweep, then
+drives it with closed-loop virtual singers at each concurrency level and
+reports throughput, latency percentiles and error rate:
+
+    python loadtest.py --workers 1 --threads 8 --concurrency 1,4,8,16,32 --model-latency 20
+
+Use --url to aim at an already running server instead (the worker/thread sweep
+is skipped, and that server decides which model backend is used). --server async
+runs the ASGI app (asgi.py) under uvicorn workers instead of the Flask app; its
+--threads only serve the routes that go through Flask.
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+import requests
+from contextlib import nullcontext
+from synthetic_audio import synthetic_wav
+
+API_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class TrafficMix:
+    """
+    Realistic request bodies: raw WAV analyze uploads and multipart compares
+    against a registered reference, the way the React app sends them. Takes are
+    drawn from a pool of distinct recordings so the result cache doesn't help.
+    """
+
+    def __init__(self, compare_ratio, take_seconds, pool_size=8):
+        self.compare_ratio = compare_ratio
+        self.takes = [synthetic_wav(seconds=take_seconds, seed=seed) for seed in range(pool_size)]
+
+    def next_request(self, rng):
+        take = rng.choice(self.takes)
+        if rng.random() < self.compare_ratio:
+            return "compare", "/compare-yodel", {
+                "files": {"user_wav": ("take.wav", take, "audio/wav")},
+                "data": {"reference_id": "1", "user_info": json.dumps({"experience_level": "intermediate"})},
+            }
+        return "analyze", "/analyze-yodel", {"data": take, "headers": {"Content-Type": "audio/wav"}}
+
+
+def run_level(base_url, mix, concurrency, duration, timeout, seed=0):
+    """
+    Runs `concurrency` virtual singers for `duration` seconds; each sends its
+    next request as soon as the previous one finished.
+
+    Returns:
+        A dict of per-kind and overall results for this concurrency level
+    """
+    samples = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def singer(index):
+        rng = random.Random(seed * 1000 + index)
+        session = requests.Session()
+        session.headers["X-Cache-Bypass"] = "1"
+        while time.perf_counter() < deadline:
+            kind, path, kwargs = mix.next_request(rng)
+            start = time.perf_counter()
+            try:
+                response = session.post(base_url + path, timeout=timeout, **kwargs)
+                error = None if response.status_code < 400 else f"HTTP {response.status_code}"
+            except requests.Timeout:
+                error = "timeout"
+            except requests.RequestException as e:
+                error = type(e).__name__
+            with lock:
+                samples.append((kind, time.perf_counter() - start, error))
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=singer, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    report = {"concurrency": concurrency, "elapsed_seconds": round(elapsed, 2)}
+    for kind in ("all", "analyze", "compare"):
+        selected = [s for s in samples if kind == "all" or s[0] == kind]
+        ok = sorted(latency * 1000 for _, latency, error in selected if error is None)
+        errors = {}
+        for _, _, error in selected:
+            if error is not None:
+                errors[error] = errors.get(error, 0) + 1
+        report[kind] = {
+            "requests": len(selected),
+            "throughput_rps": round(len(ok) / elapsed, 3) if elapsed else 0.0,
+            "p50_ms": _round(percentile(ok, 0.50)),
+            "p95_ms": _round(percentile(ok, 0.95)),
+            "p99_ms": _round(percentile(ok, 0.99)),
+            "error_rate": round(sum(errors.values()) / len(selected), 4) if selected else 0.0,
+            "errors": errors,
+        }
+    return report
+
+
+def _round(value):
+    return round(value, 1) if value is not None else None
+
+
+# Admission limits for --server async, where a model call no longer holds a thread
+ASYNC_ADMISSION_LIMITS = {
+    "ADMISSION_MAX_CONCURRENCY": "48",
+    "ADMISSION_ANALYZE_MAX_CONCURRENCY": "32",
+    "ADMISSION_COMPARE_MAX_CONCURRENCY": "32",
+}
+
+
+class LocalServer:
+    """The app under gunicorn with the fake model backend, in a scratch directory."""
+
+    def __init__(self, workers, threads, model_latency, model_jitter, timeout, model_error_rate=0.0, server="sync"):
+        self.workers = workers
+        self.threads = threads
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.scratch = tempfile.mkdtemp(prefix="yodel-load-")
+        with open(os.path.join(self.scratch, "1.wav"), "wb") as f:
+            f.write(synthetic_wav(seconds=20, seed=1000))
+
+        self.env = dict(
+            os.environ,
+            MODEL_BACKEND="fake",
+            MODEL_FAKE_LATENCY_SECONDS=str(model_latency),
+            MODEL_FAKE_JITTER_SECONDS=str(model_jitter),
+            MODEL_FAKE_ERROR_RATE=str(model_error_rate),
+            RESULT_CACHE_PATH="",
+            JOB_STORE_PATH=os.path.join(self.scratch, "jobs.sqlite3"),
+            REFERENCE_STEPS_DIRS=self.scratch,
+        )
+        self.command = [
+            sys.executable, "-m", "gunicorn", "--chdir", API_DIR,
+            "--bind", f"127.0.0.1:{self.port}",
+            "--workers", str(workers), "--timeout", str(timeout), "--log-level", "warning",
+        ]
+        if server == "async":
+            self.env["ASGI_SYNC_THREADS"] = str(threads)
+            for name, value in ASYNC_ADMISSION_LIMITS.items():
+                self.env.setdefault(name, value)
+            self.command += ["--worker-class", "uvicorn.workers.UvicornWorker", "asgi:app"]
+        else:
+            self.command += ["--threads", str(threads), "api:app"]
+        self.process = None
+
+    def __enter__(self):
+        self.process = subprocess.Popen(self.command, env=self.env, cwd=self.scratch)
+        for _ in range(600):
+            try:
+                if requests.get(self.url + "/health", timeout=1).ok:
+                    return self
+            except requests.RequestException:
+                pass
+            if self.process.poll() is not None:
+                raise RuntimeError(f"gunicorn exited with status {self.process.returncode}")
+            time.sleep(0.1)
+        raise RuntimeError("Server did not become healthy within 60s")
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+def print_table(rows):
+    header = f"{'workers':>7} {'threads':>7} {'conc':>5} {'kind':>8} {'reqs':>6} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}"
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        for kind in ("all", "analyze", "compare"):
+            stats = row[kind]
+            if not stats["requests"]:
+                continue
+            print(
+                f"{str(row['workers']):>7} {str(row['threads']):>7} {row['concurrency']:>5} {kind:>8} {stats['requests']:>6} "
+                f"{stats['throughput_rps']:>8.2f} {_cell(stats['p50_ms'])} {_cell(stats['p95_ms'])} {_cell(stats['p99_ms'])} "
+                f"{stats['error_rate']:>7.1%}"
+            )
+
+
+def _cell(value):
+    return f"{value:>9.0f}" if value is not None else f"{'-':>9}"
+
+
+def parse_list(value):
+    return [int(v) for v in value.split(",") if v]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrency sweep against /analyze-yodel and /compare-yodel.")
+    parser.add_argument("--server", choices=("sync", "async"), default="sync", help="Serve the Flask app (sync) or the ASGI app (async)")
+    parser.add_argument("--url", help="Test an already running server instead of starting gunicorn")
+    parser.add_argument("--workers", type=parse_list, default=[1], help="Comma-separated gunicorn worker counts to sweep")
+    parser.add_argument("--threads", type=parse_list, default=[8], help="Comma-separated gunicorn thread counts to sweep")
+    parser.add_argument("--concurrency", type=parse_list, default=[1, 2, 4, 8, 16, 32], help="Comma-separated numbers of concurrent singers")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds per concurrency level")
+    parser.add_argument("--model-latency", type=float, default=20.0, help="Seconds the stub model takes per call")
+    parser.add_argument("--model-jitter", type=float, default=5.0, help="Random +/- seconds added to the stub latency")
+    parser.add_argument("--model-error-rate", type=float, default=0.0, help="Fraction of stub model calls that fail with a 503")
+    parser.add_argument("--compare-ratio", type=float, default=0.8, help="Fraction of requests that are compares")
+    parser.add_argument("--take-seconds", type=float, default=15.0, help="Length of the synthetic user takes")
+    parser.add_argument("--timeout", type=int, default=120, help="Client timeout and gunicorn --timeout, in seconds")
+    parser.add_argument("--output", help="Where to write the JSON report (default: cache/loadtests/<timestamp>.json)")
+    args = parser.parse_args()
+
+    mix = TrafficMix(args.compare_ratio, args.take_seconds)
+    rows = []
+    if args.url:
+        configurations = [(None, None)]
+    else:
+        configurations = [(w, t) for w in args.workers for t in args.threads]
+
+    for workers, threads in configurations:
+        if args.url:
+            server_context = nullcontext()
+        else:
+            server_context = LocalServer(
+                workers, threads, args.model_latency, args.model_jitter, args.timeout, args.model_error_rate,
+                args.server,
+            )
+        with server_context as server:
+            server_url = server.url if server is not None else args.url.rstrip("/")
+            for concurrency in args.concurrency:
+                print(f"workers={workers} threads={threads} concurrency={concurrency} ...", file=sys.stderr)
+                row = run_level(server_url, mix, concurrency, args.duration, args.timeout)
+                row.update(workers=workers, threads=threads)
+                rows.append(row)
+
+    print_table(rows)
+    output = args.output or os.path.join(API_DIR, "cache", "loadtests", f"{time.strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({
+            "settings": {k: v for k, v in vars(args).items() if k != "output"},
+            "results": rows,
+        }, f, indent=2)
+    print(f"\nResults written to {output}")
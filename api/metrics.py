@@ -0,0 +1,191 @@
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+
+# Seconds; covers sub-millisecond stages up to multi-minute model calls
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+BYTES_BUCKETS = (1 << 10, 1 << 14, 1 << 16, 1 << 18, 1 << 20, 1 << 22, 1 << 24, 1 << 26)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_sample(key, value))
+        return lines
+
+    def _render_sample(self, key, value):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    """Fixed-bucket histogram; observe() is a bisect plus a few additions under a lock."""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observes the wall-clock seconds spent in the with block, even if it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _render_sample(self, key, value):
+        counts, total, count = value
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += bucket_count
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', _format_value(float(bound))))} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    """
+    Holds the process's metrics and renders them in the Prometheus text format.
+
+    Collectors are callables run at scrape time to refresh gauges that mirror
+    state owned elsewhere (cache sizes, queue depth).
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collector):
+        self._collectors.append(collector)
+
+    def render(self):
+        for collector in self._collectors:
+            collector()
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+REQUESTS_IN_FLIGHT = REGISTRY.gauge(
+    "yodelstar_requests_in_flight", "Requests currently being handled.", ["endpoint"])
+REQUEST_SECONDS = REGISTRY.histogram(
+    "yodelstar_request_duration_seconds", "Time to produce a response, by endpoint and status.", ["endpoint", "status"])
+REQUEST_BYTES = REGISTRY.histogram(
+    "yodelstar_request_payload_bytes", "Request body size.", ["endpoint"], buckets=BYTES_BUCKETS)
+RESPONSE_BYTES = REGISTRY.histogram(
+    "yodelstar_response_payload_bytes", "Response body size (unknown for streams).", ["endpoint"], buckets=BYTES_BUCKETS)
+STAGE_SECONDS = REGISTRY.histogram(
+    "yodelstar_stage_duration_seconds",
+    "Time spent in each stage of an analysis or comparison: decode, preprocess, prompt_build, upstream, validate, parse, serialize.",
+    ["operation", "stage"])
+UPSTREAM_SECONDS = REGISTRY.histogram(
+    "yodelstar_upstream_duration_seconds", "Model call latency, by request template, model and backend.", ["template", "model", "backend"])
+ERRORS = REGISTRY.counter(
+    "yodelstar_errors_total", "Failed requests by endpoint and exception type.", ["endpoint", "type"])
+UPSTREAM_EVENTS = REGISTRY.counter(
+    "yodelstar_upstream_events_total",
+    "Model call resilience events: retry, hedge, timeout, rejected (circuit open) and circuit_opened.",
+    ["event"])
+MODEL_RESPONSES = REGISTRY.counter(
+    "yodelstar_model_responses_total",
+    "Validated model responses by template and outcome: valid, repaired, reasked (needed a follow-up call) or invalid.",
+    ["template", "outcome"])
+ADMISSION_WAIT_SECONDS = REGISTRY.histogram(
+    "yodelstar_admission_wait_seconds", "Time model work spent queued for a slot, by work class (analyze, compare, batch).", ["work_class"])
+ADMISSION_SHED = REGISTRY.counter(
+    "yodelstar_admission_shed_total", "Model work rejected with 503 instead of queued, by work class and reason (queue_full, deadline).",
+    ["work_class", "reason"])
+RESULT_OUTCOMES = REGISTRY.counter(
+    "yodelstar_results_total", "Results served, by operation, cache outcome and source (model or local).", ["operation", "cache", "source"])
@@ -0,0 +1,295 @@
+import os
+import json
+import time
+import random
+import asyncio
+import hashlib
+import logging
+import tempfile
+import threading
+from timestamps import format_source_range, format_timestamp
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RECORDINGS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "recordings")
+
+# Pieces a fake or replayed response is split into when streamed
+STREAM_CHUNK_CHARS = 256
+
+
+class ReplayMiss(LookupError):
+    """Raised in replay mode when no recording exists for a request."""
+
+
+class FakeUpstreamError(RuntimeError):
+    """A simulated 503 from the fake backend, for exercising retries and the circuit breaker."""
+
+    code = 503
+
+
+def request_fingerprint(template, contents):
+    """
+    Stable SHA-256 of everything that determines a model response: the model,
+    the template and every text and inline-data part of the request.
+    """
+    digest = hashlib.sha256()
+    digest.update(f"{template.name}\0{template.model}\0{template.thinking_budget}\0".encode())
+    for content in contents:
+        for part in content.parts:
+            if part.text is not None:
+                digest.update(b"text\0" + part.text.encode())
+            elif part.inline_data is not None:
+                digest.update(f"blob\0{part.inline_data.mime_type}\0".encode())
+                digest.update(part.inline_data.data)
+    return digest.hexdigest()
+
+
+def chunk_text(text):
+    return [text[i:i + STREAM_CHUNK_CHARS] for i in range(0, len(text), STREAM_CHUNK_CHARS)] or [""]
+
+
+class GenAIBackend:
+    """The live Gemini API, through one genai.Client shared by every thread."""
+
+    name = "genai"
+
+    def __init__(self, api_key):
+        self.api_key = api_key
+        self._client = None
+        self._client_lock = threading.Lock()
+
+    @property
+    def available(self):
+        return bool(self.api_key)
+
+    @property
+    def client_created(self):
+        return self._client is not None
+
+    def warm_up(self):
+        if self.available:
+            self.client()
+
+    def client(self):
+        """Returns the shared genai.Client, creating it on first use."""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    start_time = time.perf_counter()
+                    from google import genai
+                    self._client = genai.Client(api_key=self.api_key)
+                    logger.info(f"Gemini client created in {(time.perf_counter() - start_time) * 1000:.1f} ms")
+        return self._client
+
+    def generate(self, template, contents):
+        response = self.client().models.generate_content(
+            model=template.model,
+            contents=contents,
+            config=template.config,
+        )
+        return response.text
+
+    async def agenerate(self, template, contents):
+        """Coroutine version of generate(), on the client's async (client.aio) transport."""
+        response = await self.client().aio.models.generate_content(
+            model=template.model,
+            contents=contents,
+            config=template.config,
+        )
+        return response.text
+
+    def generate_stream(self, template, contents):
+        for chunk in self.client().models.generate_content_stream(
+            model=template.model,
+            contents=contents,
+            config=template.config,
+        ):
+            if chunk.text:
+                yield chunk.text
+
+
+class FakeBackend:
+    """
+    Offline stand-in for the model: returns schema-valid JSON after a
+    configurable delay, without network access or an API key.
+
+    Output is derived from the request fingerprint, so the same request always
+    gets the same answer. Meant for load tests, benchmarks and UI work, not
+    for judging yodels. MODEL_FAKE_ERROR_RATE makes that fraction of calls
+    fail with a 503 after the usual delay.
+    """
+
+    name = "fake"
+    available = True
+    client_created = False
+
+    def __init__(self, latency_seconds=None, jitter_seconds=None, error_rate=None):
+        self.latency_seconds = latency_seconds if latency_seconds is not None else float(os.environ.get("MODEL_FAKE_LATENCY_SECONDS", 2.0))
+        self.jitter_seconds = jitter_seconds if jitter_seconds is not None else float(os.environ.get("MODEL_FAKE_JITTER_SECONDS", 0.5))
+        self.error_rate = error_rate if error_rate is not None else float(os.environ.get("MODEL_FAKE_ERROR_RATE", 0))
+
+    def warm_up(self):
+        pass
+
+    def generate(self, template, contents):
+        rng = random.Random(request_fingerprint(template, contents))
+        time.sleep(self._delay(rng))
+        return self._respond(template, rng)
+
+    async def agenerate(self, template, contents):
+        rng = random.Random(request_fingerprint(template, contents))
+        await asyncio.sleep(self._delay(rng))
+        return self._respond(template, rng)
+
+    def _respond(self, template, rng):
+        # Failures are drawn independently of the fingerprint so a retry can succeed
+        if self.error_rate and random.random() < self.error_rate:
+            raise FakeUpstreamError("Simulated upstream failure")
+        return json.dumps(fake_value(template.json_schema, rng))
+
+    def generate_stream(self, template, contents):
+        rng = random.Random(request_fingerprint(template, contents))
+        text = json.dumps(fake_value(template.json_schema, rng), indent=2)
+        pieces = chunk_text(text)
+        for piece in pieces:
+            time.sleep(self._delay(rng) / len(pieces))
+            yield piece
+
+    def _delay(self, rng):
+        return max(0.0, self.latency_seconds + rng.uniform(-self.jitter_seconds, self.jitter_seconds))
+
+
+def fake_value(schema, rng, key="", clock=None):
+    """
+    Generates a random value that validates against a JSON schema, with a few
+    hints taken from the property name.
+
+    Timestamps follow one running clock through the whole value, so they
+    increase in document order. End times and source ranges are filled in
+    after their siblings, so a phrase's endTime comes after its events.
+    """
+    if clock is None:
+        clock = [0.0]
+    schema_type = schema.get("type")
+    if "enum" in schema:
+        return rng.choice(schema["enum"])
+    if schema_type == "object":
+        properties = schema.get("properties", {})
+        closing = [name for name in properties if name.lower().startswith("end") or name.lower().endswith("source")]
+        value = {}
+        for name in [name for name in properties if name not in closing] + closing:
+            value[name] = fake_value(properties[name], rng, name, clock)
+        return {name: value[name] for name in properties}
+    if schema_type == "array":
+        return [fake_value(schema.get("items", {}), rng, key, clock) for _ in range(rng.randint(2, 4))]
+    if schema_type == "integer":
+        return rng.randint(1, 12) if key.lower().startswith(("total", "matched", "octave", "phrase", "yodel")) else rng.randint(0, 100)
+    if schema_type == "number":
+        # Scores stay within 30 of each other, so overallScore passes the router's plausibility check
+        return round(rng.uniform(55, 85), 1) if "score" in key.lower() else round(rng.uniform(0, 50), 1)
+    if schema_type == "boolean":
+        return rng.random() < 0.5
+    if key.lower().endswith(("time", "timestamp")):
+        clock[0] += rng.uniform(0.2, 2.0)
+        return format_timestamp(clock[0])
+    if key.lower().endswith("source"):
+        return format_source_range(0.0, clock[0] + rng.uniform(0.5, 3.0))
+    if key == "note":
+        return rng.choice(["C", "D", "E", "F", "G", "A", "B"])
+    return f"Synthetic {key or 'value'} #{rng.randint(1, 999)}"
+
+
+class RecordReplayBackend:
+    """
+    Captures real responses to disk and plays them back.
+
+    In "record" mode every call goes to the wrapped backend and its response
+    text is saved under the request fingerprint. In "replay" mode responses
+    come only from disk, so a recorded session can be rerun deterministically
+    and offline; a request that was never recorded raises ReplayMiss.
+    """
+
+    def __init__(self, mode, inner=None, directory=None):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown record/replay mode: {mode}")
+        if mode == "record" and inner is None:
+            raise ValueError("Record mode needs a backend to record from")
+        self.mode = mode
+        self.name = mode
+        self.inner = inner
+        self.directory = directory or os.environ.get("MODEL_RECORDINGS_DIR", DEFAULT_RECORDINGS_DIR)
+        os.makedirs(self.directory, exist_ok=True)
+
+    @property
+    def available(self):
+        return self.mode == "replay" or self.inner.available
+
+    @property
+    def client_created(self):
+        return self.inner is not None and self.inner.client_created
+
+    def warm_up(self):
+        if self.inner is not None:
+            self.inner.warm_up()
+
+    def generate(self, template, contents):
+        fingerprint = request_fingerprint(template, contents)
+        if self.mode == "replay":
+            return self._load(fingerprint)
+        text = self.inner.generate(template, contents)
+        self._save(fingerprint, template, text)
+        return text
+
+    async def agenerate(self, template, contents):
+        fingerprint = request_fingerprint(template, contents)
+        if self.mode == "replay":
+            return self._load(fingerprint)
+        text = await self.inner.agenerate(template, contents)
+        self._save(fingerprint, template, text)
+        return text
+
+    def generate_stream(self, template, contents):
+        fingerprint = request_fingerprint(template, contents)
+        if self.mode == "replay":
+            yield from chunk_text(self._load(fingerprint))
+            return
+        pieces = []
+        for piece in self.inner.generate_stream(template, contents):
+            pieces.append(piece)
+            yield piece
+        self._save(fingerprint, template, "".join(pieces))
+
+    def _path(self, fingerprint):
+        return os.path.join(self.directory, f"{fingerprint}.json")
+
+    def _load(self, fingerprint):
+        try:
+            with open(self._path(fingerprint), "r") as f:
+                return json.load(f)["text"]
+        except FileNotFoundError:
+            raise ReplayMiss(f"No recording for request {fingerprint[:12]}") from None
+
+    def _save(self, fingerprint, template, text):
+        recording = {"template": template.name, "model": template.model, "recorded_at": time.time(), "text": text}
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(recording, f, indent=2)
+        os.replace(tmp_path, self._path(fingerprint))
+        logger.info(f"Recorded '{template.name}' response as {fingerprint[:12]}")
+
+
+def create_backend(api_key, name=None):
+    """
+    Builds the backend selected by MODEL_BACKEND: "genai" (default), "fake",
+    "record" (genai, saving every response) or "replay" (saved responses only).
+    """
+    name = name or os.environ.get("MODEL_BACKEND", "genai")
+    if name == "genai":
+        return GenAIBackend(api_key)
+    if name == "fake":
+        return FakeBackend()
+    if name == "record":
+        return RecordReplayBackend("record", GenAIBackend(api_key))
+    if name == "replay":
+        return RecordReplayBackend("replay")
+    raise ValueError(f"Unknown MODEL_BACKEND: {name}")
@@ -0,0 +1,438 @@
+import os
+import json
+import time
+import logging
+import threading
+from metrics import STAGE_SECONDS, UPSTREAM_SECONDS, MODEL_RESPONSES
+from schema_validation import InvalidModelResponse, Validator, format_path, get_path, set_path, subschema
+from resilience import UpstreamGuard, request_deadline
+from wav_io import WavFormatError, is_wav, parse_wav_header
+
+# Follow-up calls allowed per response for sections that were missing or unrepairable
+MODEL_REASK_LIMIT = int(os.environ.get("MODEL_REASK_LIMIT", 1))
+
+REASK_PROMPT = """
+        Your previous answer to this request was incomplete or did not match the schema. These are the usable parts of it:
+
+        ```json
+        {partial}
+        ```
+
+        Respond with JSON containing only the missing fields: {missing}. Nest them exactly as in the full schema; everything else is already filled in.
+        """
+
+logger = logging.getLogger(__name__)
+
+
+# google.genai is imported where it's used rather than at the top: it takes about
+# half a second, which startup spends in warm-up (load_sdk) instead of at import
+def load_sdk():
+    """Imports the google.genai modules every backend's requests are built from."""
+    from google.genai import types
+    return types
+
+
+def convert_json_schema_to_genai_schema(json_schema: dict) -> "types.Schema":
+    """
+    Converts a JSON schema dictionary to a google.generativeai.types.Schema object.
+    """
+    types = load_sdk()
+
+    type_mapping = {
+        "string": types.Type.STRING,
+        "integer": types.Type.INTEGER,
+        "number": types.Type.NUMBER,
+        "boolean": types.Type.BOOLEAN,
+        "object": types.Type.OBJECT,
+        "array": types.Type.ARRAY,
+    }
+
+    genai_schema_args = {}
+
+    schema_type = json_schema.get("type")
+    if schema_type and schema_type in type_mapping:
+        genai_schema_args["type"] = type_mapping[schema_type]
+
+    if "description" in json_schema:
+        genai_schema_args["description"] = json_schema["description"]
+
+    if "enum" in json_schema:
+        genai_schema_args["enum"] = json_schema["enum"]
+
+    if "properties" in json_schema:
+        genai_schema_args["properties"] = {
+            k: convert_json_schema_to_genai_schema(v)
+            for k, v in json_schema["properties"].items()
+        }
+
+    if "items" in json_schema:
+        genai_schema_args["items"] = convert_json_schema_to_genai_schema(json_schema["items"])
+
+    if "required" in json_schema:
+        genai_schema_args["required"] = json_schema["required"]
+
+    return types.Schema(**genai_schema_args)
+
+
+def text_part(text):
+    return load_sdk().Part.from_text(text=text)
+
+
+def audio_part(audio_data, mime_type='audio/wav'):
+    types = load_sdk()
+    return types.Part(inline_data=types.Blob(mime_type=mime_type, data=audio_data))
+
+
+class RequestTemplate:
+    """
+    The parts of a model request that don't depend on the audio: the model name,
+    the converted response schema and its compiled validator, the
+    GenerateContentConfig and, when the prompt has no per-request content, the
+    prompt part itself.
+
+    The SDK objects (schema, config, prompt part) are built by prepare(), which
+    warm-up calls for every registered template; otherwise on first use.
+    """
+
+    def __init__(self, name, model, response_schema, thinking_budget, prompt=None):
+        self.name = name
+        self.model = model
+        self.thinking_budget = thinking_budget
+        self.json_schema = response_schema
+        self.validator = Validator(response_schema)
+        self.prompt = prompt
+        self._built = None
+
+    @property
+    def response_schema(self):
+        return self.prepare()["response_schema"]
+
+    @property
+    def config(self):
+        return self.prepare()["config"]
+
+    @property
+    def prompt_part(self):
+        return self.prepare()["prompt_part"]
+
+    def prepare(self):
+        if self._built is None:
+            types = load_sdk()
+            response_schema = convert_json_schema_to_genai_schema(self.json_schema)
+            self._built = {
+                "response_schema": response_schema,
+                "config": types.GenerateContentConfig(
+                    response_mime_type="application/json",
+                    response_schema=response_schema,
+                    thinking_config=types.ThinkingConfig(
+                        thinking_budget=self.thinking_budget,
+                    )
+                ),
+                "prompt_part": text_part(self.prompt) if self.prompt is not None else None,
+            }
+        return self._built
+
+
+class ModelGateway:
+    """
+    Single entry point for model calls.
+
+    Request templates are compiled once when registered. Calls go to a
+    pluggable backend (see model_backends.py): the live Gemini API through one
+    shared genai.Client, whose HTTP connection pool is reused across requests,
+    or an offline fake or record/replay backend. Each call records how long
+    was spent assembling the request versus waiting upstream.
+
+    Blocking calls go through an UpstreamGuard: a deadline scaled by the
+    length of the audio in the request and shared by all of its calls
+    (re-asks included), retries for transient errors,
+    optional hedging and a circuit breaker shared by all templates. The
+    a-prefixed coroutine versions (agenerate, agenerate_validated) do the same
+    on the backend's async client, for the async server in asgi.py.
+    """
+
+    def __init__(self, backend, guard=None):
+        self.backend = backend
+        self.guard = guard or UpstreamGuard()
+        self._templates = {}
+        self._reask_templates = {}
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+
+    @property
+    def available(self):
+        """False when the backend can't serve requests (the live API without a key)."""
+        return self.backend.available
+
+    def register(self, template):
+        self._templates[template.name] = template
+        return template
+
+    def template(self, name):
+        return self._templates[name]
+
+    def prepare(self):
+        """Builds the SDK objects of every registered template ahead of the first request."""
+        for template in self._templates.values():
+            template.prepare()
+
+    def warm_up(self):
+        """Creates the backend's client ahead of the first request, if it has one."""
+        self.backend.warm_up()
+
+    def generate(self, template_name, parts, deadline=None):
+        """
+        Sends parts to the model using the named template and returns the response text.
+
+        Args:
+            template_name: Name of a registered RequestTemplate
+            parts: The per-request parts (prompt and audio); the template's static
+                prompt part is not added automatically
+            deadline: time.monotonic() by which the request's model work must be
+                done; by default request_deadline() for the audio in parts
+        """
+        return self._generate(self._templates[template_name], parts, _deadline(deadline, parts))
+
+    async def agenerate(self, template_name, parts, deadline=None):
+        """Coroutine version of generate()."""
+        return await self._agenerate(self._templates[template_name], parts, _deadline(deadline, parts))
+
+    def generate_validated(self, template_name, parts, reask=True, deadline=None):
+        """
+        Like generate(), but the response is checked against the template's
+        schema. Truncated JSON is closed and invalid items are dropped; required
+        sections that are still missing are requested again on their own (up to
+        MODEL_REASK_LIMIT follow-up calls) rather than repeating the whole request.
+        With reask=False missing sections fail straight away, for callers that
+        have a better fallback than a follow-up call. Follow-up calls share the
+        first call's deadline.
+
+        Returns:
+            Response text that parses as JSON and satisfies the schema
+
+        Raises:
+            InvalidModelResponse: If required sections are still missing
+        """
+        deadline = _deadline(deadline, parts)
+        return run_calls(
+            self._validated_calls(template_name, parts, reask), lambda call: self._generate(*call, deadline)
+        )
+
+    async def agenerate_validated(self, template_name, parts, reask=True, deadline=None):
+        """Coroutine version of generate_validated()."""
+        deadline = _deadline(deadline, parts)
+        return await arun_calls(
+            self._validated_calls(template_name, parts, reask), lambda call: self._agenerate(*call, deadline)
+        )
+
+    def _validated_calls(self, template_name, parts, reask):
+        """
+        The steps of generate_validated() as a generator: yields each model call
+        as a (template, parts) pair, receives its response text and returns the
+        validated text. Shared by the blocking and the async versions.
+        """
+        template = self._templates[template_name]
+        response_text = yield template, parts
+        with STAGE_SECONDS.time(operation=template_name, stage="validate"):
+            result, report = template.validator.parse(response_text)
+        if report.valid:
+            self._count_response(template_name, "valid")
+            return response_text
+
+        for repair in report.repairs:
+            logger.warning(f"Model response '{template_name}': {repair}")
+
+        reasks = 0
+        while report.missing and reask and reasks < MODEL_REASK_LIMIT:
+            reasks += 1
+            missing = sorted(set(report.missing))
+            logger.warning(f"Model response '{template_name}' is missing {', '.join(format_path(p) for p in missing)}; re-asking for those only")
+            reask_template = self._reask_template(template, tuple(missing))
+            answer_text = yield reask_template, parts + [text_part(REASK_PROMPT.format(
+                partial=json.dumps(result) if result is not None else "{}",
+                missing=", ".join(format_path(p) for p in missing),
+            ))]
+            with STAGE_SECONDS.time(operation=template_name, stage="validate"):
+                answer, _ = reask_template.validator.parse(answer_text)
+                for path in missing:
+                    try:
+                        result = set_path(result if result is not None else {}, path, get_path(answer, path))
+                    except (KeyError, TypeError):
+                        pass  # Still missing; reported by the repair pass below
+                report.missing = []
+                if result is not None:
+                    result = template.validator.repair(result, report)
+                else:
+                    report.missing.append(())
+
+        if report.missing:
+            self._count_response(template_name, "invalid")
+            raise InvalidModelResponse(
+                f"Model response for '{template_name}' is missing {', '.join(format_path(p) for p in report.missing)}"
+            )
+        self._count_response(template_name, "reasked" if reasks else "repaired")
+        return json.dumps(result)
+
+    def generate_stream(self, template_name, parts, deadline=None):
+        """
+        Streaming counterpart of generate(): yields the response text piece by
+        piece as the model produces it, raising UpstreamTimeout if the stream
+        is still going at the deadline.
+        """
+        call_start = time.perf_counter()
+        deadline = _deadline(deadline, parts)
+        template = self._templates[template_name]
+        contents = [load_sdk().Content(role="user", parts=parts)]
+        upstream_start = time.perf_counter()
+
+        first_chunk_at = None
+        for text in self.guard.guard_stream(template_name, self.backend.generate_stream(template, contents), deadline):
+            if first_chunk_at is None:
+                first_chunk_at = time.perf_counter()
+                logger.info(f"Model stream '{template_name}' - first chunk after {(first_chunk_at - upstream_start) * 1000:.0f} ms")
+            yield text
+
+        call_end = time.perf_counter()
+        self._record(template, (upstream_start - call_start) * 1000, (call_end - upstream_start) * 1000)
+
+    def _generate(self, template, parts, deadline):
+        call_start = time.perf_counter()
+        contents = [load_sdk().Content(role="user", parts=parts)]
+        upstream_start = time.perf_counter()
+
+        response_text = self.guard.call(template.name, lambda: self.backend.generate(template, contents), deadline)
+
+        call_end = time.perf_counter()
+        self._record(template, (upstream_start - call_start) * 1000, (call_end - upstream_start) * 1000)
+        return response_text
+
+    async def _agenerate(self, template, parts, deadline):
+        call_start = time.perf_counter()
+        contents = [load_sdk().Content(role="user", parts=parts)]
+        upstream_start = time.perf_counter()
+
+        response_text = await self.guard.acall(template.name, lambda: self.backend.agenerate(template, contents), deadline)
+
+        call_end = time.perf_counter()
+        self._record(template, (upstream_start - call_start) * 1000, (call_end - upstream_start) * 1000)
+        return response_text
+
+    def _reask_template(self, template, missing):
+        """A template asking only for the sections at missing, built once per distinct set of gaps."""
+        key = (template.name, missing)
+        reask = self._reask_templates.get(key)
+        if reask is None:
+            reask = RequestTemplate(
+                f"{template.name}_reask", template.model, subschema(template.json_schema, missing), template.thinking_budget
+            )
+            self._reask_templates[key] = reask
+        return reask
+
+    def _count_response(self, template_name, outcome):
+        MODEL_RESPONSES.inc(template=template_name, outcome=outcome)
+        with self._stats_lock:
+            responses = self._stats.setdefault(template_name, _new_stats_entry())["responses"]
+            responses[outcome] = responses.get(outcome, 0) + 1
+
+    def stats(self):
+        """
+        Returns per-template call counts, mean setup/upstream latency in
+        milliseconds and, for validated calls, how often the response needed
+        repairing or a follow-up call.
+        """
+        with self._stats_lock:
+            stats = {}
+            for name, entry in self._stats.items():
+                calls = entry["calls"]
+                stats[name] = {
+                    "calls": calls,
+                    "mean_setup_ms": round(entry["setup_ms"] / calls, 3) if calls else None,
+                    "mean_upstream_ms": round(entry["upstream_ms"] / calls, 1) if calls else None,
+                    "last_setup_ms": round(entry["last_setup_ms"], 3),
+                    "last_upstream_ms": round(entry["last_upstream_ms"], 1),
+                }
+                responses = entry["responses"]
+                validated = sum(responses.values())
+                if validated:
+                    stats[name]["responses"] = dict(responses)
+                    stats[name]["repair_rate"] = round((validated - responses.get("valid", 0)) / validated, 4)
+                    stats[name]["reask_rate"] = round(
+                        (responses.get("reasked", 0) + responses.get("invalid", 0)) / validated, 4
+                    )
+            return {
+                "backend": self.backend.name,
+                "client_created": self.backend.client_created,
+                "upstream": self.guard.stats(),
+                "templates": stats,
+            }
+
+    def _record(self, template, setup_ms, upstream_ms):
+        template_name = template.name
+        logger.info(f"Model call '{template_name}' - setup {setup_ms:.2f} ms, upstream {upstream_ms:.0f} ms")
+        UPSTREAM_SECONDS.observe(upstream_ms / 1000, template=template_name, model=template.model, backend=self.backend.name)
+        STAGE_SECONDS.observe(upstream_ms / 1000, operation=template_name, stage="upstream")
+        with self._stats_lock:
+            entry = self._stats.setdefault(template_name, _new_stats_entry())
+            entry["calls"] += 1
+            entry["setup_ms"] += setup_ms
+            entry["upstream_ms"] += upstream_ms
+            entry["last_setup_ms"] = setup_ms
+            entry["last_upstream_ms"] = upstream_ms
+
+
+def _deadline(deadline, parts):
+    return deadline if deadline is not None else request_deadline(audio_seconds(parts))
+
+
+def _new_stats_entry():
+    return {"calls": 0, "setup_ms": 0.0, "upstream_ms": 0.0, "last_setup_ms": 0.0, "last_upstream_ms": 0.0, "responses": {}}
+
+
+def run_calls(calls, call_model):
+    """
+    Drives a generator of model calls (see ModelGateway._validated_calls):
+    each call it yields is made with call_model and the result, or the
+    exception, is sent back into it. Returns the generator's return value.
+    """
+    try:
+        call = next(calls)
+        while True:
+            try:
+                result = call_model(call)
+            except Exception as e:
+                call = calls.throw(e)
+            else:
+                call = calls.send(result)
+    except StopIteration as stop:
+        return stop.value
+
+
+async def arun_calls(calls, call_model):
+    """run_calls() for coroutine call_model functions."""
+    try:
+        call = next(calls)
+        while True:
+            try:
+                result = await call_model(call)
+            except Exception as e:
+                call = calls.throw(e)
+            else:
+                call = calls.send(result)
+    except StopIteration as stop:
+        return stop.value
+
+
+def audio_seconds(parts):
+    """Total length of the audio in parts, or None if any of it isn't WAV (compressed uploads)."""
+    total = 0.0
+    for part in parts:
+        blob = part.inline_data
+        if blob is None:
+            continue
+        if not is_wav(blob.data):
+            return None
+        try:
+            total += parse_wav_header(blob.data).duration_seconds
+        except WavFormatError:
+            return None
+    return total
@@ -0,0 +1,254 @@
+import os
+import json
+import time
+import logging
+import threading
+from model_gateway import arun_calls, audio_seconds, run_calls
+from resilience import UpstreamTimeout, UpstreamUnavailable, is_retryable, request_deadline
+from schema_validation import InvalidModelResponse
+from timestamps import parse_timestamp
+
+logger = logging.getLogger(__name__)
+
+# The fast tier: a smaller model with little or no thinking
+MODEL_FAST = os.environ.get("MODEL_FAST", "gemini-2.5-flash")
+MODEL_FAST_THINKING_BUDGET = int(os.environ.get("MODEL_FAST_THINKING_BUDGET", 1024))
+
+# With quality=auto, requests with at most this much audio (WAV only) try the fast tier first
+MODEL_FAST_MAX_SECONDS = {
+    "analysis": float(os.environ.get("MODEL_FAST_MAX_SECONDS_ANALYSIS", 30)),
+    # Counts both the reference and the user's take
+    "comparison": float(os.environ.get("MODEL_FAST_MAX_SECONDS_COMPARISON", 40)),
+}
+
+# Escalate from the fast tier only while at least this much of the request's
+# deadline is left for the quality tier
+MODEL_ESCALATION_MIN_SECONDS = float(os.environ.get("MODEL_ESCALATION_MIN_SECONDS", 20))
+
+# USD per million tokens, for the cost estimates in /model-stats
+TIER_PRICES = {
+    "fast": (float(os.environ.get("MODEL_FAST_INPUT_PRICE", 0.30)), float(os.environ.get("MODEL_FAST_OUTPUT_PRICE", 2.50))),
+    "quality": (float(os.environ.get("MODEL_QUALITY_INPUT_PRICE", 1.25)), float(os.environ.get("MODEL_QUALITY_OUTPUT_PRICE", 10.0))),
+}
+# Gemini bills audio at a fixed rate; text is roughly four characters per token
+AUDIO_TOKENS_PER_SECOND = 32
+CHARS_PER_TOKEN = 4
+
+QUALITY_LEVELS = ("auto", "fast", "high")
+
+
+def confidence_problems(operation, result, clip_seconds=None):
+    """
+    Cheap plausibility checks for a schema-valid response; the fast tier's
+    answer is only kept when this returns an empty list.
+    """
+    problems = []
+    if operation == "analysis":
+        root = result.get("yodelAnalysis", {})
+        phrases = root.get("phrases", [])
+        if not phrases and (clip_seconds is None or clip_seconds > 5):
+            problems.append("no phrases found")
+        backwards = 0
+        for phrase in phrases:
+            start, end = parse_timestamp(phrase.get("startTime")), parse_timestamp(phrase.get("endTime"))
+            if start is not None and end is not None and end < start:
+                backwards += 1
+        if phrases and backwards * 2 > len(phrases):
+            problems.append(f"{backwards} of {len(phrases)} phrases end before they start")
+        if root.get("totalYodelSyllables") == 0 and any(phrase.get("events") for phrase in phrases):
+            problems.append("zero syllables despite vocal events")
+    elif operation == "comparison":
+        root = result.get("yodelComparison", {})
+        scores = [metric.get("score") for metric in root.get("metrics", {}).values() if isinstance(metric, dict)]
+        scores = [score for score in scores if isinstance(score, (int, float))]
+        overall = root.get("overallScore")
+        if scores and isinstance(overall, (int, float)) and abs(overall - sum(scores) / len(scores)) > 30:
+            problems.append(f"overall score {overall} far from metric average {sum(scores) / len(scores):.0f}")
+        feedback = root.get("feedback", {})
+        if not feedback.get("strengths") and not feedback.get("areasForImprovement"):
+            problems.append("no strengths or areas for improvement")
+    return problems
+
+
+def estimate_cost(tier, parts, response_text, thinking_budget):
+    """
+    Rough USD cost of one call: audio and prompt tokens in, response plus the
+    whole thinking budget out (an upper bound; actual thinking is often shorter).
+    """
+    input_price, output_price = TIER_PRICES[tier]
+    input_tokens = (audio_seconds(parts) or 0.0) * AUDIO_TOKENS_PER_SECOND
+    input_tokens += sum(len(part.text) for part in parts if part.text is not None) / CHARS_PER_TOKEN
+    output_tokens = len(response_text) / CHARS_PER_TOKEN + thinking_budget
+    return (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+
+
+class TierRouter:
+    """
+    Routes each model call to the fast or the quality tier.
+
+    quality="high" always uses the quality tier and quality="fast" always the
+    fast one. With "auto", short WAV clips go to the fast tier and everything
+    else (long clips, compressed audio of unknown length) to the quality tier.
+    A fast answer that fails validation or the confidence checks is discarded
+    and the request escalates to the quality tier, which may re-ask for
+    missing sections as usual. So does a fast call that failed upstream without
+    using up the time (retries exhausted or the circuit open). Both tiers share
+    the request's deadline, so escalation only happens while at least
+    MODEL_ESCALATION_MIN_SECONDS of it are left; a fast call that timed out
+    never escalates.
+
+    The quality tier uses the templates registered under the operation name
+    ("analysis", "comparison"), the fast tier those with a "_fast" suffix.
+    """
+
+    def __init__(self, gateway):
+        self.gateway = gateway
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def choose(self, operation, clip_seconds, quality="auto"):
+        if quality == "high":
+            return "quality"
+        if quality == "fast":
+            return "fast"
+        if clip_seconds is not None and clip_seconds <= MODEL_FAST_MAX_SECONDS[operation]:
+            return "fast"
+        return "quality"
+
+    def template_name(self, operation, tier):
+        return f"{operation}_fast" if tier == "fast" else operation
+
+    def signature(self, quality="auto"):
+        """Everything about routing that changes results, for cache keys."""
+        return {
+            "quality": quality,
+            "fast_model": MODEL_FAST,
+            "fast_thinking_budget": MODEL_FAST_THINKING_BUDGET,
+            "fast_max_seconds": MODEL_FAST_MAX_SECONDS,
+        }
+
+    def generate(self, operation, parts, quality="auto", clip_seconds=None, deadline=None):
+        """
+        Returns validated response text for operation from the tier chosen for
+        parts, escalating from the fast tier when its answer isn't usable.
+        clip_seconds, when given, is used for routing instead of the length of
+        the audio in parts. deadline (see request_deadline) defaults to one for
+        clip_seconds of audio; every call of either tier must finish by it.
+
+        Raises:
+            InvalidModelResponse: If the tier that answered last gave no usable response
+            UpstreamUnavailable, UpstreamTimeout: If the last tier tried failed upstream
+        """
+        clip_seconds, deadline = self._budget(parts, clip_seconds, deadline)
+        calls = self._tier_calls(operation, parts, quality, clip_seconds, deadline)
+        return run_calls(calls, lambda call: self.gateway.generate_validated(*call, deadline=deadline))
+
+    async def agenerate(self, operation, parts, quality="auto", clip_seconds=None, deadline=None):
+        """Coroutine version of generate()."""
+        clip_seconds, deadline = self._budget(parts, clip_seconds, deadline)
+        calls = self._tier_calls(operation, parts, quality, clip_seconds, deadline)
+        return await arun_calls(calls, lambda call: self.gateway.agenerate_validated(*call, deadline=deadline))
+
+    @staticmethod
+    def _budget(parts, clip_seconds, deadline):
+        if clip_seconds is None:
+            clip_seconds = audio_seconds(parts)
+        return clip_seconds, deadline if deadline is not None else request_deadline(clip_seconds)
+
+    def _tier_calls(self, operation, parts, quality, clip_seconds, deadline):
+        """
+        The steps of generate() as a generator of (template_name, parts, reask)
+        calls to the gateway's validated generate (see run_calls).
+        """
+        if self.choose(operation, clip_seconds, quality) == "fast":
+            template = self.gateway.template(self.template_name(operation, "fast"))
+            start = time.perf_counter()
+            response_text = None
+            upstream_error = None
+            try:
+                logger.info(f"Using model: {template.model} (fast tier) for {operation}")
+                response_text = yield template.name, parts, False
+                problems = confidence_problems(operation, json.loads(response_text), clip_seconds)
+            except InvalidModelResponse as e:
+                problems = [str(e)]
+            except UpstreamTimeout:
+                # The request's time is spent; the quality tier couldn't finish either
+                cost = estimate_cost("fast", parts, "", template.thinking_budget)
+                self._record(operation, "fast", time.perf_counter() - start, cost, False)
+                raise
+            except Exception as e:
+                if not (isinstance(e, UpstreamUnavailable) or is_retryable(e)):
+                    raise
+                upstream_error = e
+                problems = [f"{type(e).__name__}: {str(e)}"]
+            elapsed = time.perf_counter() - start
+            # A call the circuit breaker rejected never reached the model
+            rejected = isinstance(upstream_error, UpstreamUnavailable)
+            cost = 0.0 if rejected else estimate_cost("fast", parts, response_text or "", template.thinking_budget)
+            # An explicit quality=fast keeps a doubtful answer, and so does a request
+            # without time left to escalate, but neither can return a missing one
+            escalate = quality != "fast" and deadline - time.monotonic() >= MODEL_ESCALATION_MIN_SECONDS
+            served = response_text is not None and (not problems or not escalate)
+            avoided = estimate_cost("quality", parts, response_text or "", self.gateway.template(operation).thinking_budget)
+            self._record(operation, "fast", elapsed, cost, served, avoided if served else 0.0)
+            if served:
+                if problems and quality != "fast":
+                    logger.warning(f"Keeping doubtful fast-tier {operation} answer, too little time left to escalate: {'; '.join(problems)}")
+                return response_text
+            if not escalate and upstream_error is not None:
+                raise upstream_error
+            if not escalate:
+                raise InvalidModelResponse(f"Fast-tier {operation} response unusable: {'; '.join(problems)}")
+            logger.warning(f"Escalating {operation} to the quality tier: {'; '.join(problems)}")
+
+        template = self.gateway.template(operation)
+        logger.info(f"Using model: {template.model} (quality tier) for {operation}")
+        start = time.perf_counter()
+        response_text = yield operation, parts, True
+        cost = estimate_cost("quality", parts, response_text, template.thinking_budget)
+        self._record(operation, "quality", time.perf_counter() - start, cost, True)
+        return response_text
+
+    def _record(self, operation, tier, seconds, cost, served, quality_cost_avoided=0.0):
+        with self._lock:
+            entry = self._stats.setdefault((operation, tier), {
+                "calls": 0, "escalated": 0, "seconds": 0.0, "cost": 0.0, "quality_cost_avoided": 0.0,
+            })
+            entry["calls"] += 1
+            entry["seconds"] += seconds
+            entry["cost"] += cost
+            entry["quality_cost_avoided"] += quality_cost_avoided
+            if not served:
+                entry["escalated"] += 1
+
+    def stats(self):
+        """
+        Per operation and tier: calls, escalations, mean latency and estimated
+        cost. The fast tier also reports what it saved against sending the
+        calls it served to the quality tier (at the quality tier's observed
+        mean latency), net of the time and cost of the attempts that escalated.
+        """
+        with self._lock:
+            stats = {}
+            for (operation, tier), entry in self._stats.items():
+                calls = entry["calls"]
+                stats.setdefault(operation, {})[tier] = {
+                    "calls": calls,
+                    "served": calls - entry["escalated"],
+                    "escalated": entry["escalated"],
+                    "escalation_rate": round(entry["escalated"] / calls, 4),
+                    "mean_latency_ms": round(entry["seconds"] / calls * 1000, 1),
+                    "estimated_cost_usd": round(entry["cost"], 6),
+                }
+
+            for operation, tiers in stats.items():
+                fast = self._stats.get((operation, "fast"))
+                if fast is None:
+                    continue
+                tiers["fast"]["estimated_cost_saved_usd"] = round(fast["quality_cost_avoided"] - fast["cost"], 6)
+                quality = self._stats.get((operation, "quality"))
+                if quality is not None:
+                    quality_mean = quality["seconds"] / quality["calls"]
+                    served = fast["calls"] - fast["escalated"]
+                    tiers["fast"]["latency_saved_ms"] = round((served * quality_mean - fast["seconds"]) * 1000, 1)
+            return stats
@@ -0,0 +1,318 @@
+import json
+import logging
+import warnings
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from wav_io import decode_wav
+from timestamps import format_timestamp
+
+logger = logging.getLogger(__name__)
+
+# Pitch search range; yodel head voice regularly goes above 1 kHz
+FMIN_HZ = 70.0
+FMAX_HZ = 1100.0
+
+# Pitch tracking runs at roughly this rate; higher-rate input is decimated first
+ANALYSIS_SAMPLE_RATE = 16000
+HOP_SECONDS = 0.01
+YIN_THRESHOLD = 0.15
+SILENCE_GATE_DB = -40.0
+# Frames per vectorized YIN block; bounds the working set (~15 MB per 1k frames)
+PITCH_BLOCK_FRAMES = 1024
+
+MIN_NOTE_SECONDS = 0.06
+NOTE_CHANGE_SEMITONES = 0.8
+PHRASE_GAP_SECONDS = 0.3
+YODEL_BREAK_SEMITONES = 4.0
+YODEL_BREAK_MAX_GAP_SECONDS = 0.15
+MIN_REGISTER_SPREAD_SEMITONES = 5.0
+
+NOTE_NAMES = ["C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B"]
+
+
+def track_pitch(samples, sample_rate):
+    """
+    Framewise YIN pitch estimate, vectorized over blocks of PITCH_BLOCK_FRAMES
+    frames so memory stays flat however long the take is.
+
+    Returns:
+        A (times, f0_hz, confidence) tuple of equal-length arrays; f0_hz is NaN
+        for unvoiced or silent frames
+    """
+    samples, sample_rate = _decimate(np.asarray(samples, dtype=np.float32), sample_rate)
+    hop = max(1, int(round(HOP_SECONDS * sample_rate)))
+    tau_min = max(2, int(sample_rate / FMAX_HZ))
+    tau_max = int(np.ceil(sample_rate / FMIN_HZ))
+    window = tau_max
+    frame_length = window + tau_max + 1
+
+    if len(samples) < frame_length:
+        samples = np.pad(samples, (0, frame_length - len(samples)))
+
+    # A strided view; frames are only copied out a block at a time
+    frames = sliding_window_view(samples, frame_length)[::hop]
+    n_frames = frames.shape[0]
+
+    period = np.empty(n_frames)
+    center = np.empty(n_frames)
+    has_dip = np.empty(n_frames, dtype=bool)
+    rms = np.empty(n_frames)
+    for first in range(0, n_frames, PITCH_BLOCK_FRAMES):
+        block = slice(first, first + PITCH_BLOCK_FRAMES)
+        period[block], center[block], has_dip[block], rms[block] = _yin_block(
+            frames[block].astype(np.float64), window, tau_min, tau_max)
+
+    # The silence gate is relative to the loudest frame of the whole take
+    level_db = 20.0 * np.log10(np.maximum(rms, 1e-10) / max(rms.max(), 1e-10))
+    voiced = has_dip & (level_db > SILENCE_GATE_DB) & (rms > 1e-4)
+
+    f0 = np.where(voiced, sample_rate / period, np.nan)
+    confidence = np.where(voiced, 1.0 - np.clip(center, 0.0, 1.0), 0.0)
+    times = (np.arange(n_frames) * hop + window / 2) / sample_rate
+    return times, f0, confidence
+
+
+def _yin_block(frames, window, tau_min, tau_max):
+    """
+    YIN over a (n_frames, frame_length) block.
+
+    Returns:
+        A (period, cmndf_minimum, has_dip, rms) tuple of per-frame arrays
+    """
+    n_frames, frame_length = frames.shape
+
+    # Difference function d(tau) = E[0:W] + E[tau:tau+W] - 2 * r(tau), with r via FFT
+    nfft = 1 << int(np.ceil(np.log2(frame_length + window)))
+    spectrum = np.fft.rfft(frames, nfft)
+    spectrum *= np.conj(np.fft.rfft(frames[:, :window], nfft))
+    acf = np.fft.irfft(spectrum, nfft)[:, :tau_max + 1]
+    del spectrum
+
+    energy = np.concatenate([np.zeros((n_frames, 1)), np.cumsum(frames ** 2, axis=1)], axis=1)
+    taus = np.arange(tau_max + 1)
+    diff = np.maximum(energy[:, [window]] + (energy[:, taus + window] - energy[:, taus]) - 2.0 * acf, 0.0)
+    rms = np.sqrt(energy[:, window] / window)
+    del acf, energy
+
+    # Cumulative mean normalized difference
+    cmndf = np.ones_like(diff)
+    running = np.cumsum(diff[:, 1:], axis=1)
+    cmndf[:, 1:] = diff[:, 1:] * taus[1:] / np.maximum(running, 1e-12)
+    del diff, running
+
+    search = cmndf[:, tau_min:]
+    below = search < YIN_THRESHOLD
+    has_dip = below.any(axis=1)
+    best = np.where(has_dip, np.argmax(below, axis=1), np.argmin(search, axis=1)) + tau_min
+
+    # Walk forward to the bottom of the first dip
+    rows = np.arange(n_frames)
+    for _ in range(tau_max):
+        nxt = np.minimum(best + 1, tau_max)
+        improving = cmndf[rows, nxt] < cmndf[rows, best]
+        if not improving.any():
+            break
+        best = np.where(improving, nxt, best)
+
+    # Parabolic interpolation around the minimum
+    left = cmndf[rows, np.maximum(best - 1, 0)]
+    center = cmndf[rows, best]
+    right = cmndf[rows, np.minimum(best + 1, tau_max)]
+    denominator = left - 2.0 * center + right
+    curved = np.abs(denominator) > 1e-12
+    shift = np.where(curved, 0.5 * (left - right) / np.where(curved, denominator, 1.0), 0.0)
+    return best + np.clip(shift, -1.0, 1.0), center, has_dip, rms
+
+
+def hz_to_midi(f0):
+    return 69.0 + 12.0 * np.log2(f0 / 440.0)
+
+
+def midi_to_note(midi):
+    """Returns (note, octave) for a MIDI number, e.g. 60 -> ("C", 4)."""
+    rounded = int(round(midi))
+    return NOTE_NAMES[rounded % 12], rounded // 12 - 1
+
+
+def segment_notes(times, f0):
+    """
+    Groups voiced frames into note segments of roughly constant pitch.
+
+    Returns:
+        A list of dicts with start, end and midi (median pitch) keys
+    """
+    midi = hz_to_midi(f0)
+    if len(midi) >= 5:
+        padded = np.pad(midi, 2, mode="edge")
+        windows = sliding_window_view(padded, 5)
+        with warnings.catch_warnings():
+            # All-NaN windows (silence) are expected and stay NaN
+            warnings.simplefilter("ignore", RuntimeWarning)
+            smoothed = np.nanmedian(windows, axis=1)
+        midi = np.where(np.isnan(midi), np.nan, smoothed)
+
+    voiced = ~np.isnan(midi)
+    hop = times[1] - times[0] if len(times) > 1 else HOP_SECONDS
+
+    jumps = np.zeros(len(midi), dtype=bool)
+    jumps[1:] = np.abs(np.diff(np.where(voiced, midi, 0.0))) > NOTE_CHANGE_SEMITONES
+    starts_run = voiced & (np.concatenate([[True], ~voiced[:-1]]) | jumps)
+    segment_ids = np.cumsum(starts_run) * voiced
+
+    segments = []
+    for segment_id in range(1, segment_ids.max() + 1 if len(segment_ids) else 1):
+        idx = np.flatnonzero(segment_ids == segment_id)
+        if len(idx) == 0:
+            continue
+        start = times[idx[0]] - hop / 2
+        end = times[idx[-1]] + hop / 2
+        if end - start < MIN_NOTE_SECONDS:
+            continue
+        segments.append({"start": float(start), "end": float(end), "midi": float(np.median(midi[idx]))})
+    return segments
+
+
+def register_split(segments):
+    """
+    Finds the pitch that separates chest-voice notes from head-voice notes by
+    two-means clustering of segment pitches; None if the take has no clear
+    second register.
+    """
+    if not segments:
+        return None
+    pitches = np.array([s["midi"] for s in segments])
+    weights = np.array([s["end"] - s["start"] for s in segments])
+    if pitches.max() - pitches.min() < MIN_REGISTER_SPREAD_SEMITONES:
+        return None
+
+    low, high = pitches.min(), pitches.max()
+    for _ in range(20):
+        split = (low + high) / 2.0
+        lower, upper = pitches <= split, pitches > split
+        if not lower.any() or not upper.any():
+            break
+        low = np.average(pitches[lower], weights=weights[lower])
+        high = np.average(pitches[upper], weights=weights[upper])
+    if high - low < MIN_REGISTER_SPREAD_SEMITONES:
+        return None
+    return float((low + high) / 2.0)
+
+
+def is_yodel_break(previous, segment, boundary):
+    """
+    True when segment flips register relative to the previous one: a jump of at
+    least YODEL_BREAK_SEMITONES across boundary, after at most
+    YODEL_BREAK_MAX_GAP_SECONDS of silence.
+    """
+    crosses = (previous["midi"] > boundary) != (segment["midi"] > boundary)
+    return (crosses and abs(segment["midi"] - previous["midi"]) >= YODEL_BREAK_SEMITONES
+            and segment["start"] - previous["end"] <= YODEL_BREAK_MAX_GAP_SECONDS)
+
+
+def find_yodel_breaks(segments):
+    """Returns the segments that start with a yodel break; none if the take has no second register."""
+    split = register_split(segments)
+    if split is None:
+        return []
+    return [segment for previous, segment in zip(segments, segments[1:]) if is_yodel_break(previous, segment, split)]
+
+
+def build_analysis(segments, duration):
+    """Turns note segments into the yodelAnalysis JSON structure."""
+    split = register_split(segments)
+    # Without two clusters, fall back to a fixed boundary around G4
+    boundary = split if split is not None else 67.0
+
+    phrases = []
+    current = []
+    for segment in segments:
+        if current and segment["start"] - current[-1]["end"] > PHRASE_GAP_SECONDS:
+            phrases.append(current)
+            current = []
+        current.append(segment)
+    if current:
+        phrases.append(current)
+
+    phrase_objects = []
+    total_syllables = 0
+    for number, phrase in enumerate(phrases, 1):
+        events = []
+        breaks = 0
+        previous = None
+        for segment in phrase:
+            register = "headVoice" if segment["midi"] > boundary else "chestVoice"
+            note, octave = midi_to_note(segment["midi"])
+            frequency = 440.0 * 2 ** ((segment["midi"] - 69.0) / 12.0)
+
+            if previous is not None and split is not None and is_yodel_break(previous, segment, split):
+                jump = segment["midi"] - previous["midi"]
+                breaks += 1
+                events.append({
+                    "timestamp": format_timestamp(segment["start"]),
+                    "type": "yodelBreak",
+                    "description": f"Register flip from {previous['register'][:-5]} to {register[:-5]} voice ({jump:+.1f} semitones)",
+                    "syllable": "o-i" if jump > 0 else "i-o",
+                    "pitch": {"note": note, "octave": octave},
+                })
+
+            events.append({
+                "timestamp": format_timestamp(segment["start"]),
+                "type": register,
+                "description": f"{note}{octave} (~{frequency:.0f} Hz) held for {segment['end'] - segment['start']:.2f}s",
+                # Yodelers sing chest notes on back vowels and head notes on front vowels
+                "syllable": "i" if register == "headVoice" else "o",
+                "pitch": {"note": note, "octave": octave},
+            })
+            previous = {"register": register, "midi": segment["midi"], "end": segment["end"]}
+
+        low_note = midi_to_note(min(s["midi"] for s in phrase))
+        high_note = midi_to_note(max(s["midi"] for s in phrase))
+        syllables = len(phrase)
+        total_syllables += syllables
+        phrase_objects.append({
+            "phraseNumber": number,
+            "startTime": format_timestamp(phrase[0]["start"]),
+            "endTime": format_timestamp(phrase[-1]["end"]),
+            "yodelSyllablesInPhrase": syllables,
+            "events": events,
+            "notes": f"{breaks} yodel break(s); range {low_note[0]}{low_note[1]}-{high_note[0]}{high_note[1]}. Estimated by the local pitch tracker.",
+        })
+
+    end_minutes, end_seconds = divmod(int(np.ceil(duration)), 60)
+    return {
+        "yodelAnalysis": {
+            "video / audioSource": f"00:00-{end_minutes:02d}:{end_seconds:02d}",
+            "totalYodelSyllables": total_syllables,
+            "phrases": phrase_objects,
+        }
+    }
+
+
+def analyze_audio(wav_data):
+    """
+    Analyzes WAV bytes locally and returns a dict in the yodel_analysis_schema shape.
+
+    Raises:
+        WavFormatError: If the audio is not a decodable WAV file
+    """
+    samples, sample_rate = decode_wav(wav_data)
+    times, f0, _ = track_pitch(samples, sample_rate)
+    segments = segment_notes(times, f0)
+    return build_analysis(segments, len(samples) / sample_rate)
+
+
+def generate_local_response(wav_data):
+    """
+    Local counterpart of generate_gemini_response: returns the analysis as JSON text.
+    """
+    logger.info(f"Starting local pitch analysis - Audio data size: {len(wav_data)} bytes")
+    return json.dumps(analyze_audio(wav_data))
+
+
+def _decimate(samples, sample_rate):
+    factor = int(sample_rate // ANALYSIS_SAMPLE_RATE)
+    if factor <= 1:
+        return samples, float(sample_rate)
+    usable = len(samples) - len(samples) % factor
+    # Box-filter and decimate; the pitch range sits far below the new Nyquist frequency
+    return samples[:usable].reshape(-1, factor).mean(axis=1), sample_rate / factor
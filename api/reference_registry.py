@@ -0,0 +1,201 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Directories searched for reference step WAVs, in priority order. The API's own
+# steps/ directory wins over the copy shipped with the React build.
+DEFAULT_STEPS_DIRS = [
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "steps"),
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "static", "steps"),
+]
+
+# Written by analyze_steps.py next to the WAVs: input hash per analyzed file
+MANIFEST_FILENAME = ".analysis_manifest.json"
+
+
+def analysis_filename(step_id):
+    return f"{step_id}_analysis.json"
+
+
+class ReferenceNotFound(KeyError):
+    """Raised when a reference_id does not match any known step WAV."""
+
+
+class ReferenceChanged(ValueError):
+    """Raised when a pinned reference hash no longer matches the step WAV on disk."""
+
+
+class ReferenceEntry:
+    """
+    A single reference track held in memory together with its content hash and,
+    when analyze_steps.py has produced one for this exact audio, its analysis.
+    """
+
+    def __init__(self, step_id, path, data, sha256, mtime_ns, size):
+        self.step_id = step_id
+        self.path = path
+        self.data = data
+        self.sha256 = sha256
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.analysis = None
+        self.analysis_stamp = None
+
+    @property
+    def reference_id(self):
+        return f"{self.step_id}@{self.sha256[:12]}"
+
+    def to_dict(self):
+        return {
+            "step_id": self.step_id,
+            "reference_id": self.reference_id,
+            "sha256": self.sha256,
+            "size": self.size,
+            "has_analysis": self.analysis is not None,
+        }
+
+
+class ReferenceRegistry:
+    """
+    Registry of reference step WAVs keyed by step id and content hash.
+
+    Every ``<step>.wav`` found in the steps directories is read once and kept in
+    memory. Lookups re-check the file's size and mtime, so an edited WAV is
+    re-hashed and replaces the stale entry without restarting the server.
+
+    The ``<step>_analysis.json`` next to each WAV is loaded too, but only if
+    it describes the current audio: the analysis manifest must record the
+    WAV's hash or, for copies without a manifest (the React build's steps/),
+    the analysis must be newer than the WAV. It is re-read when it changes.
+    """
+
+    def __init__(self, steps_dirs=None):
+        if steps_dirs is None:
+            env_dirs = os.environ.get("REFERENCE_STEPS_DIRS")
+            steps_dirs = env_dirs.split(os.pathsep) if env_dirs else DEFAULT_STEPS_DIRS
+        self.steps_dirs = [os.path.abspath(d) for d in steps_dirs]
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Scans the steps directories and preloads every reference WAV."""
+        with self._lock:
+            for step_id, path in self._discover().items():
+                self._load_entry(step_id, path)
+        logger.info(f"Reference registry loaded {len(self._entries)} step(s) from {self.steps_dirs}")
+        return self
+
+    def get(self, reference_id):
+        """
+        Resolves a reference_id to its ReferenceEntry.
+
+        Args:
+            reference_id: Either a bare step id (``"1"``) or a step id pinned to a
+                content hash prefix (``"1@3fa2b9c01d4e"``).
+        """
+        step_id, _, pinned_hash = str(reference_id).partition("@")
+        step_id = step_id.strip()
+
+        with self._lock:
+            entry = self._entries.get(step_id)
+            path = entry.path if entry else self._discover().get(step_id)
+            if path is None:
+                raise ReferenceNotFound(reference_id)
+
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                self._entries.pop(step_id, None)
+                raise ReferenceNotFound(reference_id)
+
+            if entry is None or entry.mtime_ns != stat.st_mtime_ns or entry.size != stat.st_size:
+                entry = self._load_entry(step_id, path)
+            elif entry.analysis_stamp != self._analysis_stamp(entry):
+                self._load_analysis(entry)
+
+        if pinned_hash and not entry.sha256.startswith(pinned_hash):
+            raise ReferenceChanged(
+                f"Reference {step_id} changed: requested {pinned_hash}, current {entry.sha256[:12]}"
+            )
+        return entry
+
+    def list(self):
+        """Returns metadata for all preloaded references, ordered by step id."""
+        with self._lock:
+            entries = list(self._entries.values())
+        return [e.to_dict() for e in sorted(entries, key=lambda e: (len(e.step_id), e.step_id))]
+
+    def _discover(self):
+        found = {}
+        for steps_dir in self.steps_dirs:
+            if not os.path.isdir(steps_dir):
+                continue
+            for filename in os.listdir(steps_dir):
+                if filename.endswith(".wav"):
+                    found.setdefault(os.path.splitext(filename)[0], os.path.join(steps_dir, filename))
+        return found
+
+    def _load_entry(self, step_id, path):
+        with open(path, "rb") as wav_file:
+            data = wav_file.read()
+        stat = os.stat(path)
+        sha256 = hashlib.sha256(data).hexdigest()
+
+        previous = self._entries.get(step_id)
+        if previous is not None and previous.sha256 != sha256:
+            logger.info(f"Reference {step_id} changed on disk ({previous.sha256[:12]} -> {sha256[:12]})")
+
+        entry = ReferenceEntry(step_id, path, data, sha256, stat.st_mtime_ns, stat.st_size)
+        self._load_analysis(entry)
+        self._entries[step_id] = entry
+        return entry
+
+    def _analysis_paths(self, entry):
+        steps_dir = os.path.dirname(entry.path)
+        return os.path.join(steps_dir, analysis_filename(entry.step_id)), os.path.join(steps_dir, MANIFEST_FILENAME)
+
+    def _analysis_stamp(self, entry):
+        """mtimes of the analysis and the manifest; analyze_steps.py writes the manifest last."""
+        return tuple(_mtime_ns(path) for path in self._analysis_paths(entry))
+
+    def _load_analysis(self, entry):
+        analysis_path, manifest_path = self._analysis_paths(entry)
+        entry.analysis = None
+        entry.analysis_stamp = self._analysis_stamp(entry)
+        analysis_mtime_ns = entry.analysis_stamp[0]
+        if analysis_mtime_ns is None:
+            return
+
+        manifest_entry = _read_json(manifest_path, {}).get(os.path.basename(entry.path))
+        if manifest_entry is not None:
+            if manifest_entry.get("sha256") != entry.sha256:
+                logger.info(f"Ignoring stale analysis for reference {entry.step_id}: the WAV changed since it was analyzed")
+                return
+        elif analysis_mtime_ns < entry.mtime_ns:
+            logger.info(f"Ignoring analysis for reference {entry.step_id}: older than the WAV")
+            return
+
+        analysis = _read_json(analysis_path, None)
+        if not isinstance(analysis, dict) or not isinstance(analysis.get("yodelAnalysis", {}).get("phrases"), list):
+            logger.warning(f"Ignoring unreadable analysis for reference {entry.step_id}: {analysis_path}")
+            return
+        entry.analysis = analysis
+
+
+def _mtime_ns(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def _read_json(path, default):
+    try:
+        with open(path) as json_file:
+            return json.load(json_file)
+    except (OSError, ValueError):
+        return default
@@ -0,0 +1,396 @@
+import os
+import time
+import sys
+import random
+import asyncio
+import logging
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeout
+from metrics import UPSTREAM_EVENTS
+
+logger = logging.getLogger(__name__)
+
+# Deadline for a request's model work: a base allowance plus time per second of
+# audio, capped below gunicorn's --timeout so the worker can still answer. It
+# covers every call the request makes (retries, hedges, re-asks, tier escalation
+# and streams), not each call separately
+MODEL_TIMEOUT_BASE_SECONDS = float(os.environ.get("MODEL_TIMEOUT_BASE_SECONDS", 20))
+MODEL_TIMEOUT_PER_AUDIO_SECOND = float(os.environ.get("MODEL_TIMEOUT_PER_AUDIO_SECOND", 1.0))
+MODEL_TIMEOUT_MAX_SECONDS = float(os.environ.get("MODEL_TIMEOUT_MAX_SECONDS", 100))
+
+# Retries for retryable errors only, with full-jitter exponential backoff
+MODEL_RETRIES = int(os.environ.get("MODEL_RETRIES", 2))
+MODEL_RETRY_BACKOFF_SECONDS = float(os.environ.get("MODEL_RETRY_BACKOFF_SECONDS", 1.0))
+
+# Hedging: send a second identical request once the first has been running longer
+# than this percentile of recent latencies. 0 disables it (each hedge doubles token cost)
+MODEL_HEDGE_PERCENTILE = float(os.environ.get("MODEL_HEDGE_PERCENTILE", 0))
+MODEL_HEDGE_MIN_SAMPLES = int(os.environ.get("MODEL_HEDGE_MIN_SAMPLES", 20))
+
+# Circuit breaker over the last MODEL_BREAKER_WINDOW upstream calls
+MODEL_BREAKER_WINDOW = int(os.environ.get("MODEL_BREAKER_WINDOW", 20))
+MODEL_BREAKER_MIN_CALLS = int(os.environ.get("MODEL_BREAKER_MIN_CALLS", 10))
+MODEL_BREAKER_FAILURE_RATE = float(os.environ.get("MODEL_BREAKER_FAILURE_RATE", 0.5))
+MODEL_BREAKER_COOLDOWN_SECONDS = float(os.environ.get("MODEL_BREAKER_COOLDOWN_SECONDS", 30))
+
+# Threads that make the blocking upstream calls, so a request can stop waiting at its deadline
+MODEL_UPSTREAM_WORKERS = int(os.environ.get("MODEL_UPSTREAM_WORKERS", 32))
+
+RETRYABLE_STATUS_CODES = (408, 429, 500, 502, 503, 504)
+
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half_open"
+
+
+class UpstreamTimeout(TimeoutError):
+    """Raised when the model did not answer before the call's deadline."""
+
+
+class UpstreamUnavailable(RuntimeError):
+    """Raised without calling the model while the circuit breaker is open."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def deadline_seconds(audio_seconds=None):
+    """Time allowed for a request's model work on audio_seconds of audio (None when the length is unknown)."""
+    if audio_seconds is None:
+        return MODEL_TIMEOUT_MAX_SECONDS
+    return min(MODEL_TIMEOUT_MAX_SECONDS, MODEL_TIMEOUT_BASE_SECONDS + MODEL_TIMEOUT_PER_AUDIO_SECOND * audio_seconds)
+
+
+def request_deadline(audio_seconds=None):
+    """The time.monotonic() by which a request's model work on audio_seconds of audio must be done."""
+    return time.monotonic() + deadline_seconds(audio_seconds)
+
+
+def is_retryable(error):
+    """True for errors that say nothing about the request itself: timeouts, throttling, 5xx and dropped connections."""
+    if isinstance(error, (UpstreamTimeout, ConnectionError)):
+        return True
+    # Transport errors from the genai client; if httpx was never imported, there can't be any
+    httpx = sys.modules.get("httpx")
+    if httpx is not None and isinstance(error, httpx.TransportError):
+        return True
+    status = getattr(error, "code", None) or getattr(error, "status_code", None)
+    return status in RETRYABLE_STATUS_CODES
+
+
+class CircuitBreaker:
+    """
+    Opens after too many retryable failures among recent calls, rejecting calls
+    for a cooldown period. After the cooldown a single trial call is let through;
+    its success closes the circuit again, its failure restarts the cooldown.
+    Errors caused by the request itself are not recorded either way.
+    """
+
+    def __init__(self, window=None, min_calls=None, failure_rate=None, cooldown_seconds=None):
+        self.min_calls = min_calls if min_calls is not None else MODEL_BREAKER_MIN_CALLS
+        self.failure_rate = failure_rate if failure_rate is not None else MODEL_BREAKER_FAILURE_RATE
+        self.cooldown_seconds = cooldown_seconds if cooldown_seconds is not None else MODEL_BREAKER_COOLDOWN_SECONDS
+        self._outcomes = deque(maxlen=window or MODEL_BREAKER_WINDOW)
+        self._state = CIRCUIT_CLOSED
+        self._opened_at = 0.0
+        # Token of the half-open trial call in flight, if any
+        self._trial = None
+        self._trials = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state
+
+    def before_call(self):
+        """
+        Raises UpstreamUnavailable unless a call may go upstream now.
+
+        Returns:
+            A token when this call is the half-open trial, otherwise None; pass
+            it to release() once the call is over, however it ended
+        """
+        with self._lock:
+            if self._state == CIRCUIT_CLOSED:
+                return None
+            remaining = self._opened_at + self.cooldown_seconds - time.monotonic()
+            if self._state == CIRCUIT_OPEN and remaining <= 0:
+                self._state = CIRCUIT_HALF_OPEN
+            if self._state == CIRCUIT_HALF_OPEN and self._trial is None:
+                self._trials += 1
+                self._trial = self._trials
+                return self._trial
+        UPSTREAM_EVENTS.inc(event="rejected")
+        raise UpstreamUnavailable("Model upstream is failing; circuit breaker is open", max(1.0, remaining))
+
+    def record(self, success):
+        with self._lock:
+            if self._state == CIRCUIT_HALF_OPEN:
+                self._trial = None
+                if success:
+                    logger.info("Circuit breaker closed after a successful trial call")
+                    self._state = CIRCUIT_CLOSED
+                    self._outcomes.clear()
+                else:
+                    self._trip()
+                return
+
+            self._outcomes.append(success)
+            failures = self._outcomes.count(False)
+            if (self._state == CIRCUIT_CLOSED and len(self._outcomes) >= self.min_calls
+                    and failures / len(self._outcomes) >= self.failure_rate):
+                logger.warning(f"Circuit breaker opened: {failures} of the last {len(self._outcomes)} model calls failed")
+                self._trip()
+
+    def release(self, trial):
+        """
+        Frees the trial slot taken by before_call() if the trial recorded no
+        outcome - a request error, a cancelled call or an abandoned stream - so
+        the next call can be the trial instead.
+        """
+        if trial is None:
+            return
+        with self._lock:
+            if self._trial == trial:
+                self._trial = None
+
+    def _trip(self):
+        self._state = CIRCUIT_OPEN
+        self._opened_at = time.monotonic()
+        UPSTREAM_EVENTS.inc(event="circuit_opened")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "state": self._state,
+                "recent_calls": len(self._outcomes),
+                "recent_failures": self._outcomes.count(False),
+            }
+
+
+class LatencyTracker:
+    """Recent successful call latencies per template, for picking the hedge delay."""
+
+    def __init__(self, window=200):
+        self.window = window
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, seconds):
+        with self._lock:
+            self._samples.setdefault(name, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, name, fraction, min_samples):
+        with self._lock:
+            samples = sorted(self._samples.get(name, ()))
+        if len(samples) < min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(fraction * len(samples)))]
+
+
+class UpstreamGuard:
+    """
+    Runs blocking model calls with a deadline, retries, optional hedging and a
+    circuit breaker.
+
+    Calls run on a shared thread pool so the caller can give up at the
+    deadline. An abandoned call keeps its pool thread until the upstream
+    answers, and its result is discarded. acall() is the coroutine version
+    for the async serving path; its attempts are tasks, and abandoned ones are
+    cancelled rather than left running.
+    """
+
+    def __init__(self, breaker=None, retries=None, hedge_percentile=None):
+        self.breaker = breaker or CircuitBreaker()
+        self.retries = retries if retries is not None else MODEL_RETRIES
+        self.hedge_percentile = hedge_percentile if hedge_percentile is not None else MODEL_HEDGE_PERCENTILE
+        self.latencies = LatencyTracker()
+        self._executor = ThreadPoolExecutor(max_workers=MODEL_UPSTREAM_WORKERS, thread_name_prefix="yodel-upstream")
+
+    def call(self, name, fn, deadline):
+        """
+        Returns fn(), the upstream call for template `name`, by deadline (a
+        time.monotonic() value, usually shared by every call of a request).
+
+        Raises:
+            UpstreamUnavailable: If the circuit breaker is open
+            UpstreamTimeout: If no attempt finished before the deadline
+        """
+        self._check_deadline(name, deadline)
+        attempt = 0
+        while True:
+            trial = self.breaker.before_call()
+            try:
+                result = self._attempt(name, fn, deadline)
+            except Exception as e:
+                backoff = self._retry_backoff(name, e, attempt, deadline)
+                if backoff is None:
+                    raise
+            else:
+                self.breaker.record(True)
+                return result
+            finally:
+                self.breaker.release(trial)
+            attempt += 1
+            time.sleep(backoff)
+
+    async def acall(self, name, afn, deadline):
+        """
+        Coroutine version of call(): returns await afn() by deadline.
+
+        Raises:
+            UpstreamUnavailable: If the circuit breaker is open
+            UpstreamTimeout: If no attempt finished before the deadline
+        """
+        self._check_deadline(name, deadline)
+        attempt = 0
+        while True:
+            trial = self.breaker.before_call()
+            try:
+                result = await self._aattempt(name, afn, deadline)
+            except Exception as e:
+                backoff = self._retry_backoff(name, e, attempt, deadline)
+                if backoff is None:
+                    raise
+            else:
+                self.breaker.record(True)
+                return result
+            finally:
+                # Also reached when the caller is cancelled mid-attempt
+                self.breaker.release(trial)
+            attempt += 1
+            await asyncio.sleep(backoff)
+
+    def _retry_backoff(self, name, error, attempt, deadline):
+        """Records a failed attempt; returns the delay before the next one, or None when it shouldn't be retried."""
+        # Errors caused by the request itself (bad input, replay misses) say nothing about upstream health
+        if not is_retryable(error):
+            return None
+        self.breaker.record(False)
+        if attempt >= self.retries:
+            return None
+        backoff = random.uniform(0, MODEL_RETRY_BACKOFF_SECONDS * 2 ** attempt)
+        if time.monotonic() + backoff >= deadline:
+            return None
+        UPSTREAM_EVENTS.inc(event="retry")
+        logger.warning(f"Model call '{name}' failed ({type(error).__name__}: {str(error)}); retry {attempt + 1} in {backoff:.1f}s")
+        return backoff
+
+    def guard_stream(self, name, chunks, deadline):
+        """
+        Applies the circuit breaker and deadline to a streamed call (streams have
+        no retries: values already sent can't be taken back). Each chunk is
+        awaited on the upstream pool, so a stream that stalls is abandoned at
+        the deadline rather than holding the caller's thread.
+
+        Raises:
+            UpstreamUnavailable: If the circuit breaker is open
+            UpstreamTimeout: If the stream hadn't finished by the deadline
+        """
+        self._check_deadline(name, deadline)
+        trial = self.breaker.before_call()
+        start = time.monotonic()
+        finished = object()
+        stalled = False
+        try:
+            while True:
+                future = self._executor.submit(next, chunks, finished)
+                try:
+                    chunk = future.result(timeout=max(0.0, deadline - time.monotonic()))
+                except FutureTimeout:
+                    # The pool thread stays blocked on the upstream until it answers; its chunk is discarded
+                    stalled = True
+                    UPSTREAM_EVENTS.inc(event="timeout")
+                    raise UpstreamTimeout(f"Model stream '{name}' did not finish within {deadline - start:.0f}s")
+                if chunk is finished:
+                    break
+                yield chunk
+        except Exception as e:
+            if is_retryable(e):
+                self.breaker.record(False)
+            raise
+        else:
+            self.breaker.record(True)
+        finally:
+            # Also reached when the client disconnects and this generator is closed
+            self.breaker.release(trial)
+            if not stalled and hasattr(chunks, "close"):
+                chunks.close()
+
+    @staticmethod
+    def _check_deadline(name, deadline):
+        """Raises UpstreamTimeout, without calling upstream, once the request's deadline has passed."""
+        if time.monotonic() >= deadline:
+            UPSTREAM_EVENTS.inc(event="timeout")
+            raise UpstreamTimeout(f"No time left for model call '{name}'")
+
+    def _attempt(self, name, fn, deadline):
+        start = time.monotonic()
+        pending = {self._executor.submit(fn)}
+
+        hedge_delay = None
+        if self.hedge_percentile:
+            hedge_delay = self.latencies.percentile(name, self.hedge_percentile, MODEL_HEDGE_MIN_SAMPLES)
+        if hedge_delay is not None and start + hedge_delay < deadline:
+            done, _ = wait(pending, timeout=hedge_delay)
+            if not done:
+                UPSTREAM_EVENTS.inc(event="hedge")
+                logger.info(f"Model call '{name}' slower than {hedge_delay:.1f}s; sending a hedged request")
+                pending.add(self._executor.submit(fn))
+
+        error = None
+        while pending:
+            done, pending = wait(pending, timeout=max(0.0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                if future.exception() is None:
+                    self.latencies.observe(name, time.monotonic() - start)
+                    return future.result()
+                error = future.exception()
+        if error is not None and not pending:
+            raise error
+        UPSTREAM_EVENTS.inc(event="timeout")
+        raise UpstreamTimeout(f"Model call '{name}' did not finish within {deadline - start:.0f}s")
+
+    async def _aattempt(self, name, afn, deadline):
+        start = time.monotonic()
+        pending = {asyncio.ensure_future(afn())}
+        try:
+            hedge_delay = None
+            if self.hedge_percentile:
+                hedge_delay = self.latencies.percentile(name, self.hedge_percentile, MODEL_HEDGE_MIN_SAMPLES)
+            if hedge_delay is not None and start + hedge_delay < deadline:
+                done, _ = await asyncio.wait(pending, timeout=hedge_delay)
+                if not done:
+                    UPSTREAM_EVENTS.inc(event="hedge")
+                    logger.info(f"Model call '{name}' slower than {hedge_delay:.1f}s; sending a hedged request")
+                    pending.add(asyncio.ensure_future(afn()))
+
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, timeout=max(0.0, deadline - time.monotonic()), return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    break
+                for task in done:
+                    if task.exception() is None:
+                        self.latencies.observe(name, time.monotonic() - start)
+                        return task.result()
+                    error = task.exception()
+            if error is not None and not pending:
+                raise error
+            UPSTREAM_EVENTS.inc(event="timeout")
+            raise UpstreamTimeout(f"Model call '{name}' did not finish within {deadline - start:.0f}s")
+        finally:
+            # The losing hedge, or every attempt once the deadline passed or the caller went away
+            for task in pending:
+                task.cancel()
+
+    def stats(self):
+        return dict(self.breaker.stats(), retries=self.retries, hedge_percentile=self.hedge_percentile or None)
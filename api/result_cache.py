@@ -0,0 +1,221 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "results.sqlite3")
+
+# Least recently used rows read per step when trimming the disk tier
+EVICTION_BATCH_SIZE = 64
+
+
+def sha256_hex(data):
+    """Returns the hex SHA-256 digest of bytes or a string."""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+def schema_version(schema):
+    """Returns a short, stable fingerprint for a JSON schema dictionary."""
+    return sha256_hex(json.dumps(schema, sort_keys=True))[:16]
+
+
+def make_cache_key(kind, **parts):
+    """
+    Builds a content-addressed cache key.
+
+    Args:
+        kind: The call being cached, e.g. "analyze" or "compare"
+        **parts: Everything that influences the model output (audio hashes,
+            model name, schema version, thinking budget, prompt context)
+    """
+    return f"{kind}:" + sha256_hex(json.dumps(parts, sort_keys=True, default=str))
+
+
+class ResultCache:
+    """
+    Two-tier cache for model responses.
+
+    The first tier is an in-process LRU dictionary. The second tier is a SQLite
+    file that every gunicorn worker opens, so a response computed by one worker
+    is a hit for the others. Both tiers honour the same TTL; the disk tier is
+    additionally trimmed to a maximum size, least recently used first. Its
+    byte total is kept up to date by triggers in the file itself, so every
+    worker sees the same figure without summing the table on each write.
+    """
+
+    def __init__(self, path=None, ttl_seconds=None, max_bytes=None, memory_entries=None):
+        if path is None:
+            path = os.environ.get("RESULT_CACHE_PATH", DEFAULT_CACHE_PATH)
+        self.path = path or None
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else int(os.environ.get("RESULT_CACHE_TTL_SECONDS", 7 * 24 * 3600))
+        self.max_bytes = max_bytes if max_bytes is not None else int(os.environ.get("RESULT_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+        self.memory_entries = memory_entries if memory_entries is not None else int(os.environ.get("RESULT_CACHE_MEMORY_ENTRIES", 256))
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._counters = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "bypasses": 0,
+            "stores": 0,
+            "evictions": 0,
+        }
+
+        if self.path:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with self._connection() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS results ("
+                    "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                    "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS results_accessed_at ON results (accessed_at)")
+                conn.execute("CREATE INDEX IF NOT EXISTS results_created_at ON results (created_at)")
+                conn.execute("CREATE TABLE IF NOT EXISTS results_size (id INTEGER PRIMARY KEY CHECK (id = 0), total INTEGER NOT NULL)")
+                conn.execute(
+                    "CREATE TRIGGER IF NOT EXISTS results_size_insert AFTER INSERT ON results "
+                    "BEGIN UPDATE results_size SET total = total + NEW.size; END"
+                )
+                conn.execute(
+                    "CREATE TRIGGER IF NOT EXISTS results_size_delete AFTER DELETE ON results "
+                    "BEGIN UPDATE results_size SET total = total - OLD.size; END"
+                )
+                conn.execute(
+                    "CREATE TRIGGER IF NOT EXISTS results_size_update AFTER UPDATE OF size ON results "
+                    "BEGIN UPDATE results_size SET total = total - OLD.size + NEW.size; END"
+                )
+                # Seeds the total for a file written before it was tracked
+                conn.execute("INSERT OR IGNORE INTO results_size (id, total) SELECT 0, COALESCE(SUM(size), 0) FROM results")
+            logger.info(f"Result cache disk tier at {self.path}")
+
+    def get(self, key):
+        """Returns the cached value for key, or None on a miss."""
+        now = time.time()
+
+        with self._lock:
+            item = self._memory.get(key)
+            if item is not None:
+                value, created_at = item
+                if now - created_at < self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    self._counters["memory_hits"] += 1
+                    return value
+                del self._memory[key]
+
+        if self.path:
+            try:
+                with self._connection() as conn:
+                    row = conn.execute(
+                        "SELECT value, created_at FROM results WHERE key = ?", (key,)
+                    ).fetchone()
+                    if row is not None and now - row[1] < self.ttl_seconds:
+                        conn.execute("UPDATE results SET accessed_at = ? WHERE key = ?", (now, key))
+                        self._remember(key, row[0], row[1])
+                        with self._lock:
+                            self._counters["disk_hits"] += 1
+                        return row[0]
+            except sqlite3.Error as e:
+                logger.warning(f"Result cache disk read failed: {str(e)}")
+
+        with self._lock:
+            self._counters["misses"] += 1
+        return None
+
+    def put(self, key, value):
+        """Stores value under key in both tiers."""
+        now = time.time()
+        self._remember(key, value, now)
+
+        if self.path:
+            try:
+                with self._connection() as conn:
+                    # An upsert rather than INSERT OR REPLACE, whose implicit delete skips the size triggers
+                    conn.execute(
+                        "INSERT INTO results (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?) "
+                        "ON CONFLICT (key) DO UPDATE SET value = excluded.value, size = excluded.size, "
+                        "created_at = excluded.created_at, accessed_at = excluded.accessed_at",
+                        (key, value, len(value), now, now),
+                    )
+                    self._evict(conn, now)
+            except sqlite3.Error as e:
+                logger.warning(f"Result cache disk write failed: {str(e)}")
+
+        with self._lock:
+            self._counters["stores"] += 1
+
+    def record_bypass(self):
+        with self._lock:
+            self._counters["bypasses"] += 1
+
+    def stats(self):
+        """Returns hit/miss counters and tier sizes."""
+        with self._lock:
+            stats = dict(self._counters)
+            stats["memory_entries"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 4) if lookups else 0.0
+
+        if self.path:
+            try:
+                with self._connection() as conn:
+                    stats["disk_entries"] = conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+                    stats["disk_bytes"] = self._disk_bytes(conn)
+            except sqlite3.Error as e:
+                logger.warning(f"Result cache stats failed: {str(e)}")
+        return stats
+
+    def _remember(self, key, value, created_at):
+        with self._lock:
+            self._memory[key] = (value, created_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def _evict(self, conn, now):
+        expired = conn.execute("DELETE FROM results WHERE created_at < ?", (now - self.ttl_seconds,)).rowcount
+        evicted = max(expired, 0)
+
+        total = self._disk_bytes(conn)
+        while total > self.max_bytes:
+            rows = conn.execute(
+                "SELECT key, size FROM results ORDER BY accessed_at ASC LIMIT ?", (EVICTION_BATCH_SIZE,)
+            ).fetchall()
+            if not rows:
+                break
+            doomed = []
+            for key, size in rows:
+                if total <= self.max_bytes:
+                    break
+                doomed.append((key,))
+                total -= size
+            conn.executemany("DELETE FROM results WHERE key = ?", doomed)
+            evicted += len(doomed)
+
+        if evicted:
+            with self._lock:
+                self._counters["evictions"] += evicted
+
+    @staticmethod
+    def _disk_bytes(conn):
+        row = conn.execute("SELECT total FROM results_size WHERE id = 0").fetchone()
+        return row[0] if row is not None else 0
+
+    def _connection(self):
+        # sqlite3 connections are per-thread; WAL lets several workers read while one writes
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
@@ -0,0 +1,276 @@
+import re
+import json
+
+_INVALID = object()
+
+_FENCE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$")
+
+
+class InvalidModelResponse(ValueError):
+    """Raised when a model response still misses required sections after repair and re-asking."""
+
+
+def format_path(path):
+    """Renders a path tuple like ("yodelComparison", "metrics") as yodelComparison.metrics."""
+    text = ""
+    for key in path:
+        text += f"[{key}]" if isinstance(key, int) else (f".{key}" if text else key)
+    return text or "(document)"
+
+
+class RepairReport:
+    """
+    What a repair pass changed.
+
+    Attributes:
+        repairs: Human-readable descriptions of each fix (closed truncation, dropped items, ...)
+        missing: Paths of required sections that could not be kept; these have to be re-asked.
+            They are always object keys reachable from the root without crossing an array
+    """
+
+    def __init__(self):
+        self.repairs = []
+        self.missing = []
+
+    @property
+    def valid(self):
+        return not self.repairs and not self.missing
+
+
+def close_truncated_json(text):
+    """
+    Parses JSON that may have been cut off mid-document.
+
+    The text is first tried as-is, then cut back to the end of the last
+    complete array element or object member, closing whatever brackets are
+    still open at that point. A string cut off mid-way is dropped rather than
+    closed, so half-written feedback never reaches the user.
+
+    Returns:
+        The parsed value, or None if nothing usable could be recovered
+    """
+    stack = []
+    cuts = []  # (position, open brackets at that position)
+    in_string = False
+    escaped = False
+    for index, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append(char)
+            cuts.append((index + 1, tuple(stack)))
+        elif char in "}]":
+            if stack:
+                stack.pop()
+        elif char == ",":
+            cuts.append((index, tuple(stack)))
+
+    candidates = [] if in_string else [(text, tuple(stack))]
+    candidates.extend((text[:position], opened) for position, opened in reversed(cuts))
+    for prefix, opened in candidates:
+        closers = "".join("}" if bracket == "{" else "]" for bracket in reversed(opened))
+        try:
+            return json.loads(prefix + closers)
+        except json.JSONDecodeError:
+            continue
+    return None
+
+
+def _type_check(expected):
+    if expected == "integer":
+        return lambda v: isinstance(v, int) and not isinstance(v, bool)
+    if expected == "number":
+        return lambda v: isinstance(v, (int, float)) and not isinstance(v, bool)
+    if expected == "string":
+        return lambda v: isinstance(v, str)
+    if expected == "boolean":
+        return lambda v: isinstance(v, bool)
+    if expected == "object":
+        return lambda v: isinstance(v, dict)
+    if expected == "array":
+        return lambda v: isinstance(v, list)
+    return lambda v: True
+
+
+def _compile(schema):
+    """
+    Compiles a schema node into repair(value, path, report, in_array), which
+    returns the (possibly fixed) value or _INVALID. Supports the keywords the
+    yodel schemas use: type, properties, required, items, enum, minimum,
+    maximum and pattern.
+    """
+    expected = schema.get("type")
+    is_type = _type_check(expected)
+
+    if expected == "object":
+        properties = {name: _compile(child) for name, child in schema.get("properties", {}).items()}
+        required = tuple(schema.get("required", ()))
+
+        def repair_object(value, path, report, in_array):
+            if not is_type(value):
+                return _INVALID
+            for name, repair_child in properties.items():
+                if name not in value:
+                    continue
+                fixed = repair_child(value[name], path + (name,), report, in_array)
+                if fixed is _INVALID:
+                    del value[name]
+                    if name not in required:
+                        report.repairs.append(f"dropped invalid {format_path(path + (name,))}")
+                else:
+                    value[name] = fixed
+            for name in required:
+                if name not in value:
+                    if in_array:
+                        return _INVALID
+                    report.missing.append(path + (name,))
+            return value
+        return repair_object
+
+    if expected == "array":
+        repair_item = _compile(schema.get("items", {}))
+
+        def repair_array(value, path, report, in_array):
+            if not is_type(value):
+                return _INVALID
+            kept = []
+            for index, item in enumerate(value):
+                fixed = repair_item(item, path + (index,), report, True)
+                if fixed is _INVALID:
+                    report.repairs.append(f"dropped invalid {format_path(path + (index,))}")
+                else:
+                    kept.append(fixed)
+            if len(kept) != len(value):
+                value[:] = kept
+            return value
+        return repair_array
+
+    enum = tuple(schema["enum"]) if "enum" in schema else None
+    pattern = re.compile(schema["pattern"]) if "pattern" in schema else None
+    minimum = schema.get("minimum")
+    maximum = schema.get("maximum")
+    numeric = expected in ("integer", "number")
+
+    def repair_scalar(value, path, report, in_array):
+        if not is_type(value):
+            value = _coerce(value, expected)
+            if value is _INVALID or not is_type(value):
+                return _INVALID
+            report.repairs.append(f"converted {format_path(path)} to {expected}")
+        if enum is not None and value not in enum:
+            return _INVALID
+        if pattern is not None and not pattern.search(value):
+            return _INVALID
+        if numeric:
+            if minimum is not None and value < minimum:
+                report.repairs.append(f"clamped {format_path(path)} to {minimum}")
+                value = minimum
+            elif maximum is not None and value > maximum:
+                report.repairs.append(f"clamped {format_path(path)} to {maximum}")
+                value = maximum
+        return value
+    return repair_scalar
+
+
+def _coerce(value, expected):
+    """Cheap type fixes: 3.0 -> 3 for integers, numeric strings -> numbers."""
+    if isinstance(value, bool):
+        return _INVALID
+    if expected == "integer":
+        if isinstance(value, float) and value.is_integer():
+            return int(value)
+        if isinstance(value, str):
+            try:
+                return int(value.strip())
+            except ValueError:
+                return _INVALID
+    if expected == "number" and isinstance(value, str):
+        try:
+            return float(value.strip())
+        except ValueError:
+            return _INVALID
+    return _INVALID
+
+
+def subschema(schema, paths):
+    """
+    Narrows schema to the sections at paths (object keys from the root), keeping
+    the enclosing objects so the answer has the same shape as the full response.
+    """
+    if () in paths:
+        return schema
+    narrowed = {key: value for key, value in schema.items() if key not in ("properties", "required")}
+    children = {}
+    for path in paths:
+        children.setdefault(path[0], []).append(path[1:])
+    narrowed["properties"] = {
+        name: subschema(schema["properties"][name], rest) for name, rest in children.items()
+    }
+    narrowed["required"] = list(children)
+    return narrowed
+
+
+def get_path(value, path):
+    for key in path:
+        value = value[key]
+    return value
+
+
+def set_path(document, path, value):
+    """Sets value at path in document, creating intermediate objects; returns the document."""
+    if not path:
+        return value
+    target = document
+    for key in path[:-1]:
+        target = target.setdefault(key, {})
+    target[path[-1]] = value
+    return document
+
+
+class Validator:
+    """
+    A response schema compiled once into nested closures.
+
+    repair() validates and fixes a parsed response in a single pass: invalid
+    array items and optional fields are dropped, near-miss scalars are converted
+    or clamped, and required sections that can't be kept are reported as
+    missing instead of failing the whole response.
+    """
+
+    def __init__(self, schema):
+        self.schema = schema
+        self._repair = _compile(schema)
+
+    def parse(self, text):
+        """
+        Parses and repairs a raw model response.
+
+        Returns:
+            A (value, RepairReport) tuple; value is None when nothing could be recovered
+        """
+        report = RepairReport()
+        try:
+            value = json.loads(text)
+        except json.JSONDecodeError:
+            value = close_truncated_json(_FENCE.sub("", text))
+            if value is None:
+                report.missing.append(())
+                return None, report
+            report.repairs.append("closed truncated JSON")
+        return self.repair(value, report), report
+
+    def repair(self, value, report=None):
+        """Repairs value in place where possible; returns the repaired value (None if invalid at the root)."""
+        report = report if report is not None else RepairReport()
+        fixed = self._repair(value, (), report, False)
+        if fixed is _INVALID:
+            report.missing.append(())
+            return None
+        return fixed
@@ -0,0 +1,229 @@
+# Define the yodel analysis schema
+yodel_analysis_schema = {
+    "$schema": "http://json-schema.org/draft-07/schema#",
+    "title": "Yodel Analysis",
+    "description": "A schema for analyzing yodeling performances from a video / audio source.",
+    "type": "object",
+    "properties": {
+        "yodelAnalysis": {
+            "type": "object",
+            "description": "The root object containing the yodel analysis.",
+            "properties": {
+                "video / audioSource": {
+                    "type": "string",
+                    "description": "The time range in the video / audio source that was analyzed.",
+                    "pattern": "^\\d{2}:\\d{2}-\\d{2}:\\d{2}$",
+                },
+                "totalYodelSyllables": {
+                    "type": "integer",
+                    "description": "The total count of yodel syllables in the analyzed segment.",
+                    "minimum": 0,
+                },
+                "phrases": {
+                    "type": "array",
+                    "description": "A list of distinct yodeling phrases identified in the segment.",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "phraseNumber": {
+                                "type": "integer",
+                                "description": "A sequential identifier for the phrase.",
+                                "minimum": 1,
+                            },
+                            "startTime": {
+                                "type": "string",
+                                "description": "The start time of the phrase in MM:SS.s format.",
+                                "pattern": "^\\d{2}:\\d{2}\\.\\d+$",
+                            },
+                            "endTime": {
+                                "type": "string",
+                                "description": "The end time of the phrase in MM:SS.s format.",
+                                "pattern": "^\\d{2}:\\d{2}\\.\\d+$",
+                            },
+                            "yodelSyllablesInPhrase": {
+                                "type": "integer",
+                                "description": "The count of yodel syllables within this specific phrase.",
+                                "minimum": 0,
+                            },
+                            "events": {
+                                "type": "array",
+                                "description": "A sequence of vocal events within the phrase.",
+                                "items": {
+                                    "type": "object",
+                                    "properties": {
+                                        "timestamp": {
+                                            "type": "string",
+                                            "description": "The precise time of the event in MM:SS.s format.",
+                                            "pattern": "^\\d{2}:\\d{2}\\.\\d+$",
+                                        },
+                                        "type": {
+                                            "type": "string",
+                                            "description": "The type of vocal event.",
+                                            "enum": ["headVoice", "chestVoice", "yodelBreak"],
+                                        },
+                                        "description": {
+                                            "type": "string",
+                                            "description": "A textual description of the vocal event.",
+                                        },
+                                        "syllable": {
+                                            "type": "string",
+                                            "description": "The phonetic syllable associated with the event.",
+                                        },
+                                        "pitch": {
+                                            "type": "object",
+                                            "description": "The musical pitch of the event.",
+                                            "properties": {
+                                                "note": {
+                                                    "type": "string",
+                                                    "description": "The musical note (e.g., A, B, C#).",
+                                                    "pattern": "^[A-G](?:#|b)?$",
+                                                },
+                                                "octave": {
+                                                    "type": "integer",
+                                                    "description": "The octave number for the note.",
+                                                },
+                                            },
+                                            "required": ["note", "octave"],
+                                        },
+                                    },
+                                    "required": [
+                                        "timestamp",
+                                        "type",
+                                        "description",
+                                        "syllable",
+                                        "pitch",
+                                    ],
+                                },
+                            },
+                            "notes": {
+                                "type": "string",
+                                "description": "General notes or observations about the phrase.",
+                            },
+                        },
+                        "required": [
+                            "phraseNumber",
+                            "startTime",
+                            "endTime",
+                            "yodelSyllablesInPhrase",
+                            "events",
+                            "notes",
+                        ],
+                    },
+                },
+            },
+            "required": ["video / audioSource", "totalYodelSyllables", "phrases"],
+        }
+    },
+    "required": ["yodelAnalysis"],
+}
+
+# Define the yodel comparison schema
+yodel_comparison_schema = {
+    "$schema": "http://json-schema.org/draft-07/schema#",
+    "title": "Yodel Comparison",
+    "description": "A schema for comparing two yodeling performances.",
+    "type": "object",
+    "properties": {
+        "yodelComparison": {
+            "type": "object",
+            "description": "The root object containing the yodel comparison analysis.",
+            "properties": {
+                "overallScore": {
+                    "type": "number",
+                    "description": "Overall performance score from 0-100.",
+                    "minimum": 0,
+                    "maximum": 100
+                },
+                "metrics": {
+                    "type": "object",
+                    "description": "Detailed comparison metrics.",
+                    "properties": {
+                        "pitchAccuracy": {
+                            "type": "object",
+                            "properties": {
+                                "score": {"type": "number", "minimum": 0, "maximum": 100},
+                                "averageDeviationCents": {"type": "number"},
+                                "description": {"type": "string"}
+                            },
+                            "required": ["score", "averageDeviationCents", "description"]
+                        },
+                        "timingAccuracy": {
+                            "type": "object",
+                            "properties": {
+                                "score": {"type": "number", "minimum": 0, "maximum": 100},
+                                "averageDeviationMs": {"type": "number"},
+                                "description": {"type": "string"}
+                            },
+                            "required": ["score", "averageDeviationMs", "description"]
+                        },
+                        "yodelBreakQuality": {
+                            "type": "object",
+                            "properties": {
+                                "score": {"type": "number", "minimum": 0, "maximum": 100},
+                                "smoothnessRating": {"type": "string", "enum": ["excellent", "good", "fair", "poor"]},
+                                "description": {"type": "string"}
+                            },
+                            "required": ["score", "smoothnessRating", "description"]
+                        },
+                        "syllableAccuracy": {
+                            "type": "object",
+                            "properties": {
+                                "score": {"type": "number", "minimum": 0, "maximum": 100},
+                                "matchedSyllables": {"type": "integer", "minimum": 0},
+                                "totalSyllables": {"type": "integer", "minimum": 0},
+                                "description": {"type": "string"}
+                            },
+                            "required": ["score", "matchedSyllables", "totalSyllables", "description"]
+                        },
+                        "rhythmConsistency": {
+                            "type": "object",
+                            "properties": {
+                                "score": {"type": "number", "minimum": 0, "maximum": 100},
+                                "tempoVariation": {"type": "number"},
+                                "description": {"type": "string"}
+                            },
+                            "required": ["score", "tempoVariation", "description"]
+                        }
+                    },
+                    "required": ["pitchAccuracy", "timingAccuracy", "yodelBreakQuality", "syllableAccuracy", "rhythmConsistency"]
+                },
+                "feedback": {
+                    "type": "object",
+                    "description": "Detailed feedback for improvement.",
+                    "properties": {
+                        "strengths": {
+                            "type": "array",
+                            "description": "Areas where the user performed well.",
+                            "items": {"type": "string"}
+                        },
+                        "areasForImprovement": {
+                            "type": "array",
+                            "description": "Specific areas that need work.",
+                            "items": {
+                                "type": "object",
+                                "properties": {
+                                    "area": {"type": "string"},
+                                    "suggestion": {"type": "string"},
+                                    "priority": {"type": "string", "enum": ["high", "medium", "low"]}
+                                },
+                                "required": ["area", "suggestion", "priority"]
+                            }
+                        },
+                        "practiceRecommendations": {
+                            "type": "array",
+                            "description": "Specific exercises or techniques to practice.",
+                            "items": {"type": "string"}
+                        },
+                        "overallFeedback": {
+                            "type": "string",
+                            "description": "General encouraging feedback and summary. Limit this to 160 characters."
+                        }
+                    },
+                    "required": ["strengths", "areasForImprovement", "practiceRecommendations", "overallFeedback"]
+                }
+            },
+            "required": ["overallScore", "metrics", "feedback"]
+        }
+    },
+    "required": ["yodelComparison"]
+}
@@ -0,0 +1,123 @@
+import asyncio
+import functools
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+        # Set when the leader was cancelled; waiters start over rather than share that
+        self.abandoned = False
+        # Run once the call finishes; how coroutines waiting on it are woken
+        self.callbacks = []
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls with the same key into one.
+
+    The first caller for a key runs the function; callers arriving while it is
+    still running wait for it and get the same return value (or exception).
+    Nothing is remembered once the call finishes - that's the result cache's job.
+    Threads (do) and coroutines (ado) can join each other's calls. A leader
+    that is cancelled (its client went away) isn't shared: its waiters join
+    again, and one of them runs the function instead.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._counters = {"calls": 0, "coalesced": 0}
+
+    def do(self, key, fn):
+        """
+        Runs fn() unless a call for key is already in flight.
+
+        Returns:
+            A (result, shared) tuple; shared is True when the result came from
+            another caller's in-flight call
+        """
+        while True:
+            call, leader = self._join(key)
+            if leader:
+                break
+            call.done.wait()
+            if not call.abandoned:
+                return self._shared_result(call)
+
+        try:
+            call.result = fn()
+            return call.result, False
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            self._finish(key, call)
+
+    async def ado(self, key, afn):
+        """Coroutine version of do(): awaits afn() unless a call for key is already in flight."""
+        loop = asyncio.get_running_loop()
+        while True:
+            woken = loop.create_future()
+            call, leader = self._join(key, functools.partial(loop.call_soon_threadsafe, _resolve, woken))
+            if leader:
+                break
+            await woken
+            if not call.abandoned:
+                return self._shared_result(call)
+
+        try:
+            call.result = await afn()
+            return call.result, False
+        except asyncio.CancelledError:
+            call.abandoned = True
+            raise
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            self._finish(key, call)
+
+    def _join(self, key, callback=None):
+        """Returns the in-flight call for key and whether this caller leads it (runs the function)."""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                if callback is not None:
+                    call.callbacks.append(callback)
+                return call, False
+            call = self._calls[key] = _Call()
+            self._counters["calls"] += 1
+            return call, True
+
+    def _finish(self, key, call):
+        with self._lock:
+            del self._calls[key]
+        call.done.set()
+        for callback in call.callbacks:
+            callback()
+
+    def _shared_result(self, call):
+        # Counted here rather than in _join() so a waiter that had to join
+        # again after an abandoned call still counts once
+        with self._lock:
+            self._counters["coalesced"] += 1
+        if call.error is not None:
+            raise call.error
+        return call.result, True
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats["in_flight"] = len(self._calls)
+        return stats
+
+
+def _resolve(future):
+    # A waiter whose request was cancelled no longer cares
+    if not future.done():
+        future.set_result(None)
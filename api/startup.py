@@ -0,0 +1,114 @@
+import os
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# When warm-up runs: "background" (default) on a thread while the server already
+# answers /health, "blocking" before the app module finishes importing (for
+# gunicorn --preload), or "off" to leave it all to the first requests
+STARTUP_WARM_UP = os.environ.get("STARTUP_WARM_UP", "background")
+
+
+def process_age_seconds():
+    """Seconds since this process started, from /proc; None where that isn't available."""
+    try:
+        with open("/proc/self/stat") as f:
+            # Fields after the parenthesised command name; starttime is field 22 of the whole line
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return max(0.0, uptime - start_ticks / os.sysconf("SC_CLK_TCK"))
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class StartupTimer:
+    """
+    Times the phases of startup and tracks whether warm-up has finished, for
+    /ready, the startup log line and /metrics.
+
+    A phase runs from the previous mark() to the one naming it. "boot" is the
+    time from process start (interpreter and server start-up) until this timer
+    was created, when /proc tells us when the process started.
+    """
+
+    def __init__(self):
+        self._created = time.perf_counter()
+        age = process_age_seconds()
+        self._process_start = self._created - age if age is not None else None
+        self._phases = [("boot", age)] if age is not None else []
+        self._last = self._created
+        self._ready_at = None
+        self.error = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self):
+        return self._ready_at is not None
+
+    def mark(self, phase):
+        """Ends the current phase under the name phase."""
+        now = time.perf_counter()
+        with self._lock:
+            self._phases.append((phase, now - self._last))
+            self._last = now
+
+    def warm_up(self, steps):
+        """
+        Runs steps, a list of (phase, fn) pairs, marking each phase as it
+        finishes, then reports ready (see STARTUP_WARM_UP). A failing step
+        leaves the process unready, so the platform replaces it rather than
+        routing traffic to it.
+        """
+        if STARTUP_WARM_UP == "off":
+            self._finish()
+        elif STARTUP_WARM_UP == "blocking":
+            self._run(steps)
+        else:
+            threading.Thread(target=self._run, args=(steps,), name="yodel-warm-up", daemon=True).start()
+
+    def _run(self, steps):
+        for phase, fn in steps:
+            try:
+                fn()
+            except Exception as e:
+                self.error = f"{phase}: {type(e).__name__}: {str(e)}"
+                logger.error(f"Warm-up failed in {phase}: {str(e)}", exc_info=True)
+                return
+            self.mark(phase)
+        self._finish()
+
+    def _finish(self):
+        self._ready_at = time.perf_counter()
+        report = self.report()
+        phases = ", ".join(f"{entry['phase']} {entry['ms']:.0f} ms" for entry in report["phases"])
+        logger.info(f"Ready {report['ready_after_ms']:.0f} ms after {'process start' if self._process_start is not None else 'import'} ({phases})")
+
+    def report(self):
+        """
+        Readiness, each phase's duration in the order they ran and the time
+        from process start (or, without /proc, from this timer's creation)
+        until ready - or until now, while still warming up.
+        """
+        with self._lock:
+            phases = list(self._phases)
+        start = self._process_start if self._process_start is not None else self._created
+        end = self._ready_at if self._ready_at is not None else time.perf_counter()
+        report = {
+            "ready": self.ready,
+            "phases": [{"phase": phase, "ms": round(seconds * 1000, 1)} for phase, seconds in phases],
+            "ready_after_ms" if self.ready else "elapsed_ms": round((end - start) * 1000, 1),
+        }
+        if self.error is not None:
+            report["error"] = self.error
+        return report
+
+    def phase_seconds(self):
+        with self._lock:
+            return dict(self._phases)
+
+
+# Created on first import, which api.py does before anything heavy
+startup_timer = StartupTimer()
@@ -0,0 +1,177 @@
+import os
+import re
+import gzip
+import hashlib
+import logging
+import mimetypes
+import threading
+from flask import Response, request, send_file
+
+try:
+    import brotli
+except ImportError:  # Optional: without it only prebuilt .br files are served
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Content worth compressing; images, audio and video are already compressed
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "application/manifest+json", "image/svg+xml", "application/xml")
+# Larger compressible files are only served compressed if a prebuilt .gz/.br exists
+MAX_RUNTIME_COMPRESS_BYTES = int(os.environ.get("STATIC_MAX_RUNTIME_COMPRESS_BYTES", 8 * 1024 * 1024))
+MIN_COMPRESS_BYTES = 1024
+
+# Create React App puts a content hash in every bundle and media filename, e.g. main.3f2a9c1b.js
+HASHED_NAME = re.compile(r"\.[0-9a-f]{8,}\.(?:chunk\.)?[A-Za-z0-9]+$")
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Everything else may change between deploys; clients revalidate with the ETag
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+ENCODING_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+
+class StaticAsset:
+    """One file of the frontend build plus whatever compressed variants exist for it."""
+
+    def __init__(self, relative_path, absolute_path):
+        self.relative_path = relative_path
+        self.absolute_path = absolute_path
+        stat = os.stat(absolute_path)
+        self.size = stat.st_size
+        self.mtime = stat.st_mtime
+        self.mimetype = mimetypes.guess_type(relative_path)[0] or "application/octet-stream"
+        self.immutable = bool(HASHED_NAME.search(os.path.basename(relative_path)))
+        self.cache_control = IMMUTABLE_CACHE_CONTROL if self.immutable else REVALIDATE_CACHE_CONTROL
+        self.compressible = self.mimetype.startswith(COMPRESSIBLE_TYPES) and self.size >= MIN_COMPRESS_BYTES
+        # encoding -> path of a prebuilt variant, or bytes compressed at startup
+        self.variants = {}
+        self._etag = None
+
+    @property
+    def etag(self):
+        """Strong ETag from the content hash, computed on first use so startup doesn't read every video."""
+        if self._etag is None:
+            digest = hashlib.sha256()
+            with open(self.absolute_path, "rb") as f:
+                for block in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(block)
+            self._etag = digest.hexdigest()[:32]
+        return self._etag
+
+
+class StaticIndex:
+    """
+    In-memory index of the React build, created once at startup.
+
+    Lookups are dictionary hits, so a missing file never raises, and paths that
+    aren't in the index can't escape the build directory. Compressible files
+    are served gzip/brotli encoded when the client accepts it, using prebuilt
+    .gz/.br files where the build produced them and compressing the rest once
+    here. Hashed bundle files get immutable caching; everything else gets a
+    strong ETag and is revalidated. Range requests are served from the
+    uncompressed file, so audio and video seek without downloading everything.
+    """
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self.assets = {}
+        self._lock = threading.Lock()
+
+    def load(self):
+        if not os.path.isdir(self.root):
+            logger.warning(f"Static folder {self.root} not found; frontend will not be served")
+            return self
+
+        prebuilt = {}
+        for directory, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                absolute_path = os.path.join(directory, filename)
+                relative_path = os.path.relpath(absolute_path, self.root).replace(os.sep, "/")
+                for encoding, suffix in ENCODING_SUFFIXES.items():
+                    if relative_path.endswith(suffix):
+                        prebuilt[(relative_path[:-len(suffix)], encoding)] = absolute_path
+                        break
+                else:
+                    self.assets[relative_path] = StaticAsset(relative_path, absolute_path)
+
+        for (relative_path, encoding), absolute_path in prebuilt.items():
+            asset = self.assets.get(relative_path)
+            if asset is not None:
+                asset.variants[encoding] = absolute_path
+            else:
+                # A precompressed file with no original; serve it as-is
+                self.assets[relative_path + ENCODING_SUFFIXES[encoding]] = StaticAsset(
+                    relative_path + ENCODING_SUFFIXES[encoding], absolute_path
+                )
+
+        compressed = 0
+        for asset in self.assets.values():
+            if not asset.compressible or asset.size > MAX_RUNTIME_COMPRESS_BYTES:
+                continue
+            with open(asset.absolute_path, "rb") as f:
+                data = f.read()
+            if "gzip" not in asset.variants:
+                asset.variants["gzip"] = gzip.compress(data, compresslevel=9, mtime=0)
+                compressed += 1
+            if "br" not in asset.variants and brotli is not None:
+                asset.variants["br"] = brotli.compress(data)
+
+        logger.info(f"Indexed {len(self.assets)} static files from {self.root} ({compressed} compressed at startup)")
+        return self
+
+    def get(self, path):
+        return self.assets.get(path.lstrip("/"))
+
+    def resolve(self, path):
+        """
+        Maps a request path to an asset: the file itself, or index.html for
+        client-side routes. Paths with a file extension that aren't in the
+        build are real misses and return None rather than the app shell.
+        """
+        asset = self.get(path)
+        if asset is not None:
+            return asset
+        if os.path.splitext(path)[1]:
+            return None
+        return self.get("index.html")
+
+    def serve(self, asset):
+        """Builds the response for asset, honouring Accept-Encoding, If-None-Match and Range."""
+        encoding = self._negotiate(asset)
+        if encoding is not None:
+            response = self._encoded_response(asset, encoding)
+        else:
+            response = send_file(
+                asset.absolute_path,
+                mimetype=asset.mimetype,
+                etag=asset.etag,
+                conditional=True,
+                last_modified=asset.mtime,
+                max_age=None,
+            )
+            response.headers["Accept-Ranges"] = "bytes"
+
+        response.headers["Cache-Control"] = asset.cache_control
+        if asset.variants:
+            response.vary.add("Accept-Encoding")
+        return response
+
+    def _negotiate(self, asset):
+        # Byte ranges refer to the identity encoding, so never mix them with compression
+        if not asset.variants or request.range is not None:
+            return None
+        accepted = request.accept_encodings
+        for encoding in ("br", "gzip"):
+            if encoding in asset.variants and accepted[encoding]:
+                return encoding
+        return None
+
+    def _encoded_response(self, asset, encoding):
+        variant = asset.variants[encoding]
+        if isinstance(variant, bytes):
+            response = Response(variant, mimetype=asset.mimetype)
+        else:
+            response = send_file(variant, mimetype=asset.mimetype, conditional=False, max_age=None)
+        response.headers["Content-Encoding"] = encoding
+        response.set_etag(f"{asset.etag}-{encoding}")
+        response.last_modified = asset.mtime
+        return response.make_conditional(request)
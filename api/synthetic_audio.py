@@ -0,0 +1,18 @@
+import numpy as np
+from wav_io import encode_wav
+
+
+def synthetic_wav(megabytes=None, seconds=None, sample_rate=44100, seed=0):
+    """
+    A yodel-like take (chest/head alternation with vibrato) as 16-bit mono WAV,
+    sized either in megabytes or in seconds. Used by the benchmark and load-test
+    scripts so they run without the real step recordings.
+    """
+    rng = np.random.default_rng(seed)
+    n = int(seconds * sample_rate) if seconds is not None else int(megabytes * 1024 * 1024 / 2)
+    t = np.arange(n) / sample_rate
+    note_index = (t // 0.4).astype(int)
+    base = np.where(note_index % 2 == 0, 220.0, 440.0) * (1 + 0.01 * np.sin(2 * np.pi * 5.5 * t))
+    phase = 2 * np.pi * np.cumsum(base) / sample_rate
+    samples = 0.4 * np.sin(phase) + 0.1 * np.sin(2 * phase) + 0.01 * rng.standard_normal(n)
+    return encode_wav(samples.astype(np.float32), sample_rate)
@@ -0,0 +1,98 @@
+import time
+import threading
+import pytest
+from admission import AdmissionController, LoadShed, WorkClass
+from synthetic_audio import synthetic_wav
+
+
+def controller(max_concurrency=1, max_queue=4, deadline_seconds=110):
+    return AdmissionController(max_concurrency=max_concurrency, classes=[
+        WorkClass("analyze", 0, max_concurrency=max_concurrency, max_queue=max_queue, deadline_seconds=deadline_seconds),
+        WorkClass("batch", 2, max_concurrency=max_concurrency, max_queue=max_queue, deadline_seconds=deadline_seconds),
+    ])
+
+
+def wait_for_queued(admission, count):
+    while sum(entry["queued"] for entry in admission.stats()["classes"].values()) < count:
+        time.sleep(0.001)
+
+
+@pytest.fixture(scope="module")
+def api_module(tmp_path_factory):
+    """The Flask app with the fake model backend and its state in a scratch directory."""
+    state = tmp_path_factory.mktemp("state")
+    with pytest.MonkeyPatch.context() as env:
+        env.setenv("RESULT_CACHE_PATH", "")
+        env.setenv("JOB_STORE_PATH", str(state / "jobs.sqlite3"))
+        env.setenv("HISTORY_STORE_PATH", str(state / "history.sqlite3"))
+        env.setenv("REFERENCE_STEPS_DIRS", str(state))
+        env.setenv("MODEL_BACKEND", "fake")
+        env.setenv("MODEL_FAKE_LATENCY_SECONDS", "0")
+        env.setenv("MODEL_FAKE_JITTER_SECONDS", "0")
+        env.setenv("LOG_FILE", "")
+        import api
+        yield api
+
+
+def test_free_slot_runs_immediately():
+    admission = controller()
+    with admission.slot("analyze"):
+        assert admission.stats()["running"] == 1
+    stats = admission.stats()["classes"]["analyze"]
+    assert (stats["running"], stats["admitted"], stats["shed"]) == (0, 1, 0)
+
+
+def test_full_queue_is_shed_with_retry_after():
+    admission = controller(max_queue=0)
+    with admission.slot("analyze"):
+        with pytest.raises(LoadShed) as shed:
+            with admission.slot("analyze"):
+                pytest.fail("admitted past a full queue")
+    assert shed.value.retry_after >= 1
+    assert admission.stats()["classes"]["analyze"]["shed"] == 1
+
+
+def test_call_that_would_miss_its_deadline_is_shed_before_queueing():
+    admission = controller(deadline_seconds=30)
+    # Another call already takes most of the deadline
+    admission.classes["analyze"].service_seconds = 20
+    with admission.slot("analyze"):
+        with pytest.raises(LoadShed, match="deadline"):
+            admission.check("analyze")
+        assert admission.stats()["classes"]["analyze"]["queued"] == 0
+
+
+def test_freed_slot_goes_to_the_highest_priority_waiter():
+    admission = controller()
+    order = []
+
+    def run(name):
+        with admission.slot(name):
+            order.append(name)
+
+    holder = admission.slot("analyze")
+    holder.__enter__()
+    batch = threading.Thread(target=run, args=("batch",))
+    batch.start()
+    wait_for_queued(admission, 1)
+    analyze = threading.Thread(target=run, args=("analyze",))
+    analyze.start()
+    wait_for_queued(admission, 2)
+    holder.__exit__(None, None, None)
+    batch.join(5)
+    analyze.join(5)
+
+    assert order == ["analyze", "batch"]
+
+
+def test_shed_request_gets_503_with_retry_after(api_module, monkeypatch):
+    admission = controller(max_queue=0)
+    monkeypatch.setattr(api_module, "admission", admission)
+    client = api_module.app.test_client()
+
+    with admission.slot("analyze"):
+        response = client.post("/analyze-yodel", data=synthetic_wav(seconds=2), content_type="audio/wav")
+
+    assert response.status_code == 503
+    assert int(response.headers["Retry-After"]) >= 1
+    assert response.get_json()["type"] == "LoadShed"
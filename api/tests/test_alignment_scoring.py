@@ -0,0 +1,40 @@
+import numpy as np
+import alignment_scoring
+from alignment_scoring import banded_dtw, build_comparison, score_comparison
+from synthetic_audio import synthetic_wav
+
+
+def test_banded_dtw_follows_a_time_shift():
+    reference = np.array([60.0] * 20 + [72.0] * 20 + [60.0] * 20)
+    # The same melody sung five frames late
+    user = np.concatenate([np.full(5, np.nan), reference[:-5]])
+    reference_frames, user_frames = banded_dtw(reference, user, radius=10)
+
+    assert (reference_frames[0], user_frames[0]) == (0, 0)
+    assert (reference_frames[-1], user_frames[-1]) == (len(reference) - 1, len(user) - 1)
+    assert np.all(np.diff(reference_frames) >= 0) and np.all(np.diff(user_frames) >= 0)
+    # The octave jump lines up with the user's, five frames later
+    jump = list(reference_frames).index(20)
+    assert user_frames[jump] == 25
+
+
+def test_take_scored_against_itself_scores_high():
+    wav = synthetic_wav(seconds=6)
+    metrics = score_comparison(wav, wav)
+    assert metrics["pitchAccuracy"]["score"] >= 95
+    assert metrics["timingAccuracy"]["score"] >= 95
+
+    comparison = build_comparison(metrics)["yodelComparison"]
+    assert comparison["overallScore"] >= 75
+    assert comparison["feedback"]["areasForImprovement"] == []
+
+
+def test_only_reference_contours_are_cached(monkeypatch):
+    monkeypatch.setattr(alignment_scoring, "REFERENCE_CONTOUR_CACHE_SIZE", 2)
+    monkeypatch.setattr(alignment_scoring, "_reference_contours", type(alignment_scoring._reference_contours)())
+    takes = [synthetic_wav(seconds=2, seed=seed) for seed in range(3)]
+
+    for take in takes:
+        score_comparison(take, takes[0])
+    assert len(alignment_scoring._reference_contours) == 2
+    assert alignment_scoring.reference_contour(takes[2]) is alignment_scoring.reference_contour(takes[2])
@@ -0,0 +1,63 @@
+import json
+import pytest
+from json_stream import IncrementalJsonParser, iter_matches
+
+PATTERNS = [("yodelAnalysis", "phrases", "*"), ("yodelAnalysis", "overallScore"), ()]
+
+DOCUMENT = {
+    "yodelAnalysis": {
+        "phrases": [
+            {"text": "hol-la-di {ri} \"o\"", "start": 0.5, "events": [1, 2]},
+            {"text": "a\\b]", "start": 2.25, "events": []},
+        ],
+        "overallScore": 72,
+        "notes": None,
+    }
+}
+
+
+def feed_in_pieces(text, size):
+    parser = IncrementalJsonParser(PATTERNS)
+    completed = []
+    for start in range(0, len(text), size):
+        completed.extend(parser.feed(text[start:start + size]))
+    completed.extend(parser.close())
+    return completed
+
+
+@pytest.mark.parametrize("size", [1, 3, 1000])
+def test_values_are_reported_as_they_close(size):
+    completed = feed_in_pieces(json.dumps(DOCUMENT, indent=2), size)
+    assert completed == [
+        (("yodelAnalysis", "phrases", 0), DOCUMENT["yodelAnalysis"]["phrases"][0]),
+        (("yodelAnalysis", "phrases", 1), DOCUMENT["yodelAnalysis"]["phrases"][1]),
+        (("yodelAnalysis", "overallScore"), 72),
+        ((), DOCUMENT),
+    ]
+
+
+def test_phrase_is_reported_before_the_document_ends():
+    text = json.dumps(DOCUMENT)
+    end_of_first_phrase = text.index("}", text.index("events")) + 1
+    parser = IncrementalJsonParser(PATTERNS)
+    assert parser.feed(text[:end_of_first_phrase]) == [
+        (("yodelAnalysis", "phrases", 0), DOCUMENT["yodelAnalysis"]["phrases"][0]),
+    ]
+    assert not parser.complete
+
+
+def test_replay_matches_streaming_order():
+    assert list(iter_matches(DOCUMENT, PATTERNS)) == feed_in_pieces(json.dumps(DOCUMENT), 7)
+
+
+def test_incomplete_document_fails_on_close():
+    parser = IncrementalJsonParser(PATTERNS)
+    parser.feed('{"yodelAnalysis": {"phrases": [')
+    with pytest.raises(json.JSONDecodeError):
+        parser.close()
+
+
+def test_bare_top_level_number_completes_on_close():
+    parser = IncrementalJsonParser([()])
+    assert parser.feed("42") == []
+    assert parser.close() == [((), 42)]
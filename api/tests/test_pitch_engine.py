@@ -0,0 +1,35 @@
+import tracemalloc
+import numpy as np
+import pitch_engine
+from synthetic_audio import synthetic_wav
+from wav_io import decode_wav
+
+
+def test_track_pitch_is_block_invariant(monkeypatch):
+    samples, sample_rate = decode_wav(synthetic_wav(seconds=12))
+    whole = pitch_engine.track_pitch(samples, sample_rate)
+
+    # Blocks that don't divide the frame count, so the last one is partial
+    monkeypatch.setattr(pitch_engine, "PITCH_BLOCK_FRAMES", 97)
+    blocked = pitch_engine.track_pitch(samples, sample_rate)
+
+    for expected, actual in zip(whole, blocked):
+        np.testing.assert_allclose(actual, expected, equal_nan=True)
+    assert np.isfinite(blocked[1]).mean() > 0.5
+
+
+def test_track_pitch_memory_does_not_grow_with_length():
+    def peak_bytes(seconds):
+        samples, sample_rate = decode_wav(synthetic_wav(seconds=seconds))
+        tracemalloc.start()
+        try:
+            pitch_engine.track_pitch(samples, sample_rate)
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    short, long = peak_bytes(30), peak_bytes(300)
+    # Ten times the audio may only add the per-frame results and decimated samples
+    # (~75 bytes per frame), not another ten copies of the block working set
+    assert long < short + 60 * 1024 * 1024
+    assert long < 100 * 1024 * 1024
@@ -0,0 +1,79 @@
+import time
+import threading
+import pytest
+from resilience import (
+    CIRCUIT_CLOSED, CIRCUIT_HALF_OPEN, CIRCUIT_OPEN, CircuitBreaker, UpstreamGuard, UpstreamTimeout, UpstreamUnavailable,
+)
+
+
+def open_breaker(cooldown_seconds=0.0):
+    breaker = CircuitBreaker(window=4, min_calls=2, failure_rate=0.5, cooldown_seconds=cooldown_seconds)
+    breaker.record(False)
+    breaker.record(False)
+    assert breaker.state == CIRCUIT_OPEN
+    return breaker
+
+
+def guard_for(breaker):
+    return UpstreamGuard(breaker, retries=0, hedge_percentile=0)
+
+
+def fail(error):
+    def call():
+        raise error
+    return call
+
+
+def test_open_breaker_rejects_calls_until_cooldown():
+    guard = guard_for(open_breaker(cooldown_seconds=60))
+    with pytest.raises(UpstreamUnavailable) as rejected:
+        guard.call("analysis", lambda: "never sent", time.monotonic() + 5)
+    assert 1.0 <= rejected.value.retry_after <= 60
+
+
+def test_only_one_trial_call_while_half_open():
+    breaker = open_breaker()
+    trial = breaker.before_call()
+    assert trial is not None and breaker.state == CIRCUIT_HALF_OPEN
+    with pytest.raises(UpstreamUnavailable):
+        breaker.before_call()
+
+
+def test_trial_slot_is_released_when_the_trial_raises_a_request_error():
+    breaker = open_breaker()
+    guard = guard_for(breaker)
+    # A request error says nothing about upstream health: no outcome is recorded...
+    with pytest.raises(ValueError):
+        guard.call("analysis", fail(ValueError("bad input")), time.monotonic() + 5)
+    assert breaker.state == CIRCUIT_HALF_OPEN
+    # ...but the next call may be the trial, and its success closes the circuit
+    assert guard.call("analysis", lambda: "ok", time.monotonic() + 5) == "ok"
+    assert breaker.state == CIRCUIT_CLOSED
+
+
+def test_failed_trial_reopens_the_circuit():
+    breaker = open_breaker()
+    with pytest.raises(ConnectionError):
+        guard_for(breaker).call("analysis", fail(ConnectionError("reset")), time.monotonic() + 5)
+    assert breaker.state == CIRCUIT_OPEN
+
+
+def test_trial_slot_is_released_when_a_stream_is_abandoned():
+    breaker = open_breaker()
+    stream = guard_for(breaker).guard_stream("analysis", iter(["{", "}"]), time.monotonic() + 5)
+    assert next(stream) == "{"
+    stream.close()
+    assert breaker.before_call() is not None
+
+
+def test_call_times_out_at_the_deadline():
+    guard = guard_for(CircuitBreaker())
+    release = threading.Event()
+    start = time.monotonic()
+    with pytest.raises(UpstreamTimeout):
+        guard.call("analysis", lambda: release.wait(5), start + 0.2)
+    release.set()
+    assert time.monotonic() - start < 1
+    # Later calls of the same request are refused without going upstream
+    with pytest.raises(UpstreamTimeout):
+        guard.call("analysis", lambda: pytest.fail("called after the deadline"), start + 0.2)
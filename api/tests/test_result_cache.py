@@ -0,0 +1,69 @@
+import sqlite3
+import result_cache
+from result_cache import ResultCache
+
+
+def disk_rows(path):
+    with sqlite3.connect(path) as conn:
+        return conn.execute("SELECT key, size FROM results ORDER BY accessed_at").fetchall()
+
+
+def test_memory_and_disk_tiers(tmp_path):
+    path = str(tmp_path / "results.sqlite3")
+    cache = ResultCache(path=path, memory_entries=1)
+    cache.put("a", "alpha")
+    cache.put("b", "beta")
+
+    assert cache.get("b") == "beta"
+    # Pushed out of the one-entry memory tier, still on disk
+    assert cache.get("a") == "alpha"
+    assert cache.get("missing") is None
+    # Another worker opening the same file sees both entries
+    assert ResultCache(path=path).get("b") == "beta"
+
+    stats = cache.stats()
+    assert (stats["memory_hits"], stats["disk_hits"], stats["misses"]) == (1, 1, 1)
+    assert stats["disk_entries"] == 2
+    assert stats["disk_bytes"] == len("alpha") + len("beta")
+
+
+def test_expired_entries_are_misses(tmp_path):
+    cache = ResultCache(path=str(tmp_path / "results.sqlite3"), ttl_seconds=0)
+    cache.put("a", "alpha")
+    assert cache.get("a") is None
+
+
+def test_disk_tier_is_trimmed_least_recently_used_first(tmp_path, monkeypatch):
+    # Small batches, so trimming has to take several steps
+    monkeypatch.setattr(result_cache, "EVICTION_BATCH_SIZE", 3)
+    path = str(tmp_path / "results.sqlite3")
+    cache = ResultCache(path=path, max_bytes=1000, memory_entries=0)
+    for i in range(10):
+        cache.put(f"k{i}", "v" * 100)
+    cache.get("k0")
+    cache.put("big", "v" * 550)
+
+    assert [key for key, _ in disk_rows(path)] == ["k7", "k8", "k9", "k0", "big"]
+    stats = cache.stats()
+    assert stats["evictions"] == 6
+    assert stats["disk_bytes"] == sum(size for _, size in disk_rows(path)) == 950
+
+
+def test_byte_total_follows_replaced_entries(tmp_path):
+    path = str(tmp_path / "results.sqlite3")
+    cache = ResultCache(path=path)
+    cache.put("a", "v" * 100)
+    cache.put("a", "v" * 40)
+    assert cache.stats()["disk_bytes"] == 40
+
+
+def test_byte_total_is_seeded_for_existing_files(tmp_path):
+    path = str(tmp_path / "results.sqlite3")
+    with sqlite3.connect(path) as conn:
+        conn.execute(
+            "CREATE TABLE results (key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        conn.execute("INSERT INTO results VALUES ('old', 'value', 5, 0, 0)")
+    cache = ResultCache(path=path, ttl_seconds=10 ** 12)
+    assert cache.stats()["disk_bytes"] == 5
@@ -0,0 +1,100 @@
+import json
+import time
+import pytest
+from model_gateway import ModelGateway, RequestTemplate, text_part
+from resilience import CircuitBreaker, UpstreamGuard
+from schema_validation import InvalidModelResponse, Validator, close_truncated_json
+
+SCHEMA = {
+    "type": "object",
+    "properties": {
+        "summary": {
+            "type": "object",
+            "properties": {"score": {"type": "integer", "minimum": 0, "maximum": 100}},
+            "required": ["score"],
+        },
+        "phrases": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"text": {"type": "string"}, "start": {"type": "number"}},
+                "required": ["text", "start"],
+            },
+        },
+    },
+    "required": ["summary", "phrases"],
+}
+
+
+class ScriptedBackend:
+    """Answers each call with the next of a list of response texts."""
+
+    name = "scripted"
+    available = True
+    client_created = False
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.templates = []
+
+    def warm_up(self):
+        pass
+
+    def generate(self, template, contents):
+        self.templates.append(template.name)
+        return self.responses.pop(0)
+
+
+def gateway_for(responses):
+    backend = ScriptedBackend(responses)
+    gateway = ModelGateway(backend, UpstreamGuard(CircuitBreaker(), retries=0, hedge_percentile=0))
+    gateway.register(RequestTemplate("analysis", "test-model", SCHEMA, 0))
+    return gateway, backend
+
+
+def test_close_truncated_json_keeps_complete_items():
+    text = '{"phrases": [{"text": "holla", "start": 0.5}, {"text": "hol'
+    # The cut-off item is left empty; the repair pass drops it
+    assert close_truncated_json(text) == {"phrases": [{"text": "holla", "start": 0.5}, {}]}
+    assert close_truncated_json('{"summary": {"score": 8') == {"summary": {"score": 8}}
+    assert close_truncated_json("not json") is None
+
+
+def test_parse_repairs_truncated_response():
+    text = '```json\n{"summary": {"score": 80}, "phrases": [{"text": "ho", "start": 1}, {"text": "la'
+    value, report = Validator(SCHEMA).parse(text)
+    assert value == {"summary": {"score": 80}, "phrases": [{"text": "ho", "start": 1}]}
+    assert report.repairs and not report.missing
+
+
+def test_repair_drops_invalid_items_and_reports_missing_sections():
+    value, report = Validator(SCHEMA).parse(json.dumps({
+        "phrases": [{"text": "ho", "start": 1}, {"text": "no start"}],
+    }))
+    assert value["phrases"] == [{"text": "ho", "start": 1}]
+    assert report.missing == [("summary",)]
+
+
+def test_valid_response_needs_one_call():
+    answer = json.dumps({"summary": {"score": 90}, "phrases": []})
+    gateway, backend = gateway_for([answer])
+    assert json.loads(gateway.generate_validated("analysis", [text_part("go")])) == json.loads(answer)
+    assert backend.templates == ["analysis"]
+
+
+def test_missing_section_is_reasked_on_its_own():
+    gateway, backend = gateway_for([
+        '{"phrases": [{"text": "ho", "start": 1}]',
+        '{"summary": {"score": 75}}',
+    ])
+    result = json.loads(gateway.generate_validated("analysis", [text_part("go")], deadline=time.monotonic() + 5))
+    assert result == {"summary": {"score": 75}, "phrases": [{"text": "ho", "start": 1}]}
+    assert backend.templates == ["analysis", "analysis_reask"]
+    assert gateway.stats()["templates"]["analysis"]["responses"] == {"reasked": 1}
+
+
+def test_missing_section_fails_without_reask():
+    gateway, backend = gateway_for(['{"phrases": []}'])
+    with pytest.raises(InvalidModelResponse, match="summary"):
+        gateway.generate_validated("analysis", [text_part("go")], reask=False)
+    assert backend.templates == ["analysis"]
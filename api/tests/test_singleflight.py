@@ -0,0 +1,127 @@
+import asyncio
+import threading
+import pytest
+from singleflight import SingleFlight
+
+
+def wait_for_waiters(flight, key, count):
+    """Blocks until count callers are waiting on the in-flight call for key."""
+    while True:
+        with flight._lock:
+            call = flight._calls.get(key)
+            if call is not None and call.waiters >= count:
+                return
+        threading.Event().wait(0.001)
+
+
+def test_concurrent_calls_share_one_result():
+    flight = SingleFlight()
+    release = threading.Event()
+    runs = []
+
+    def work():
+        runs.append(1)
+        release.wait(5)
+        return "result"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do("key", work))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    wait_for_waiters(flight, "key", 3)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(runs) == 1
+    assert sorted(results) == [("result", False)] + [("result", True)] * 3
+    assert flight.stats() == {"calls": 1, "coalesced": 3, "in_flight": 0}
+
+
+def test_waiters_get_the_leaders_exception():
+    flight = SingleFlight()
+    release = threading.Event()
+    errors = []
+
+    def work():
+        release.wait(5)
+        raise ValueError("upstream said no")
+
+    def caller():
+        try:
+            flight.do("key", work)
+        except ValueError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=caller) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    wait_for_waiters(flight, "key", 1)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(errors) == 2 and errors[0] is errors[1]
+
+
+def test_cancelled_leader_hands_over_and_follower_counts_once():
+    async def scenario():
+        flight = SingleFlight()
+        started = asyncio.Event()
+        runs = []
+
+        async def slow():
+            runs.append("leader")
+            started.set()
+            await asyncio.sleep(10)
+
+        async def fast():
+            runs.append("follower")
+            return "result"
+
+        leader = asyncio.ensure_future(flight.ado("key", slow))
+        await started.wait()
+        follower = asyncio.ensure_future(flight.ado("key", fast))
+        await asyncio.sleep(0)
+        leader.cancel()
+
+        # The follower doesn't share the cancelled call; it runs the function itself
+        assert await follower == ("result", False)
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        assert runs == ["leader", "follower"]
+        assert flight.stats() == {"calls": 2, "coalesced": 0, "in_flight": 0}
+
+    asyncio.run(scenario())
+
+
+def test_rejoining_follower_is_counted_once():
+    async def scenario():
+        flight = SingleFlight()
+        first_started, second_started = asyncio.Event(), asyncio.Event()
+        release = asyncio.Event()
+
+        async def abandoned():
+            first_started.set()
+            await asyncio.sleep(10)
+
+        async def replacement():
+            second_started.set()
+            await release.wait()
+            return "result"
+
+        leader = asyncio.ensure_future(flight.ado("key", abandoned))
+        await first_started.wait()
+        taker = asyncio.ensure_future(flight.ado("key", replacement))
+        follower = asyncio.ensure_future(flight.ado("key", replacement))
+        await asyncio.sleep(0)
+        leader.cancel()
+        # One of the two waiters takes over; the other joins it after joining the abandoned call
+        await second_started.wait()
+        release.set()
+
+        results = sorted([await taker, await follower])
+        assert results == [("result", False), ("result", True)]
+        assert flight.stats() == {"calls": 2, "coalesced": 1, "in_flight": 0}
+
+    asyncio.run(scenario())
@@ -0,0 +1,75 @@
+import re
+
+TIMESTAMP_PATTERN = re.compile(r"^(\d+):(\d{2}(?:\.\d+)?)$")
+RANGE_PATTERN = re.compile(r"^(\d{2}):(\d{2})-(\d{2}):(\d{2})$")
+
+
+def parse_timestamp(value):
+    """Parses an "MM:SS.s" timestamp into seconds; returns None if it doesn't match."""
+    match = TIMESTAMP_PATTERN.match(str(value).strip())
+    if not match:
+        return None
+    return int(match.group(1)) * 60 + float(match.group(2))
+
+
+def format_timestamp(seconds):
+    """Formats seconds as "MM:SS.sss", the format used throughout the analysis schema."""
+    minutes, secs = divmod(max(seconds, 0.0), 60.0)
+    return f"{int(minutes):02d}:{secs:06.3f}"
+
+
+def shift_timestamp(value, offset_seconds):
+    seconds = parse_timestamp(value)
+    if seconds is None:
+        return value
+    return format_timestamp(seconds + offset_seconds)
+
+
+def shift_source_range(value, offset_seconds):
+    """Shifts an "MM:SS-MM:SS" source range; returns value unchanged if it doesn't match."""
+    match = RANGE_PATTERN.match(str(value).strip())
+    if not match:
+        return value
+    return format_source_range(
+        int(match.group(1)) * 60 + int(match.group(2)) + offset_seconds,
+        int(match.group(3)) * 60 + int(match.group(4)) + offset_seconds,
+    )
+
+
+def format_source_range(start_seconds, end_seconds):
+    """Formats a whole-second "MM:SS-MM:SS" range, as used by "video / audioSource"."""
+    start = int(start_seconds)
+    end = int(round(end_seconds))
+    return f"{start // 60:02d}:{start % 60:02d}-{end // 60:02d}:{end % 60:02d}"
+
+
+def shift_analysis_timestamps(analysis, offset_seconds):
+    """
+    Adds offset_seconds to every time in a yodelAnalysis result, in place.
+
+    Used when the model analyzed a clip that starts offset_seconds into the
+    original recording (after silence trimming or chunking).
+    """
+    root = analysis.get("yodelAnalysis") if isinstance(analysis, dict) else None
+    if not isinstance(root, dict) or not offset_seconds:
+        return analysis
+
+    if "video / audioSource" in root:
+        root["video / audioSource"] = shift_source_range(root["video / audioSource"], offset_seconds)
+
+    for phrase in root.get("phrases") or []:
+        shift_phrase_timestamps(phrase, offset_seconds)
+    return analysis
+
+
+def shift_phrase_timestamps(phrase, offset_seconds):
+    """Adds offset_seconds to the start/end and event times of a single phrase, in place."""
+    if not isinstance(phrase, dict) or not offset_seconds:
+        return phrase
+    for key in ("startTime", "endTime"):
+        if key in phrase:
+            phrase[key] = shift_timestamp(phrase[key], offset_seconds)
+    for event in phrase.get("events") or []:
+        if isinstance(event, dict) and "timestamp" in event:
+            event["timestamp"] = shift_timestamp(event["timestamp"], offset_seconds)
+    return phrase
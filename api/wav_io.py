@@ -0,0 +1,133 @@
+import struct
+import numpy as np
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+class WavFormatError(ValueError):
+    """Raised when audio bytes are not a WAV file this module can decode."""
+
+
+class WavInfo:
+    """Header fields of a parsed WAV file plus the location of its sample data."""
+
+    def __init__(self, format_tag, channels, sample_rate, bits_per_sample, data_offset, data_size):
+        self.format_tag = format_tag
+        self.channels = channels
+        self.sample_rate = sample_rate
+        self.bits_per_sample = bits_per_sample
+        self.data_offset = data_offset
+        self.data_size = data_size
+
+    @property
+    def frame_size(self):
+        return self.channels * self.bits_per_sample // 8
+
+    @property
+    def frames(self):
+        return self.data_size // self.frame_size
+
+    @property
+    def duration_seconds(self):
+        return self.frames / self.sample_rate
+
+
+def is_wav(data):
+    """True if data starts with a RIFF/WAVE header."""
+    return len(data) >= 12 and data[:4] == b"RIFF" and data[8:12] == b"WAVE"
+
+
+def parse_wav_header(data):
+    """
+    Walks the RIFF chunks of a WAV file and returns its WavInfo without
+    touching the sample data.
+
+    Raises:
+        WavFormatError: If the header is malformed or the encoding is unsupported
+    """
+    if not is_wav(data):
+        raise WavFormatError("Not a RIFF/WAVE file")
+
+    fmt = None
+    offset = 12
+    while offset + 8 <= len(data):
+        chunk_id, chunk_size = struct.unpack_from("<4sI", data, offset)
+        body = offset + 8
+
+        if chunk_id == b"fmt ":
+            if chunk_size < 16 or body + 16 > len(data):
+                raise WavFormatError("Truncated fmt chunk")
+            format_tag, channels, sample_rate, _, _, bits = struct.unpack_from("<HHIIHH", data, body)
+            if format_tag == WAVE_FORMAT_EXTENSIBLE and chunk_size >= 40:
+                # The real format tag is the first two bytes of the SubFormat GUID
+                format_tag = struct.unpack_from("<H", data, body + 24)[0]
+            fmt = (format_tag, channels, sample_rate, bits)
+
+        elif chunk_id == b"data":
+            if fmt is None:
+                raise WavFormatError("data chunk before fmt chunk")
+            format_tag, channels, sample_rate, bits = fmt
+            if format_tag not in (WAVE_FORMAT_PCM, WAVE_FORMAT_IEEE_FLOAT):
+                raise WavFormatError(f"Unsupported WAV encoding 0x{format_tag:04x}")
+            if channels < 1 or sample_rate < 1 or bits not in (8, 16, 24, 32, 64):
+                raise WavFormatError(f"Unsupported WAV layout: {channels} ch, {sample_rate} Hz, {bits} bit")
+            # Streaming recorders often leave the size as 0 or 0xFFFFFFFF; trust the file length then
+            data_size = chunk_size
+            if data_size == 0 or body + data_size > len(data):
+                data_size = len(data) - body
+            data_size -= data_size % (channels * bits // 8)
+            return WavInfo(format_tag, channels, sample_rate, bits, body, data_size)
+
+        offset = body + chunk_size + (chunk_size & 1)
+
+    raise WavFormatError("No data chunk found" if fmt else "No fmt chunk found")
+
+
+def decode_wav(data, mono=True):
+    """
+    Decodes WAV bytes into float32 samples in [-1, 1].
+
+    Returns:
+        A (samples, sample_rate) tuple; samples has shape (frames,) when mono is
+        True, otherwise (frames, channels)
+    """
+    info = parse_wav_header(data)
+    raw = memoryview(data)[info.data_offset:info.data_offset + info.data_size]
+    bits = info.bits_per_sample
+
+    if info.format_tag == WAVE_FORMAT_IEEE_FLOAT:
+        if bits not in (32, 64):
+            raise WavFormatError(f"Unsupported float WAV depth: {bits} bit")
+        samples = np.frombuffer(raw, dtype="<f4" if bits == 32 else "<f8").astype(np.float32)
+    elif bits == 8:
+        samples = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    elif bits == 16:
+        samples = np.frombuffer(raw, dtype="<i2").astype(np.float32) / 32768.0
+    elif bits == 24:
+        triplets = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        ints = triplets[:, 0] | (triplets[:, 1] << 8) | (triplets[:, 2] << 16)
+        ints = np.where(ints & 0x800000, ints - 0x1000000, ints)
+        samples = ints.astype(np.float32) / 8388608.0
+    elif bits == 32:
+        samples = np.frombuffer(raw, dtype="<i4").astype(np.float32) / 2147483648.0
+    else:
+        raise WavFormatError(f"Unsupported PCM depth: {bits} bit")
+
+    samples = samples.reshape(-1, info.channels)
+    if mono:
+        samples = samples.mean(axis=1) if info.channels > 1 else samples[:, 0]
+    return samples, info.sample_rate
+
+
+def encode_wav(samples, sample_rate):
+    """Encodes mono float samples in [-1, 1] as 16-bit PCM WAV bytes."""
+    pcm = (np.clip(samples, -1.0, 1.0) * 32767.0).astype("<i2").tobytes()
+    header = struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", 36 + len(pcm), b"WAVE",
+        b"fmt ", 16, WAVE_FORMAT_PCM, 1, sample_rate, sample_rate * 2, 2, 16,
+        b"data", len(pcm),
+    )
+    return header + pcm
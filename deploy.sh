@@ -133,6 +133,7 @@ gcloud run deploy $SERVICE_NAME \
     --allow-unauthenticated \
     --memory $MEMORY \
     --cpu $CPU \
+    --cpu-boost \
     --max-instances $MAX_INSTANCES \
     --min-instances $MIN_INSTANCES \
     --port $PORT \
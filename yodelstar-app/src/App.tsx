@@ -84,11 +84,11 @@ function App() {
 
   // Use performance history hook
   const {
+    userId,
     currentResult,
     isVisible: showResults,
     addPerformanceResult,
     getPerformanceStats,
-    getRecentResults,
     hideResults,
   } = usePerformanceHistory();
 
@@ -189,25 +189,8 @@ function App() {
     loadStepData();
   }, [selectedStep]);
 
-  // Function to convert audio blob to base64
-  const blobToBase64 = (blob: Blob): Promise<string> => {
-    return new Promise((resolve, reject) => {
-      const reader = new FileReader();
-      reader.onload = () => {
-        const result = reader.result as string;
-        // Remove the data URL prefix to get just the base64 string
-        const base64 = result.split(",")[1];
-        resolve(base64);
-      };
-      reader.onerror = reject;
-      reader.readAsDataURL(blob);
-    });
-  };
-
-  // Function to fetch original audio as base64
-  const fetchOriginalAudioAsBase64 = async (
-    audioPath: string
-  ): Promise<string> => {
+  // Function to fetch the original audio as a blob
+  const fetchOriginalAudio = async (audioPath: string): Promise<Blob> => {
     console.log("🔄 Fetching original audio from:", audioPath);
     const response = await fetch(audioPath);
     console.log("📡 Original audio fetch response:", {
@@ -229,7 +212,7 @@ function App() {
       type: blob.type,
     });
 
-    return await blobToBase64(blob);
+    return blob;
   };
 
   // Helper function to create a fetch request with timeout
@@ -296,59 +279,6 @@ function App() {
     setComparisonError(null);
 
     try {
-      console.log("🔄 Converting user audio to base64...");
-      const userAudioBase64 = await blobToBase64(userAudioBlob);
-      console.log("✅ User audio converted:", {
-        base64Length: userAudioBase64.length,
-        sizeEstimate: `${Math.round(userAudioBase64.length * 0.75)} bytes`,
-      });
-
-      console.log("🔄 Fetching original audio...", audioUrl);
-      const originalAudioBase64 = await fetchOriginalAudioAsBase64(audioUrl);
-      console.log("✅ Original audio fetched:", {
-        base64Length: originalAudioBase64.length,
-        sizeEstimate: `${Math.round(originalAudioBase64.length * 0.75)} bytes`,
-      });
-
-      // Prepare past performances data for enhanced feedback
-      const recentPerformances = getRecentResults(10); // Get last 10 performances
-      const pastPerformances = recentPerformances.map((record) => ({
-        yodelComparison: {
-          overallScore: record.data.overallScore,
-          metrics: {
-            pitchAccuracy: {
-              score: record.data.pitchAccuracy.score,
-              averageDeviationCents: record.data.pitchAccuracy.deviation,
-              description: record.data.pitchAccuracy.description,
-            },
-            timingAccuracy: {
-              score: record.data.timingAccuracy.score,
-              averageDeviationMs: record.data.timingAccuracy.deviation,
-              description: record.data.timingAccuracy.description,
-            },
-            yodelBreakQuality: {
-              score: 85, // Default value since we don't have this in our current data structure
-              smoothnessRating: "good" as const,
-              description: "Yodel break quality assessment",
-            },
-            syllableAccuracy: {
-              score: record.data.syllableAccuracy.score,
-              matchedSyllables: record.data.syllableAccuracy.matchedSyllables,
-              totalSyllables: record.data.syllableAccuracy.totalSyllables,
-              description: record.data.syllableAccuracy.description,
-            },
-            rhythmConsistency: {
-              score: record.data.rhythmConsistency.score,
-              tempoVariation: record.data.rhythmConsistency.tempoVariation,
-              description: record.data.rhythmConsistency.description,
-            },
-          },
-          feedback: record.data.feedback,
-        },
-        timestamp: record.timestamp,
-        songTitle: record.songTitle,
-      }));
-
       // Prepare user info based on performance stats
       const performanceStats = getPerformanceStats();
       const userInfo = {
@@ -378,30 +308,45 @@ function App() {
       };
 
       console.log("📈 Including performance context:", {
-        pastPerformancesCount: pastPerformances.length,
+        userId,
         userExperienceLevel: userInfo.experience_level,
         totalAttempts: performanceStats?.totalAttempts || 0,
       });
 
-      const requestPayload = {
-        original_wav_base64: originalAudioBase64,
-        user_wav_base64: userAudioBase64,
-        past_performances:
-          pastPerformances.length > 0 ? pastPerformances : undefined,
-        user_info: userInfo,
+      // The audio is uploaded as binary multipart parts rather than base64 JSON.
+      // The server resolves the reference track by step id, so the original
+      // audio is only uploaded if the server doesn't know this step.
+      const buildFormData = (originalAudio?: Blob): FormData => {
+        const formData = new FormData();
+        formData.append("user_wav", userAudioBlob, "user.wav");
+        if (originalAudio) {
+          formData.append("original_wav", originalAudio, "original.wav");
+        } else {
+          formData.append("reference_id", String(selectedStep));
+        }
+        // Past performances are kept server-side under this id
+        formData.append("user_id", userId);
+        formData.append("user_info", JSON.stringify(userInfo));
+        return formData;
       };
 
       // Call the API with retry mechanism and extended timeout
       console.log("🚀 Calling compare-yodel API with retry mechanism...");
       const comparisonResult: YodelComparisonData = await retryWithBackoff(async () => {
-        const response = await fetchWithTimeout("/compare-yodel", {
+        let response = await fetchWithTimeout("/compare-yodel", {
           method: "POST",
-          headers: {
-            "Content-Type": "application/json",
-          },
-          body: JSON.stringify(requestPayload),
+          body: buildFormData(),
         }, 120000); // 2 minute timeout
 
+        if (response.status === 404) {
+          console.log("🔄 Reference not registered on server, uploading original audio...", audioUrl);
+          const originalAudio = await fetchOriginalAudio(audioUrl);
+          response = await fetchWithTimeout("/compare-yodel", {
+            method: "POST",
+            body: buildFormData(originalAudio),
+          }, 120000);
+        }
+
         console.log("📡 API Response:", {
           status: response.status,
           statusText: response.statusText,
@@ -55,6 +55,16 @@ export const usePerformanceHistory = () => {
   const [history, setHistory] = useState<PerformanceRecord[]>([]);
   const [currentResult, setCurrentResult] = useState<YodelComparisonData | null>(null);
   const [isVisible, setIsVisible] = useState(false);
+  // Stable per-browser id; the server keeps this singer's history under it
+  const [userId] = useState<string>(() => {
+    const savedId = localStorage.getItem('yodel-user-id');
+    if (savedId) return savedId;
+    const newId = typeof crypto !== 'undefined' && 'randomUUID' in crypto
+      ? crypto.randomUUID()
+      : `user-${Date.now()}-${Math.random().toString(36).substr(2, 9)}`;
+    localStorage.setItem('yodel-user-id', newId);
+    return newId;
+  });
 
   // Load history from localStorage on mount
   useEffect(() => {
@@ -147,6 +157,7 @@ export const usePerformanceHistory = () => {
   }, [history]);
 
   return {
+    userId,
     history,
     currentResult,
     isVisible,